@@ -0,0 +1,257 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+
+from quart import Quart, Response, render_template, request, jsonify, session, redirect, url_for, g, current_app, send_file
+from quart.signals import before_render_template, template_rendered
+
+from page_cache import PageCache
+from bundles import bundles
+from shop import Shop, Render, Redirect, Json, Body, default_config
+import supabase_client  # also loads .env
+
+# Handlers block on Supabase, so each in-flight request holds a thread
+HANDLER_THREADS = int(os.getenv("HANDLER_THREADS", "64"))
+
+# Routes are collected here and registered on each app by create_asgi_app
+routes = []
+shop = Shop(current_app, request, session, g)
+
+
+def route(rule, **options):
+    def decorator(view):
+        routes.append((rule, view, options))
+        return view
+    return decorator
+
+
+def create_asgi_app(config=None):
+    """
+    Builds the ASGI (Quart) app: same templates, endpoints, session
+    cookie, cart store and job queue as main.create_app, and the same
+    request logic (shop.py). The event loop only handles connections;
+    each handler runs on one of HANDLER_THREADS threads, so one worker
+    can keep that many checkouts waiting on Supabase at once.
+
+        hypercorn asgi:app --workers 2
+
+    Config keys are the ones main.create_app takes, plus
+    HANDLER_THREADS. Responses are not compressed here (Flask-Compress
+    is Flask only), except the cached home page: leave the rest to the
+    proxy in front.
+    """
+    app = Quart(__name__)
+    app.config.update(default_config(), HANDLER_THREADS=HANDLER_THREADS)
+    app.config.update(config or {})
+
+    if app.config["SUPABASE_CLIENT"] is not None:
+        supabase_client.use_client(app.config["SUPABASE_CLIENT"])
+
+    app.extensions["page_cache"] = PageCache()
+    app.jinja_env.globals["asset_url"] = bundles.url
+
+    for rule, view, options in routes:
+        app.add_url_rule(rule, view_func=view, **options)
+
+    app.before_serving(start_handler_threads)
+    app.before_request(start_request)
+    app.before_request(start_background_work)
+    app.after_request(add_server_timing)
+    app.teardown_request(record_request)
+    before_render_template.connect(start_render, app)
+    template_rendered.connect(end_render, app)
+    app.context_processor(cart_badge)
+
+    if app.config["PRELOAD_TEMPLATES"]:
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+
+    return app
+
+
+async def start_handler_threads():
+    # asyncio.to_thread runs on the loop's default executor
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(current_app.config["HANDLER_THREADS"], thread_name_prefix="handler")
+    )
+
+
+# Hooks are coroutines: Quart runs sync ones on a thread of its own, where
+# the span list begin_request sets would not be visible
+
+async def start_request():
+    shop.start_request()
+
+
+async def start_background_work():
+    shop.start_background_work()
+
+
+async def add_server_timing(response):
+    return shop.add_server_timing(response)
+
+
+async def record_request(error=None):
+    shop.record_request(error)
+
+
+async def start_render(sender, template, context, **extra):
+    shop.start_render(sender, template, context, **extra)
+
+
+async def end_render(sender, template, context, **extra):
+    shop.end_render(sender, template, context, **extra)
+
+
+async def cart_badge():
+    return shop.cart_badge()
+
+
+async def respond(handler, *args):
+    """
+    Runs a Shop handler on a thread and turns its result into a Quart
+    response. The thread gets a copy of this request's context, so the
+    request, session and g proxies and its span list work there too.
+    """
+    return await make_response(await asyncio.to_thread(handler, *args))
+
+
+async def make_response(result):
+    if isinstance(result, Redirect):
+        return redirect(result.url or url_for(result.endpoint))
+
+    if isinstance(result, Render):
+        html = await render_template(result.template, **result.context)
+        if result.then is not None:
+            return await make_response(result.then(html))
+        response = await current_app.make_response(html)
+    elif isinstance(result, Json):
+        response = jsonify(result.body)
+        response.status_code = result.status
+    elif isinstance(result, Body):
+        response = Response(result.content, status=result.status, mimetype=result.mimetype)
+    else:
+        response = await send_file(result.path, mimetype=result.mimetype)
+        response.cache_control.max_age = result.max_age
+        response.cache_control.public = True
+        if result.immutable:
+            response.cache_control.immutable = True
+
+    response.headers.update(result.headers)
+    return response
+
+
+@route('/')
+async def home():
+    return await respond(shop.home)
+
+
+@route("/api/products")
+async def api_products():
+    return await respond(shop.api_products)
+
+
+@route("/search")
+async def search():
+    return await respond(shop.search)
+
+
+@route("/add-to-cart", methods=["POST"])
+async def add_to_cart():
+    return await respond(shop.add_to_cart, await request.get_json())
+
+
+@route("/checkout")
+async def checkout():
+    return await respond(shop.checkout_page)
+
+
+@route("/update-quantity", methods=["POST"])
+async def update_quantity():
+    return await respond(shop.update_quantity, await request.get_json())
+
+
+@route("/remove-from-cart", methods=["POST"])
+async def remove_from_cart():
+    return await respond(shop.remove_from_cart, await request.get_json())
+
+
+@route("/cart/batch", methods=["POST"])
+async def cart_batch():
+    return await respond(shop.cart_batch, await request.get_json(silent=True))
+
+
+@route("/customer", methods=["GET", "POST"])
+async def customer():
+    if request.method == "GET":
+        return await respond(shop.customer_form)
+    return await respond(shop.create_customer, await request.form)
+
+
+@route("/pay-now", methods=["POST"])
+async def pay_now():
+    return await respond(shop.pay_now, await request.form)
+
+
+@route("/payout")
+async def payout():
+    return await respond(shop.payout)
+
+
+@route("/orders/<order_id>/status")
+async def order_status(order_id):
+    return await respond(shop.order_status, order_id)
+
+
+@route("/admin/catalog/invalidate", methods=["POST"])
+async def invalidate_catalog():
+    return await respond(shop.invalidate_catalog)
+
+
+@route("/admin/products/<product_id>/images", methods=["POST"])
+async def refresh_product_images(product_id):
+    return await respond(shop.refresh_product_images, product_id)
+
+
+@route("/admin/catalog/stats")
+async def catalog_stats():
+    return await respond(shop.catalog_stats)
+
+
+@route("/admin/supabase/stats")
+async def supabase_stats():
+    return await respond(shop.supabase_stats)
+
+
+@route("/metrics")
+async def prometheus_metrics():
+    return await respond(shop.prometheus_metrics)
+
+
+@route("/img/<fmt>/<int:width>/<path:source>")
+async def image_derivative(fmt, width, source):
+    return await respond(shop.image_derivative, fmt, width, source)
+
+
+@route("/assets/<path:file_name>")
+async def asset(file_name):
+    return await respond(shop.asset, file_name)
+
+
+@route('/paid')
+async def paid():
+    return await respond(shop.page, 'paid.html')
+
+
+@route('/reviews')
+async def reviews():
+    return await respond(shop.page, 'index.html')
+
+
+@route('/contact')
+async def contact():
+    return await respond(shop.page, 'contact.html')
+
+
+
+app = create_asgi_app()
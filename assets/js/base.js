@@ -0,0 +1,83 @@
+function toggleMenu() {
+    const nav = document.querySelector(".mobile-nav");
+    const overlay = document.querySelector(".nav-overlay");
+
+    nav.classList.toggle("active");
+    overlay.classList.toggle("active");
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+
+    document.addEventListener("click", async (e) => {
+        const button = e.target.closest(".buy-now-btn");
+        if (!button) return;
+
+        e.preventDefault();
+        e.stopPropagation();
+
+        // Prevent double click
+        if (button.dataset.loading === "1") return;
+        button.dataset.loading = "1";
+
+        const originalText = button.textContent;
+        button.disabled = true;
+        button.textContent = "Adding...";
+
+        /* Price, name and image are looked up server-side */
+        const product = {
+            id: button.dataset.id
+        };
+
+        try {
+            const response = await fetch("/add-to-cart", {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify(product)
+            });
+
+            const contentType = response.headers.get("content-type") || "";
+            let data = {};
+
+            if (contentType.includes("application/json")) {
+                data = await response.json();
+            } else {
+                data.success = response.ok;
+            }
+
+            if (!response.ok || data.success === false) {
+                const error = new Error(data.message || "Add to cart failed");
+                error.serverMessage = data.message;
+                throw error;
+            }
+
+            /* Update cart count */
+            const cartCount = document.querySelector(".cart-count");
+            if (cartCount && data.number_of_items !== undefined) {
+                cartCount.textContent = data.number_of_items;
+                cartCount.style.display = "inline-block";
+            }
+
+            /* Update cart total */
+            const cartTotal = document.querySelector(".cart-total");
+            if (cartTotal && data.accumulated_total !== undefined) {
+                cartTotal.textContent =
+                    "ZMW " + Number(data.accumulated_total).toFixed(2);
+            }
+
+            /* Visual feedback */
+            button.textContent = "Added ✓";
+            setTimeout(() => {
+                button.textContent = originalText;
+            }, 1200);
+
+        } catch (error) {
+            console.error("Error adding to cart:", error);
+            /* The server's reason (e.g. "Sold out") is not fixed by retrying */
+            alert(error.serverMessage || "Failed to add item to cart. Please try again.");
+        } finally {
+            button.dataset.loading = "0";
+            button.disabled = false;
+        }
+    });
+
+});
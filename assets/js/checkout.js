@@ -0,0 +1,217 @@
+/* =====================================================
+   CHECKOUT INTERACTIONS
+   - Remove item
+   - Update quantity (+ / − / input)
+
+   Changes are queued and sent together to /cart/batch:
+   quantity clicks wait for a short pause, removals go
+   out straight away, and only one request is in flight.
+===================================================== */
+
+const BATCH_DELAY = 400;
+
+/* productId -> latest operation for that product */
+const pendingOps = new Map();
+let flushTimer = null;
+let inFlight = null;
+
+document.addEventListener("click", (e) => {
+
+    /* ===============================
+       REMOVE ITEM (X BUTTON)
+    ================================ */
+    const removeBtn = e.target.closest(".remove-item");
+    if (removeBtn) {
+        e.preventDefault();
+
+        const productId = removeBtn.dataset.productId;
+        if (!productId) return;
+
+        removeBtn.disabled = true;
+        queueOperation(productId, { op: "remove", product_id: productId });
+        flushNow();
+        return;
+    }
+
+    /* ===============================
+       QUANTITY BUTTONS (+ / −)
+    ================================ */
+    const qtyBtn = e.target.closest(".qty-btn");
+    if (qtyBtn) {
+        const cartItem = qtyBtn.closest(".cart-item");
+        const input = cartItem.querySelector(".qty-input");
+
+        let quantity = parseInt(input.value, 10) || 1;
+
+        if (qtyBtn.textContent.trim() === "−") {
+            quantity = Math.max(1, quantity - 1);
+        } else {
+            quantity += 1;
+        }
+
+        input.value = quantity;
+        queueQuantity(input.dataset.productId, quantity);
+    }
+});
+
+/* ===============================
+   MANUAL QUANTITY INPUT
+================================ */
+document.addEventListener("change", (e) => {
+    const input = e.target.closest(".qty-input");
+    if (!input) return;
+
+    let quantity = parseInt(input.value, 10);
+
+    if (!quantity || quantity < 1) {
+        quantity = 1;
+        input.value = 1;
+    }
+
+    queueQuantity(input.dataset.productId, quantity);
+});
+
+/* ===============================
+   PAY NOW: send pending changes first
+================================ */
+document.addEventListener("submit", async (e) => {
+    const form = e.target;
+    if (!pendingOps.size && !inFlight) return;
+
+    e.preventDefault();
+    await flushNow();
+    await inFlight;
+    form.submit();
+});
+
+/* Leaving the page with unsent changes */
+window.addEventListener("pagehide", () => {
+    if (!pendingOps.size) return;
+
+    const body = JSON.stringify({ operations: takeOperations() });
+    navigator.sendBeacon("/cart/batch", new Blob([body], { type: "application/json" }));
+});
+
+/* ===============================
+   QUEUE + BATCH
+================================ */
+function queueQuantity(productId, quantity) {
+    const pending = pendingOps.get(productId);
+    if (pending && pending.op === "remove") return;
+
+    queueOperation(productId, { op: "update", product_id: productId, quantity: quantity });
+
+    clearTimeout(flushTimer);
+    flushTimer = setTimeout(flushNow, BATCH_DELAY);
+}
+
+function queueOperation(productId, operation) {
+    /* Re-inserted so operations keep the order of the last click */
+    pendingOps.delete(productId);
+    pendingOps.set(productId, operation);
+}
+
+function takeOperations() {
+    const operations = Array.from(pendingOps.values());
+    pendingOps.clear();
+    clearTimeout(flushTimer);
+    flushTimer = null;
+    return operations;
+}
+
+async function flushNow() {
+    /* One request at a time; whatever queues meanwhile goes next */
+    while (inFlight) {
+        await inFlight;
+    }
+    if (!pendingOps.size) return;
+
+    inFlight = sendBatch(takeOperations());
+    try {
+        await inFlight;
+    } finally {
+        inFlight = null;
+    }
+}
+
+async function sendBatch(operations) {
+    try {
+        const response = await fetch("/cart/batch", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ operations: operations })
+        });
+
+        const data = await response.json();
+
+        /* Success or not, the response says what the cart now holds */
+        if (data.quantities) {
+            syncCart(data);
+            updateSummary(data);
+        }
+
+        if (!data.success) {
+            /* e.g. "Only 2 available": the cart above already shows what was kept */
+            alert(data.message || "Failed to update your cart. Please try again.");
+        }
+
+    } catch (error) {
+        console.error("Cart update error:", error);
+        alert("Failed to update your cart. Please try again.");
+    }
+}
+
+/* ===============================
+   MATCH THE PAGE TO THE SERVER CART
+================================ */
+function syncCart(data) {
+    document.querySelectorAll(".cart-item").forEach((cartItem) => {
+        const removeBtn = cartItem.querySelector(".remove-item");
+        const productId = removeBtn.dataset.productId;
+        const quantity = data.quantities[productId];
+
+        if (quantity === undefined) {
+            cartItem.remove();
+            return;
+        }
+
+        removeBtn.disabled = false;
+
+        /* Leave inputs alone while newer clicks are still queued */
+        if (!pendingOps.has(productId)) {
+            cartItem.querySelector(".qty-input").value = quantity;
+        }
+    });
+
+    /* Empty cart state */
+    if (data.number_of_items === 0) {
+        document.querySelector(".cart-box").innerHTML =
+            "<p>Your cart is empty.</p>";
+    }
+}
+
+/* ===============================
+   UPDATE SUMMARY TOTALS
+================================ */
+function updateSummary(data) {
+
+    /* Item count */
+    const itemsLabel = document.querySelector(".summary-row span");
+    if (itemsLabel && data.number_of_items !== undefined) {
+        itemsLabel.textContent = `Items (${data.number_of_items})`;
+    }
+
+    /* Subtotal & total */
+    const subtotal = document.querySelector(".summary-subtotal");
+    const total = document.querySelector(".summary-total-amount");
+
+    if (subtotal) {
+        subtotal.textContent =
+            "ZMW " + Number(data.accumulated_total).toFixed(2);
+    }
+
+    if (total) {
+        total.textContent =
+            "ZMW " + Number(data.accumulated_total).toFixed(2);
+    }
+}
@@ -0,0 +1,125 @@
+let currentSlide = 0;
+const slides = document.querySelectorAll('.slide');
+const nextBtn = document.querySelector('.nav-arrow.next');
+const prevBtn = document.querySelector('.nav-arrow.prev');
+
+function showSlide(index) {
+    slides.forEach((slide, i) => {
+        slide.classList.toggle('active', i === index);
+    });
+}
+
+nextBtn.addEventListener('click', () => {
+    currentSlide = (currentSlide + 1) % slides.length;
+    showSlide(currentSlide);
+});
+
+prevBtn.addEventListener('click', () => {
+    currentSlide = (currentSlide - 1 + slides.length) % slides.length;
+    showSlide(currentSlide);
+});
+
+/* Auto slide (keeps attention, still user-controlled) */
+let autoSlide = setInterval(() => {
+    currentSlide = (currentSlide + 1) % slides.length;
+    showSlide(currentSlide);
+}, 6000);
+
+/* Pause auto-slide when user interacts */
+[nextBtn, prevBtn].forEach(btn => {
+    btn.addEventListener('click', () => {
+        clearInterval(autoSlide);
+        autoSlide = setInterval(() => {
+            currentSlide = (currentSlide + 1) % slides.length;
+            showSlide(currentSlide);
+        }, 6000);
+    });
+});
+
+
+/* ===============================
+   INFINITE SCROLL (catalog pages)
+   =============================== */
+const catalogMore = document.querySelector('.catalog-more');
+const productGrid = document.querySelector('.product-grid');
+const GRID_SIZES = '(max-width: 480px) 50vw, (max-width: 1024px) 33vw, 300px';
+
+function productCard(product) {
+    const card = document.createElement('div');
+    card.className = 'product-card';
+
+    const imageBox = document.createElement('div');
+    imageBox.className = 'product-image';
+    const picture = document.createElement('picture');
+
+    ((product.picture && product.picture.sources) || []).forEach(source => {
+        const el = document.createElement('source');
+        el.type = source.type;
+        el.srcset = source.srcset;
+        el.sizes = GRID_SIZES;
+        picture.appendChild(el);
+    });
+
+    const img = document.createElement('img');
+    img.src = product.image || '/static/images/product-placeholder.jpg';
+    img.alt = product.name || '';
+    img.loading = 'lazy';
+    picture.appendChild(img);
+    imageBox.appendChild(picture);
+
+    const info = document.createElement('div');
+    info.className = 'product-info';
+
+    const name = document.createElement('h3');
+    name.textContent = product.name || '';
+
+    const price = document.createElement('span');
+    price.className = 'price';
+    price.textContent = 'ZMW ' + Number(product.price || 0).toLocaleString('en-US', { maximumFractionDigits: 0 });
+
+    const button = document.createElement('button');
+    button.className = 'buy-btn buy-now-btn';
+    button.dataset.id = product.id;
+    button.dataset.name = product.name || '';
+    button.dataset.price = product.price;
+    button.dataset.image = product.image || '';
+    button.textContent = 'Add to Cart';
+
+    info.append(name, price, button);
+    card.append(imageBox, info);
+    return card;
+}
+
+if (catalogMore && productGrid && 'IntersectionObserver' in window) {
+    let loadingPage = false;
+
+    const observer = new IntersectionObserver(async (entries) => {
+        if (!entries[0].isIntersecting || loadingPage) return;
+        loadingPage = true;
+
+        try {
+            const cursor = catalogMore.dataset.nextCursor;
+            const response = await fetch('/api/products?cursor=' + encodeURIComponent(cursor));
+            if (!response.ok) throw new Error('HTTP ' + response.status);
+
+            const page = await response.json();
+            page.products.forEach(product => productGrid.appendChild(productCard(product)));
+
+            if (page.next_cursor) {
+                catalogMore.dataset.nextCursor = page.next_cursor;
+                // Re-observe so a sentinel still on screen loads the next page too
+                observer.unobserve(catalogMore);
+                observer.observe(catalogMore);
+            } else {
+                observer.disconnect();
+                catalogMore.remove();
+            }
+        } catch (error) {
+            console.error('Error loading products:', error);
+        } finally {
+            loadingPage = false;
+        }
+    }, { rootMargin: '600px 0px' });
+
+    observer.observe(catalogMore);
+}
@@ -0,0 +1,32 @@
+/* ===============================
+   POLL ORDER FINALISATION STATUS
+================================ */
+(function () {
+    const statusBox = document.querySelector(".order-status");
+    if (!statusBox) return;
+
+    async function poll() {
+        try {
+            const response = await fetch(statusBox.dataset.statusUrl);
+            const data = await response.json();
+
+            if (data.status === "done") {
+                statusBox.textContent = "Order confirmed ✓";
+                statusBox.classList.add("done");
+                return;
+            }
+
+            if (data.status === "failed") {
+                statusBox.textContent =
+                    "We are still processing your order. We will contact you shortly.";
+                return;
+            }
+        } catch (error) {
+            console.error("Order status error:", error);
+        }
+
+        setTimeout(poll, 2000);
+    }
+
+    poll();
+})();
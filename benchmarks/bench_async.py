@@ -0,0 +1,141 @@
+"""
+Concurrent checkouts: Flask app on a thread pool vs Quart app (one
+event loop handing requests to its HANDLER_THREADS handler threads),
+both against the stub backend.
+
+Each simulated shopper adds a product, looks themselves up on /pay-now
+and places the order on /payout: two backend round-trips per checkout.
+All shoppers arrive at once, so latency includes time spent waiting
+for a free thread.
+
+    python benchmarks/bench_async.py --shoppers 300 --threads 8 --handler-threads 64 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+# A catalog snapshot left by an earlier run (another catalog) must not be served
+os.environ.setdefault("CATALOG_SNAPSHOT_DIR", tempfile.mkdtemp(prefix="bench-catalog-"))
+# Nor may holds and carts left in the working directory
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="bench-data-"))
+
+import supabase_client  # noqa: E402
+from checkout import customer_cache  # noqa: E402
+from products import catalog_cache  # noqa: E402
+from stub_supabase import StubSupabase, make_catalog, make_customers  # noqa: E402
+
+CONFIG = {
+    "SECRET_KEY": "bench",
+    "CART_STORE": "memory",
+    "JOB_WORKER": False,
+    "INVENTORY_FLUSHER": False,
+    "TESTING": True
+}
+
+
+def seed(client, catalog, shoppers):
+    client.tables["products"] = catalog
+    make_customers(client, supabase_client.BUSINESS_ID, shoppers, phone)
+    client.tables["orders"] = []
+
+
+def phone(i):
+    return f"097{i:07d}"
+
+
+def report(label, elapsed, latencies, client):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{label:<24} {elapsed:7.2f} s  {len(latencies) / elapsed:7.1f} checkouts/s  "
+        f"p50 {p50 * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  "
+        f"{len(client.tables['orders'])} orders  {client.total_calls()} backend calls"
+    )
+    return elapsed
+
+
+def run_sync(args, catalog, jobs_path):
+    from main import create_app
+
+    client = StubSupabase(latency=args.latency)
+    seed(client, catalog, args.shoppers)
+    app = create_app({**CONFIG, "SUPABASE_CLIENT": client, "JOBS_DB_PATH": jobs_path})
+    product_id = catalog[0]["id"]
+
+    def shopper(i):
+        with app.test_client() as browser:
+            browser.post("/add-to-cart", json={"id": product_id})
+            browser.post("/pay-now", data={"phone": phone(i)})
+            response = browser.get("/payout")
+            assert response.status_code == 200, response.status_code
+        return time.perf_counter() - started
+
+    catalog_cache.get()
+    client.calls.clear()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        latencies = list(pool.map(shopper, range(args.shoppers)))
+    return report(f"sync ({args.threads} threads)", time.perf_counter() - started, latencies, client)
+
+
+async def run_async(args, catalog, jobs_path):
+    from asgi import create_asgi_app
+
+    client = StubSupabase(latency=args.latency)
+    seed(client, catalog, args.shoppers)
+    app = create_asgi_app({
+        **CONFIG, "SUPABASE_CLIENT": client, "JOBS_DB_PATH": jobs_path,
+        "HANDLER_THREADS": args.handler_threads
+    })
+    product_id = catalog[0]["id"]
+
+    async def shopper(i):
+        browser = app.test_client()
+        await browser.post("/add-to-cart", json={"id": product_id})
+        await browser.post("/pay-now", form={"phone": phone(i)})
+        response = await browser.get("/payout")
+        assert response.status_code == 200, response.status_code
+        return time.perf_counter() - started
+
+    client.calls.clear()
+
+    # Runs the startup hooks, which size the handler thread pool
+    async with app.test_app():
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(shopper(i) for i in range(args.shoppers)))
+    return report(f"asgi ({args.handler_threads} threads)", time.perf_counter() - started, latencies, client)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shoppers", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=8, help="Flask worker threads")
+    parser.add_argument("--handler-threads", type=int, default=64, help="Quart handler threads")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per stub call")
+    parser.add_argument("--products", type=int, default=50)
+    args = parser.parse_args()
+
+    # The catalog loader and product index use this client
+    catalog_client = StubSupabase()
+    catalog = make_catalog(catalog_client, supabase_client.BUSINESS_ID, args.products, with_manifest=True)
+    supabase_client.use_client(catalog_client)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sync = run_sync(args, catalog, os.path.join(tmp, "jobs-sync.sqlite3"))
+        customer_cache.clear()
+        concurrent = asyncio.run(run_async(args, catalog, os.path.join(tmp, "jobs-async.sqlite3")))
+
+    print(f"speedup: {sync / concurrent:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Catalog held per worker vs one shared, mmap'd snapshot per host.
+
+Forks --workers processes (like gunicorn) that each load the catalog
+and answer --lookups cart-style product lookups, then reports per
+worker the private memory the catalog added (Linux: Private_* from
+/proc/self/smaps_rollup), lookup time, and how many catalog loads
+reached the stub backend across all workers.
+
+    python benchmarks/bench_catalog_store.py --products 20000 --workers 4
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+
+import supabase_client  # noqa: E402
+from catalog_store import SharedCatalogCache  # noqa: E402
+from products import CatalogCache, ProductIndex, Products  # noqa: E402
+from stub_supabase import StubSupabase, make_catalog  # noqa: E402
+
+
+def private_kib():
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f if line.startswith("Private_"))
+    except OSError:
+        return None
+    return sum(int(value.split()[0]) for value in fields.values())
+
+
+def worker(kind, client, path, ids, lookups, results):
+    loads_before = client.calls.get("table.products.select", 0)
+    loader = lambda: Products(client=client)._fetch_products()  # noqa: E731
+
+    if kind == "shared":
+        cache = SharedCatalogCache(loader, path, ttl=300, max_age=86400, retry_delay=10)
+    else:
+        cache = CatalogCache(loader)
+    index = ProductIndex(cache)
+
+    before = private_kib()
+    started = time.perf_counter()
+    cache.get()
+    load_seconds = time.perf_counter() - started
+
+    rng = random.Random(os.getpid())
+    started = time.perf_counter()
+    for _ in range(lookups):
+        assert index.get(rng.choice(ids)) is not None
+    lookup_seconds = time.perf_counter() - started
+
+    after = private_kib()
+    results.put({
+        "private_kib": (after - before) if before is not None else None,
+        "load_seconds": load_seconds,
+        "lookup_us": lookup_seconds / lookups * 1e6,
+        "loads": client.calls.get("table.products.select", 0) - loads_before
+    })
+
+
+def run(kind, client, ids, args):
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalog.bin")
+        processes = [
+            context.Process(target=worker, args=(kind, client, path, ids, args.lookups, results))
+            for _ in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        stats = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    # The worker that loaded the catalog also held it while encoding
+    memory = sorted(s["private_kib"] / 1024 for s in stats if s["private_kib"] is not None) or [math.nan]
+    print(
+        f"{kind:<7} {args.workers} workers  "
+        f"private memory/worker {memory[0]:6.1f}-{memory[-1]:6.1f} MiB  "
+        f"first get {max(s['load_seconds'] for s in stats) * 1000:8.1f} ms  "
+        f"lookup {sum(s['lookup_us'] for s in stats) / len(stats):5.1f} us  "
+        f"{sum(s['loads'] for s in stats)} catalog loads"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per stub call")
+    args = parser.parse_args()
+
+    client = StubSupabase(latency=args.latency)
+    # Image names on the rows, so a load is one query rather than a listing per product
+    catalog = make_catalog(client, supabase_client.BUSINESS_ID, args.products, with_manifest=True)
+    ids = [product["id"] for product in catalog]
+
+    for kind in ("memory", "shared"):
+        run(kind, client, ids, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Cold catalog load: sequential vs fanned-out image listing.
+
+    python benchmarks/bench_image_listing.py --products 200 --latency 0.05
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+
+from products import Products  # noqa: E402
+from stub_supabase import StubSupabase, make_catalog  # noqa: E402
+
+
+def run(label, client, **kwargs):
+    client.calls.clear()
+    started = time.perf_counter()
+    products = Products(client=client).get_products(**kwargs)
+    elapsed = time.perf_counter() - started
+    with_images = sum(1 for p in products if p["images"])
+    print(
+        f"{label:<28} {elapsed * 1000:9.1f} ms  "
+        f"{client.total_calls():5d} backend calls  "
+        f"{with_images}/{len(products)} with images"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per stub call")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=5.0)
+    args = parser.parse_args()
+
+    client = StubSupabase(latency=args.latency)
+    make_catalog(client, Products(client=client).business_id, args.products)
+
+    sequential = run("sequential", client, fan_out=False)
+    fanned = run(f"fan-out ({args.workers} workers)", client,
+                 fan_out=True, max_workers=args.workers, timeout=args.timeout)
+    print(f"speedup: {sequential / fanned:.1f}x")
+
+    make_catalog(client, Products(client=client).business_id, args.products, with_manifest=True)
+    run("image_files manifest", client)
+
+
+if __name__ == "__main__":
+    main()
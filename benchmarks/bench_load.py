@@ -0,0 +1,238 @@
+"""
+Load test of the Flask app against the stub backend: scripted shopper
+scenarios run on a thread pool, each reporting requests per second,
+p50/p95/p99 latency per request and backend calls per iteration.
+
+    browse    GET /, the next page of /api/products, a /search
+    cart      add two products, change a quantity, remove one
+    batch     the same cart changes as one /cart/batch request
+    checkout  add to cart, /checkout, /pay-now, then /customer for new
+              shoppers (every other one), then /payout
+
+    python benchmarks/bench_load.py --products 500 --latency 0.02 --concurrency 8
+    python benchmarks/bench_load.py --scenarios checkout --iterations 500 --json
+
+Backend call counts are deterministic for a given catalog and scenario,
+so a change that adds round-trips to a hot path shows up there even
+when timings are noisy. With --stock products are stock-tracked, and
+each scenario ends with an inventory flush so its write-back is counted.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+# A catalog snapshot left by an earlier run (another catalog) must not be served
+os.environ.setdefault("CATALOG_SNAPSHOT_DIR", tempfile.mkdtemp(prefix="bench-catalog-"))
+# Nor may holds and carts left in the working directory
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="bench-data-"))
+
+import supabase_client  # noqa: E402
+from stub_supabase import StubSupabase, make_catalog, make_customers  # noqa: E402
+
+CONFIG = {
+    "SECRET_KEY": "bench",
+    "CART_STORE": "memory",
+    "JOB_WORKER": False,
+    "INVENTORY_FLUSHER": False,
+    "TESTING": True
+}
+
+
+class Shopper:
+    """One browser session; times every request it makes."""
+
+    def __init__(self, app):
+        self.browser = app.test_client()
+        self.latencies = []
+        self.failures = 0
+
+    def request(self, method, path, expect=200, **kwargs):
+        started = time.perf_counter()
+        response = self.browser.open(path, method=method, **kwargs)
+        self.latencies.append(time.perf_counter() - started)
+
+        if response.status_code != expect:
+            self.failures += 1
+        return response
+
+
+def returning_phone(i):
+    return f"097{i:07d}"
+
+
+def new_phone(i):
+    return f"096{i:07d}"
+
+
+# -------------------------------
+# SCENARIOS
+# -------------------------------
+
+def browse(shopper, i, catalog):
+    shopper.request("GET", "/")
+    page = shopper.request("GET", "/api/products").get_json()
+    if page["next_cursor"]:
+        shopper.request("GET", f"/api/products?cursor={page['next_cursor']}")
+    shopper.request("GET", f"/search?q=piece {i % 50}")
+
+
+def cart(shopper, i, catalog):
+    first = catalog[i % len(catalog)]["id"]
+    second = catalog[(i + 1) % len(catalog)]["id"]
+
+    shopper.request("POST", "/add-to-cart", json={"id": first})
+    shopper.request("POST", "/add-to-cart", json={"id": second})
+    shopper.request("POST", "/update-quantity", json={"product_id": first, "quantity": 3})
+    shopper.request("POST", "/remove-from-cart", json={"product_id": second})
+
+
+def batch(shopper, i, catalog):
+    first = catalog[i % len(catalog)]["id"]
+    second = catalog[(i + 1) % len(catalog)]["id"]
+
+    shopper.request("POST", "/cart/batch", json={"operations": [
+        {"op": "add", "product_id": first},
+        {"op": "add", "product_id": second},
+        {"op": "update", "product_id": first, "quantity": 3},
+        {"op": "remove", "product_id": second}
+    ]})
+
+
+def checkout(shopper, i, catalog):
+    shopper.request("POST", "/add-to-cart", json={"id": catalog[i % len(catalog)]["id"]})
+    shopper.request("GET", "/checkout")
+
+    if i % 2:
+        shopper.request("POST", "/pay-now", expect=302, data={"phone": returning_phone(i)})
+    else:
+        shopper.request("POST", "/pay-now", expect=302, data={"phone": new_phone(i)})
+        shopper.request("GET", "/customer")
+        shopper.request("POST", "/customer", expect=302, data={
+            "name": f"New shopper {i}",
+            "email": f"shopper{i}@example.com",
+            "location": "Lusaka",
+            "gender": "female"
+        })
+
+    shopper.request("GET", "/payout")
+
+
+SCENARIOS = {"browse": browse, "cart": cart, "batch": batch, "checkout": checkout}
+
+
+# -------------------------------
+# RUNNER
+# -------------------------------
+
+def percentile(ordered, share):
+    # Nearest-rank
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+def run(app, client, catalog, name, args, first_index):
+    scenario = SCENARIOS[name]
+
+    def iteration(i):
+        shopper = Shopper(app)
+        scenario(shopper, i, catalog)
+        return shopper
+
+    # Warm-up fills the catalog, page and template caches; not measured
+    for i in range(first_index, first_index + args.warmup):
+        iteration(i)
+    client.take_calls()
+
+    first = first_index + args.warmup
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        shoppers = list(pool.map(iteration, range(first, first + args.iterations)))
+    elapsed = time.perf_counter() - started
+
+    # Write-back runs on a timer in the app; here once, after timing
+    from inventory import inventory
+    inventory.flush()
+    calls = client.take_calls()
+    latencies = sorted(latency for shopper in shoppers for latency in shopper.latencies)
+
+    return {
+        "scenario": name,
+        "iterations": args.iterations,
+        "requests": len(latencies),
+        "failures": sum(shopper.failures for shopper in shoppers),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "backend_calls": sum(calls.values()),
+        "backend_calls_per_iteration": sum(calls.values()) / args.iterations,
+        "backend_calls_by_operation": dict(sorted(calls.items()))
+    }
+
+
+def report(result):
+    print(
+        f"{result['scenario']:<9} {result['requests']:6d} req  {result['requests_per_second']:8.1f} req/s  "
+        f"p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms  "
+        f"{result['backend_calls_per_iteration']:5.2f} backend calls/iteration  "
+        f"{result['failures']} failed"
+    )
+    breakdown = ", ".join(f"{operation} {count}" for operation, count in result["backend_calls_by_operation"].items())
+    print(f"{'':<9} backend: {breakdown or 'none'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="browse,cart,batch,checkout", help="comma separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=200, help="measured shoppers per scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured shoppers per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="shoppers in flight (threads)")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per stub call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds per stub call (seeded)")
+    parser.add_argument("--products", type=int, default=200, help="catalog size")
+    parser.add_argument("--images", type=int, default=2, help="images per product")
+    parser.add_argument("--manifest", action="store_true", help="store image file names on product rows")
+    parser.add_argument("--stock", type=int, help="units in stock per product (default: not tracked)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    client = StubSupabase(latency=args.latency, jitter=args.jitter)
+    catalog = make_catalog(
+        client, supabase_client.BUSINESS_ID, args.products,
+        images_per_product=args.images, with_manifest=args.manifest, stock=args.stock
+    )
+    # Every shopper index across all scenarios can be a returning customer
+    make_customers(client, supabase_client.BUSINESS_ID, len(names) * (args.warmup + args.iterations), returning_phone)
+    client.tables["orders"] = []
+
+    from main import create_app
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({**CONFIG, "SUPABASE_CLIENT": client, "JOBS_DB_PATH": os.path.join(tmp, "jobs.sqlite3")})
+
+        for n, name in enumerate(names):
+            result = run(app, client, catalog, name, args, n * (args.warmup + args.iterations))
+            results.append(result)
+            if not args.json:
+                report(result)
+
+    if args.json:
+        print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Phone normalization: per-call Checkout.clean_phone vs bulk normalize_phones,
+plus a stub-backed customer import.
+
+    python benchmarks/bench_phones.py --rows 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checkout import Checkout  # noqa: E402
+from import_customers import import_customers  # noqa: E402
+from phones import normalize_phones  # noqa: E402
+from stub_supabase import StubSupabase  # noqa: E402
+
+FORMATS = [
+    "0{a}{b}",
+    "0{a} {b1} {b2}",
+    "+260{a}{b}",
+    "260{a}{b}",
+    "+260 {a} {b1}-{b2}",
+    "0{a}-{b1}-{b2}",
+]
+
+
+def synthetic_phones(count, seed=7, invalid_ratio=0.02):
+    rng = random.Random(seed)
+    phones = []
+    for _ in range(count):
+        if rng.random() < invalid_ratio:
+            phones.append(rng.choice(["", "12345", "+44 7700 900123", "09799913"]))
+            continue
+        a = rng.choice(["97", "96", "95", "77", "76"]) + str(rng.randint(0, 9))
+        b = f"{rng.randint(0, 999999):06d}"
+        phones.append(rng.choice(FORMATS).format(a=a, b=b, b1=b[:3], b2=b[3:]))
+    return phones
+
+
+def per_call(phones):
+    # clean_phone needs no database, so skip creating a client
+    checkout = Checkout.__new__(Checkout)
+    normalized = []
+    for phone in phones:
+        try:
+            normalized.append(checkout.clean_phone(phone) or None)
+        except ValueError:
+            normalized.append(None)
+    return normalized
+
+
+def timed(label, fn, *args, repeat=1):
+    """Best of `repeat` runs."""
+    elapsed = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        run = time.perf_counter() - started
+        elapsed = run if elapsed is None else min(elapsed, run)
+    print(f"{label:<28} {elapsed * 1000:9.1f} ms")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--import-rows", type=int, default=20000,
+                        help="rows for the import run (the stub scans its table on every query)")
+    args = parser.parse_args()
+
+    phones = synthetic_phones(args.rows)
+
+    slow, slow_time = timed("clean_phone per call", per_call, phones, repeat=5)
+    (fast, rejects), fast_time = timed("normalize_phones (bulk)", normalize_phones, phones, repeat=5)
+    print(f"speedup: {slow_time / fast_time:.1f}x, {len(rejects)} rejects")
+
+    mismatches = sum(1 for a, b in zip(slow, fast) if a != b)
+    print(f"rows where results differ: {mismatches}")
+
+    client = StubSupabase()
+    rows = [{"phone": phone, "name": f"Customer {i}"} for i, phone in enumerate(phones[:args.import_rows])]
+    result, _ = timed("import (stub backend)", import_customers, client, rows, "phone", args.chunk_size)
+    print(
+        f"inserted {result['inserted']}, duplicates {result['duplicates']}, "
+        f"rejected {result['rejected']}, {client.total_calls()} backend calls"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+In-memory product search over a synthetic catalog: build time,
+incremental re-index after a catalog refresh, and query latency both
+uncached (first query after a catalog change) and for a repeated query
+(answered from the result cache).
+
+    python benchmarks/bench_search.py --products 50000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+
+from search import SearchIndex  # noqa: E402
+
+MATERIALS = ["gold", "silver", "copper", "brass", "bead", "leather", "pearl", "malachite", "amethyst", "emerald"]
+PIECES = ["ring", "necklace", "bracelet", "anklet", "earrings", "pendant", "chain", "bangle", "choker", "brooch"]
+STYLES = ["handmade", "vintage", "classic", "modern", "bridal", "minimal", "statement", "layered", "twisted", "engraved"]
+PLACES = ["Lusaka", "Ndola", "Kitwe", "Livingstone", "Kabwe", "Chipata", "Kasama", "Solwezi", "Mongu", "Choma"]
+
+
+class StaticCache:
+    """Stands in for the catalog cache: hands out whatever list it holds."""
+
+    def __init__(self, products):
+        self.products = products
+
+    def get(self):
+        return self.products
+
+
+def make_products(count, seed=7):
+    rng = random.Random(seed)
+    products = []
+    for i in range(count):
+        material, piece, style = rng.choice(MATERIALS), rng.choice(PIECES), rng.choice(STYLES)
+        products.append({
+            "id": f"p{i:07d}",
+            "name": f"{style.title()} {material} {piece} {i}",
+            "description": f"{style} {material} {piece} made in {rng.choice(PLACES)}, {rng.choice(STYLES)} finish",
+            "price": rng.randrange(50, 5000, 5)
+        })
+    return products
+
+
+def percentiles(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1e6
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1e6
+    return p50, p99, result
+
+
+def timed(label, index, params, repeat):
+    def uncached():
+        # As after a catalog change: no memoised answers or prefix unions
+        index._cache.clear()
+        index._words.changed()
+        index._names.changed()
+        return index.search(**params)
+
+    cold_p50, cold_p99, result = percentiles(uncached, repeat)
+    hot_p50, hot_p99, _ = percentiles(lambda: index.search(**params), repeat)
+    print(
+        f"{label:<40} {result['total']:6d} matches  "
+        f"uncached p50 {cold_p50:7.1f} us  p99 {cold_p99:7.1f} us  "
+        f"repeat p50 {hot_p50:5.1f} us  p99 {hot_p99:5.1f} us"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--changed", type=float, default=0.01, help="share of products edited per refresh")
+    args = parser.parse_args()
+
+    products = make_products(args.products)
+    cache = StaticCache(products)
+    index = SearchIndex(cache)
+
+    started = time.perf_counter()
+    index.search("")
+    print(f"full build ({args.products} products): {(time.perf_counter() - started) * 1000:.0f} ms, {index.stats()['tokens']} tokens")
+
+    # A refresh: new list, a few products repriced/renamed, a few new ones
+    refreshed = [dict(product) for product in products]
+    changed = int(len(refreshed) * args.changed)
+    for product in random.Random(1).sample(refreshed, changed):
+        product["price"] += 5
+        product["name"] += " limited"
+    refreshed.extend(make_products(changed, seed=99)[:changed // 2])
+    for i, product in enumerate(refreshed[-(changed // 2):]):
+        product["id"] = f"new{i:07d}"
+    cache.products = refreshed
+
+    started = time.perf_counter()
+    index.search("")
+    print(f"incremental sync ({index.stats()['reindexed'] - args.products} re-indexed): {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    queries = [
+        ("prefix 'neck'", {"query": "neck"}),
+        ("two prefixes 'gold ri'", {"query": "gold ri"}),
+        ("rare word 'malachite bangle lusaka'", {"query": "malachite bangle lusaka"}),
+        ("price range 200-400, price_asc", {"min_price": 200, "max_price": 400, "sort": "price_asc"}),
+        ("all, price_desc, page 3", {"sort": "price_desc", "offset": 48}),
+        ("'silver' + range 100-1000, price_asc", {"query": "silver", "min_price": 100, "max_price": 1000, "sort": "price_asc"}),
+        ("'vint brace' + range, relevance", {"query": "vint brace", "min_price": 100, "max_price": 2000}),
+        ("prefix 'b' (very broad), relevance", {"query": "b"}),
+    ]
+    for label, params in queries:
+        timed(label, index, params, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
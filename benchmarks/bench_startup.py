@@ -0,0 +1,94 @@
+"""
+Cold start: import cost of main.py and time to first request.
+
+    python benchmarks/bench_startup.py
+
+Runs each measurement in a fresh interpreter so nothing is warm. The
+first request goes to the home page against a local stub client, so no
+Supabase credentials or network are needed.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_REQUEST = """
+import json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+sys.path.insert(0, os.path.join({root!r}, "benchmarks"))
+import main
+from stub_supabase import StubSupabase, make_catalog
+imported = time.perf_counter()
+stub = StubSupabase()
+make_catalog(stub, None, {products})
+app = main.create_app({{"SUPABASE_CLIENT": stub, "CART_STORE": "memory",
+                        "PRELOAD_TEMPLATES": {preload}, "SECRET_KEY": "bench"}})
+created = time.perf_counter()
+response = app.test_client().get("/")
+assert response.status_code == 200
+done = time.perf_counter()
+print(json.dumps({{"import": imported - started, "create_app": created - imported,
+                  "first_request": done - created, "total": done - started}}))
+"""
+
+
+def import_time(top):
+    env = {**os.environ, "SUPABASE_URL": "", "SUPABASE_KEY": ""}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        raise SystemExit("import main failed")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+
+    total = next(cumulative for cumulative, _, name in rows if name == "main")
+    print(f"import main: {total / 1000:.1f} ms (no Supabase credentials set)")
+    for cumulative, _, name in sorted(rows, reverse=True)[1:top + 1]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+
+def first_request(products, preload):
+    script = FIRST_REQUEST.format(root=ROOT, products=products, preload=preload)
+    with tempfile.TemporaryDirectory(prefix="bench-data-") as data_dir:
+        env = {**os.environ, "DATA_DIR": data_dir, "CATALOG_SNAPSHOT_DIR": data_dir}
+        result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr)
+        raise SystemExit("first request failed")
+
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    label = "preloaded templates" if preload else "lazy templates"
+    print(
+        f"{label:<20} import {timings['import'] * 1000:7.1f} ms  "
+        f"create_app {timings['create_app'] * 1000:6.1f} ms  "
+        f"first request {timings['first_request'] * 1000:6.1f} ms  "
+        f"total {timings['total'] * 1000:7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--products", type=int, default=50)
+    args = parser.parse_args()
+
+    import_time(args.top)
+    first_request(args.products, preload=False)
+    first_request(args.products, preload=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Local stand-in for the parts of the Supabase client this app uses.
+
+Every table/storage call sleeps for `latency` seconds (plus up to
+`jitter` more, from a seeded generator so runs are repeatable) to mimic
+a network round-trip and is counted in `calls`, so benchmarks can report
+both wall-clock time and the number of backend requests.
+"""
+import random
+import threading
+import time
+import uuid
+
+
+class StubStorageError(Exception):
+    """Mirrors the status/code attributes of storage3's StorageApiError."""
+
+    def __init__(self, message, code, status):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+
+
+class StubResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class StubQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.filters = []
+        self.limit_count = None
+        self.order_by = None
+        self.operation = "select"
+        self.values = None
+
+    def select(self, *columns):
+        return self
+
+    def insert(self, values):
+        self.operation = "insert"
+        self.values = values
+        return self
+
+    def update(self, values):
+        self.operation = "update"
+        self.values = values
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, lambda field: field == value))
+        return self
+
+    def gt(self, column, value):
+        self.filters.append((column, lambda field: field is not None and field > value))
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def is_(self, column, value):
+        expected = None if value == "null" else value
+        self.filters.append((column, lambda field: field is expected))
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append((column, lambda field: field in values))
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def execute(self):
+        self.client.record(f"table.{self.table}.{self.operation}")
+        return self._run()
+
+    def _run(self):
+        table = self.client.tables.setdefault(self.table, [])
+
+        if self.operation == "insert":
+            inserted = []
+            for values in (self.values if isinstance(self.values, list) else [self.values]):
+                row = {"id": str(uuid.uuid4()), **values}
+                table.append(row)
+                inserted.append(dict(row))
+            return StubResponse(inserted)
+
+        rows = [
+            row for row in self.client.tables.get(self.table, [])
+            if all(test(row.get(column)) for column, test in self.filters)
+        ]
+        if self.operation == "update":
+            for row in rows:
+                row.update(self.values)
+        if self.order_by:
+            column, desc = self.order_by
+            rows.sort(key=lambda row: row.get(column), reverse=desc)
+        if self.limit_count is not None:
+            rows = rows[:self.limit_count]
+        return StubResponse([dict(row) for row in rows])
+
+
+class StubBucket:
+    def __init__(self, client, bucket):
+        self.client = client
+        self.bucket = bucket
+
+    def list(self, path=None, options=None):
+        self.client.record("storage.list")
+        return self._list(path)
+
+    def _list(self, path):
+        prefix = f"{path}/" if path else ""
+        return [
+            {"id": str(uuid.uuid4()), "name": name[len(prefix):]}
+            for name in self.client.files.get(self.bucket, {})
+            if name.startswith(prefix) and "/" not in name[len(prefix):]
+        ]
+
+    def upload(self, path, file, file_options=None):
+        self.client.record("storage.upload")
+        return self._upload(path, file)
+
+    def download(self, path):
+        self.client.record("storage.download")
+        return self._download(path)
+
+    def _download(self, path):
+        data = self.client.files.get(self.bucket, {}).get(path)
+        if not isinstance(data, bytes):
+            raise StubStorageError("Object not found", "not_found", 404)
+        return data
+
+    def _upload(self, path, file):
+        bucket = self.client.files.setdefault(self.bucket, {})
+        if path in bucket:
+            raise StubStorageError("The resource already exists", "Duplicate", 409)
+
+        # Drain in chunks like the HTTP client does, without keeping the bytes
+        size = 0
+        if isinstance(file, bytes):
+            size = len(file)
+        else:
+            for chunk in iter(lambda: file.read(64 * 1024), b""):
+                size += len(chunk)
+        bucket[path] = size
+        return {"path": path}
+
+
+class StubStorage:
+    def __init__(self, client):
+        self.client = client
+
+    def from_(self, bucket):
+        return self.client.bucket_class(self.client, bucket)
+
+
+class StubSupabase:
+    query_class = StubQuery
+    bucket_class = StubBucket
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.tables = {}
+        self.files = {}
+        self.calls = {}
+        self.storage = StubStorage(self)
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        return self.query_class(self, name)
+
+    def record(self, operation):
+        delay = self._count(operation)
+        if delay:
+            time.sleep(delay)
+
+    def _count(self, operation):
+        # Returns how long this call should take
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            return self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def take_calls(self):
+        """Calls counted since the last take_calls(), then starts over."""
+        with self._lock:
+            calls, self.calls = self.calls, {}
+        return calls
+
+
+def make_catalog(client, business_id, size, images_per_product=2, with_manifest=False, stock=None):
+    """
+    Seeds `size` products (and their image files) into a stub client,
+    each with `stock` units in a stock column if given.
+    """
+    products = []
+    for i in range(size):
+        product_id = str(uuid.uuid4())
+        image_files = [f"image-{n}.jpg" for n in range(images_per_product)]
+        row = {
+            "id": product_id,
+            "business_id": business_id,
+            "name": f"Piece {i}",
+            "description": f"Handmade piece number {i}",
+            "price": 150 + (i % 40) * 25
+        }
+        if with_manifest:
+            row["image_files"] = image_files
+        if stock is not None:
+            row["stock"] = stock
+        products.append(row)
+        for name in image_files:
+            client.files.setdefault("uploaded-files", {})[f"products/{product_id}/{name}"] = b""
+    client.tables["products"] = products
+    return products
+
+
+def make_customers(client, business_id, count, phone):
+    """Seeds `count` existing customers, the i-th with phone(i)."""
+    client.tables["customers"] = [
+        {
+            "id": f"customer-{i}",
+            "business_id": business_id,
+            "name": f"Shopper {i}",
+            "email": None,
+            "phone": phone(i)
+        }
+        for i in range(count)
+    ]
+    return client.tables["customers"]
@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+
+from metrics import metrics
+
+BREAKER_FAILURES = int(os.getenv("SUPABASE_BREAKER_FAILURES", "5"))
+BREAKER_SLOW_CALL = float(os.getenv("SUPABASE_BREAKER_SLOW_CALL", "2"))
+BREAKER_RESET = float(os.getenv("SUPABASE_BREAKER_RESET", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a call while the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a backend that keeps failing.
+
+    `failure_threshold` calls in a row that raise or take longer than
+    `slow_call` seconds open the breaker: calls then fail at once with
+    CircuitOpenError for `reset_timeout` seconds. After that a single
+    probe call is let through (half-open); if it is quick and succeeds
+    the breaker closes, otherwise it opens again.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, slow_call=BREAKER_SLOW_CALL,
+                 reset_timeout=BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call = slow_call
+        self.reset_timeout = reset_timeout
+        self.trips = 0
+        self.rejected = 0
+        self._state = CLOSED
+        self._bad_calls = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def call(self, fn, *args, **kwargs):
+        probe = self._before_call()
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            self._after_call(False, probe)
+            raise
+        self._after_call(time.monotonic() - started <= self.slow_call, probe)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_bad_calls": self._bad_calls,
+                "trips": self.trips,
+                "rejected": self.rejected
+            }
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return self._state
+
+    def _before_call(self):
+        """
+        Raises CircuitOpenError if the call may not go ahead. Otherwise
+        returns whether it is the half-open probe, to hand to _after_call.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and not self._probing:
+                # This call is the probe; everyone else still fails fast
+                self._probing = True
+                return True
+
+            self.rejected += 1
+        raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def _after_call(self, ok, probe):
+        with self._lock:
+            if probe:
+                self._probing = False
+            elif self._state != CLOSED:
+                # Started before the breaker opened: only the probe decides now
+                return
+
+            if ok:
+                self._bad_calls = 0
+                self._state = CLOSED
+                return
+
+            self._bad_calls += 1
+            if probe or (self._state == CLOSED and self._bad_calls >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self.trips += 1
+                print(f"[CircuitBreaker] {self.name} opened after {self._bad_calls} failed or slow calls")
+                metrics.increment("app_circuit_breaker_trips_total", breaker=self.name)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._probing = False
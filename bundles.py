@@ -0,0 +1,257 @@
+"""
+Minified, content-hashed CSS/JS bundles built from assets/.
+
+    python bundles.py            # build (also done on first use)
+    python bundles.py --prune    # and delete bundles no longer referenced
+
+Each bundle is written to static/dist/<name>.<hash>.<ext> together with
+.gz and .br siblings, so it can be cached for a year: any change to the
+source gives it a new URL. Templates link them with asset_url("base.css").
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+
+try:
+    import brotli
+except ImportError:  # Flask-Compress normally pulls it in
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.join(ROOT, "assets")
+DIST_DIR = os.path.join(ROOT, "static", "dist")
+ASSET_URL_PREFIX = "/assets/"
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+# Bundle name -> source files (under assets/), concatenated in order
+BUNDLES = {
+    "base.css": ["css/base.css"],
+    "index.css": ["css/index.css"],
+    "checkout.css": ["css/checkout.css"],
+    "customer.css": ["css/customer.css"],
+    "payout.css": ["css/payout.css"],
+    "paid.css": ["css/paid.css"],
+    "contact.css": ["css/contact.css"],
+    "base.js": ["js/base.js"],
+    "index.js": ["js/index.js"],
+    "checkout.js": ["js/checkout.js"],
+    "payout.js": ["js/payout.js"],
+}
+
+MIMETYPES = {".css": "text/css", ".js": "text/javascript"}
+
+# Preferred first when the browser accepts several
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class Bundles:
+    """
+    Builds every bundle once per process (or reuses what is already on
+    disk for the same sources) and maps names to hashed file names.
+    """
+
+    def __init__(self, bundles=BUNDLES, assets_dir=ASSETS_DIR, dist_dir=DIST_DIR):
+        self.bundles = bundles
+        self.assets_dir = assets_dir
+        self.dist_dir = dist_dir
+        self._manifest = None
+        self._files = None
+        self._lock = threading.Lock()
+
+    def url(self, name):
+        """
+        /assets/<hashed file> for a bundle name (the asset_url template helper).
+        """
+        return ASSET_URL_PREFIX + self.manifest()[name]
+
+    def manifest(self):
+        if self._manifest is None:
+            with self._lock:
+                if self._manifest is None:
+                    self._manifest = self.build()
+                    self._files = set(self._manifest.values())
+        return self._manifest
+
+    def build(self):
+        """
+        Minifies and writes every bundle (skipping files already there).
+        Returns {bundle name: hashed file name}.
+        """
+        manifest = {}
+        for name, sources in self.bundles.items():
+            stem, ext = os.path.splitext(name)
+            text = "\n".join(self._read(source) for source in sources)
+            body = (minify_css(text) if ext == ".css" else minify_js(text)).encode("utf-8")
+
+            file_name = f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}{ext}"
+            path = os.path.join(self.dist_dir, file_name)
+            if not os.path.exists(path):
+                self._write(path + ".gz", gzip.compress(body, 9))
+                if brotli is not None:
+                    self._write(path + ".br", brotli.compress(body, quality=11))
+                # Written last: its presence means the siblings are there too
+                self._write(path, body)
+
+            manifest[name] = file_name
+
+        self._write(os.path.join(self.dist_dir, "manifest.json"), json.dumps(manifest, indent=2).encode("utf-8"))
+        return manifest
+
+    def file_for(self, file_name, accept_encodings):
+        """
+        (path, mimetype, content encoding or None) of the best copy of a
+        built bundle for this request, or None for an unknown file.
+        werkzeug's request.accept_encodings picks br or gzip.
+        """
+        self.manifest()
+        if file_name not in self._files:
+            return None
+
+        path = os.path.join(self.dist_dir, file_name)
+        mimetype = MIMETYPES[os.path.splitext(file_name)[1]]
+
+        for encoding, suffix in ENCODINGS:
+            if accept_encodings.quality(encoding) > 0 and os.path.exists(path + suffix):
+                return path + suffix, mimetype, encoding
+        return path, mimetype, None
+
+    def prune(self):
+        """
+        Deletes built files no bundle points at any more. Only run it once
+        no cached page can still link the old ones.
+        """
+        keep = set(self.manifest().values())
+        removed = 0
+        for file_name in os.listdir(self.dist_dir):
+            base = file_name.removesuffix(".gz").removesuffix(".br")
+            if file_name != "manifest.json" and base not in keep:
+                os.remove(os.path.join(self.dist_dir, file_name))
+                removed += 1
+        return removed
+
+    def _read(self, source):
+        with open(os.path.join(self.assets_dir, source), encoding="utf-8") as f:
+            return f.read()
+
+    def _write(self, path, data):
+        # Written beside the target and renamed: readers never see half a file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+# -------------------------------
+# MINIFIERS
+# -------------------------------
+#
+# Deliberately conservative: comments and indentation go, nothing is
+# renamed or reordered, and line breaks stay in JS so automatic
+# semicolon insertion behaves exactly as in the source.
+
+CSS_SPACE = re.compile(r"\s+")
+CSS_PUNCTUATION = re.compile(r"\s*([{};,>])\s*")
+JS_LINE_BREAK = re.compile(r"[ \t]*\n\s*")
+
+
+def minify_css(text):
+    out = []
+    code = []
+
+    def flush():
+        chunk = CSS_SPACE.sub(" ", "".join(code))
+        chunk = CSS_PUNCTUATION.sub(r"\1", chunk)
+        # A space after ":" is never needed; one before it can be (".a :hover")
+        out.append(chunk.replace(": ", ":"))
+        code.clear()
+
+    for chunk, is_code in _split_code(text, comment_styles=("/*",), quotes="\"'"):
+        if is_code:
+            code.append(chunk)
+        else:
+            flush()
+            out.append(chunk)
+    flush()
+
+    return "".join(out).replace(";}", "}").strip()
+
+
+def minify_js(text):
+    out = []
+    for chunk, is_code in _split_code(text, comment_styles=("/*", "//"), quotes="\"'`"):
+        # Indentation, trailing spaces and blank lines go; line breaks stay
+        out.append(JS_LINE_BREAK.sub("\n", chunk) if is_code else chunk)
+    return "".join(out).strip()
+
+
+def _split_code(text, comment_styles, quotes):
+    """
+    Yields (chunk, is_code) with comments removed and string literals
+    passed through untouched. Block comments become a space and line
+    comments end at (but keep) the newline.
+    """
+    i = start = 0
+    length = len(text)
+
+    while i < length:
+        char = text[i]
+
+        if char in quotes:
+            if i > start:
+                yield text[start:i], True
+            end = i + 1
+            while end < length and text[end] != char:
+                end += 2 if text[end] == "\\" else 1
+            yield text[i:end + 1], False
+            i = start = end + 1
+
+        elif "/*" in comment_styles and text.startswith("/*", i):
+            if i > start:
+                yield text[start:i], True
+            end = text.find("*/", i + 2)
+            i = start = length if end == -1 else end + 2
+            yield " ", True
+
+        elif "//" in comment_styles and text.startswith("//", i):
+            if i > start:
+                yield text[start:i], True
+            end = text.find("\n", i)
+            i = start = length if end == -1 else end
+
+        else:
+            i += 1
+
+    if start < length:
+        yield text[start:], True
+
+
+bundles = Bundles()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prune", action="store_true", help="delete bundles no longer referenced")
+    args = parser.parse_args()
+
+    manifest = bundles.manifest()
+    for name, file_name in manifest.items():
+        path = os.path.join(bundles.dist_dir, file_name)
+        source_size = sum(os.path.getsize(os.path.join(bundles.assets_dir, source)) for source in bundles.bundles[name])
+        sizes = [f"{os.path.getsize(path)} B"]
+        for encoding, suffix in ENCODINGS:
+            if os.path.exists(path + suffix):
+                sizes.append(f"{encoding} {os.path.getsize(path + suffix)} B")
+        print(f"{name:<14} -> {file_name:<28} {source_size} B source, {', '.join(sizes)}")
+
+    if args.prune:
+        print(f"pruned {bundles.prune()} old files")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,85 +1,205 @@
-from supabase import create_client, Client
-from dotenv import load_dotenv
+from collections import OrderedDict
+from contextlib import contextmanager
+from decimal import Decimal
+import json
 import os
+import sqlite3
+import threading
+import time
+import zlib
 
-# Load environment variables
-load_dotenv()
+try:
+    import fcntl
+except ImportError:  # Windows: edits only take turns within one process
+    fcntl = None
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-BUSINESS_ID = os.getenv("BUSINESS_ID")
-USER_ID = os.getenv("USER_ID")
+from inventory import inventory
+from jobs import DATA_DIR
+from metrics import count_error
+from products import product_index
+from supabase_client import get_client, BUSINESS_ID, USER_ID
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise Exception("Supabase environment variables not set")
 
-# Create Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Cart storage: "memory" (single process) or "sqlite" (shared by workers)
+CART_STORE = os.getenv("CART_STORE", "sqlite")
+CART_DB_PATH = os.getenv("CART_DB_PATH", os.path.join(DATA_DIR, "carts.sqlite3"))
+CART_TTL = int(os.getenv("CART_TTL", str(7 * 24 * 3600)))
+CART_MAX_ENTRIES = int(os.getenv("CART_MAX_ENTRIES", "10000"))
+CART_BATCH_MAX_OPERATIONS = 50
+
+# Positional fields of a serialized cart line; anything else rides along as extras
+LINE_FIELDS = ("product_id", "quantity", "price", "name", "image")
 
 
 class Cart:
+    """
+    Cart lines keyed by product_id (insertion ordered), so update and
+    remove are O(1). The total is kept as an exact Decimal and adjusted
+    by each change instead of being re-summed.
+
+    A cart with a hold_id (its cart store id) holds stock for its lines
+    in the inventory, and refuses quantities that are not available.
+    """
+
     def __init__(self):
-        self.supabase = supabase
         self.business_id = BUSINESS_ID
         self.user_id = USER_ID
-        self.items = []
-        self.accumulated_total = 0
-
-    def add_to_cart(self, product_id, name, price, image):
-        item = {
-            "product_id": product_id,
-            "name": name,
-            "price": float(price),
-            "image": image,
-            "quantity": 1
+        self.hold_id = None
+        self.lines = {}
+        self.accumulated_total = Decimal("0")
+
+    @property
+    def supabase(self):
+        # Carts are built on every request but rarely talk to Supabase
+        return get_client()
+
+    @property
+    def items(self):
+        return list(self.lines.values())
+
+    def clear(self):
+        self.lines = {}
+        self.accumulated_total = Decimal("0")
+
+    def dumps(self):
+        """
+        Compact JSON form of the cart:
+        [[product_id, quantity, "price", name, image, {extras}?], ...]
+        """
+        rows = []
+        for item in self.lines.values():
+            row = [
+                item["product_id"],
+                item["quantity"],
+                str(item["price"]),
+                item.get("name"),
+                item.get("image")
+            ]
+            extras = {
+                key: value for key, value in item.items()
+                if key not in LINE_FIELDS and value is not None
+            }
+            if extras:
+                row.append(extras)
+            rows.append(row)
+
+        return json.dumps(rows, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, payload):
+        cart = cls()
+        for row in json.loads(payload):
+            product_id, quantity, price, name, image = row[:5]
+            item = {
+                "product_id": product_id,
+                "name": name,
+                "price": Decimal(price),
+                "image": image,
+                "quantity": quantity
+            }
+            if len(row) > 5:
+                item.update(row[5])
+
+            cart.lines[product_id] = item
+            cart.accumulated_total += item["price"] * quantity
+
+        return cart
+
+    def _summary(self):
+        return {
+            "number_of_items": len(self.lines),
+            "accumulated_total": float(self.accumulated_total)
         }
 
-        self.items.append(item)
-        self.accumulated_total += float(price)
+    def _reserve(self, product_id, quantity):
+        if self.hold_id is None:
+            return True
+        return inventory.reserve(self.hold_id, product_id, quantity)
+
+    def _out_of_stock(self, product_id):
+        available = inventory.available(product_id, self.hold_id) or 0
+        return {
+            "success": False,
+            "message": f"Only {available} available" if available else "Sold out",
+            "available": available,
+            **self._summary()
+        }
+
+    def add_to_cart(self, product_id):
+        """
+        Adds one unit of a product. Name, price and image always come from
+        the server-side product index, never from the browser.
+        """
+        product = product_index.get(product_id)
+        if product is None or product["price"] is None:
+            return {
+                "success": False,
+                "message": "Product not found",
+                **self._summary()
+            }
+
+        price = Decimal(str(product["price"]))
+        item = self.lines.get(product_id)
+
+        if not self._reserve(product_id, (item["quantity"] if item else 0) + 1):
+            return self._out_of_stock(product_id)
+
+        if item:
+            # Adding the same piece again bumps its quantity
+            item["quantity"] += 1
+            self.accumulated_total += item["price"]
+        else:
+            self.lines[product_id] = {
+                "product_id": product_id,
+                "name": product["name"],
+                "price": price,
+                "image": product["image"],
+                "quantity": 1
+            }
+            self.accumulated_total += price
 
         return {
             "message": "Item added to cart",
-            "number_of_items": len(self.items),
-            "accumulated_total": float(self.accumulated_total)
+            **self._summary()
         }
 
     def recalculate_total(self):
         self.accumulated_total = sum(
-            item["price"] * item["quantity"] for item in self.items
+            (item["price"] * item["quantity"] for item in self.lines.values()),
+            Decimal("0")
         )
 
     def update_quantity(self, product_id, quantity):
         try:
-            quantity = int(quantity)
+            quantity = max(1, int(quantity))
 
-            for item in self.items:
-                if item["product_id"] == product_id:
-                    item["quantity"] = max(1, quantity)
-                    break
-            else:
+            item = self.lines.get(product_id)
+            if item is None:
                 return {
                     "success": False,
                     "message": "Item not found",
-                    "number_of_items": len(self.items),
-                    "accumulated_total": float(self.accumulated_total)
+                    **self._summary()
                 }
 
-            self.recalculate_total()
+            if not self._reserve(product_id, quantity):
+                return self._out_of_stock(product_id)
+
+            self.accumulated_total += item["price"] * (quantity - item["quantity"])
+            item["quantity"] = quantity
 
             return {
                 "success": True,
                 "message": "Quantity updated",
-                "number_of_items": len(self.items),
-                "accumulated_total": float(self.accumulated_total)
+                **self._summary()
             }
 
         except Exception as e:
             print(f"[Cart.update_quantity] Error: {e}")
+            count_error("cart.update_quantity")
             return {
                 "success": False,
                 "message": "Server error",
-                "number_of_items": len(self.items),
-                "accumulated_total": float(self.accumulated_total)
+                **self._summary()
             }
 
     def remove_from_cart(self, product_id):
@@ -91,44 +211,310 @@ class Cart:
                 return {
                     "success": False,
                     "message": "Missing product_id",
-                    "number_of_items": len(self.items),
-                    "accumulated_total": float(self.accumulated_total)
+                    **self._summary()
                 }
 
-            original_len = len(self.items)
-
-            # Filter out the product (NO casting, UUID-safe)
-            self.items = [
-                item for item in self.items
-                if item.get("product_id") != product_id
-            ]
+            # Lookup by key, NO casting (UUID-safe)
+            item = self.lines.pop(product_id, None)
 
-            if len(self.items) == original_len:
+            if item is None:
                 return {
                     "success": False,
                     "message": "Item not found",
-                    "number_of_items": len(self.items),
-                    "accumulated_total": float(self.accumulated_total)
+                    **self._summary()
                 }
 
-            self.recalculate_total()
+            self.accumulated_total -= item["price"] * item["quantity"]
+            self._reserve(product_id, 0)
 
             return {
                 "success": True,
                 "message": "Item removed",
-                "number_of_items": len(self.items),
-                "accumulated_total": float(self.accumulated_total)
+                **self._summary()
             }
 
         except Exception as e:
             print(f"[Cart.remove_from_cart] Error: {e}")
+            count_error("cart.remove_from_cart")
             return {
                 "success": False,
                 "message": "Server error",
-                "number_of_items": len(self.items),
-                "accumulated_total": float(self.accumulated_total)
+                **self._summary()
             }
 
+    def reserve_all(self):
+        """
+        Holds stock again for every line, e.g. when a cart comes back
+        after its holds lapsed (carts outlive them). A line that no
+        longer fits is cut to what is available, or removed if nothing
+        is. Returns those lines as [{"name", "requested", "available"}].
+        """
+        if self.hold_id is None:
+            return []
+
+        changes = []
+        for product_id, item in list(self.lines.items()):
+            if self._reserve(product_id, item["quantity"]):
+                continue
+
+            available = inventory.available(product_id, self.hold_id) or 0
+            if not (available and self._reserve(product_id, available)):
+                available = 0
+                self._reserve(product_id, 0)
+                del self.lines[product_id]
+
+            changes.append({"name": item["name"], "requested": item["quantity"], "available": available})
+            self.accumulated_total -= item["price"] * (item["quantity"] - available)
+            item["quantity"] = available
+
+        return changes
+
+    def apply_batch(self, operations):
+        """
+        Applies an ordered list of operations, all or nothing:
+
+            [{"op": "add", "product_id": ...},
+             {"op": "update", "product_id": ..., "quantity": 3},
+             {"op": "remove", "product_id": ...}]
+
+        If any operation fails the cart is left exactly as it was, and
+        "failed_operation" is the index of the one that failed. Either
+        way the response carries the resulting quantities and totals.
+        """
+        if len(operations) > CART_BATCH_MAX_OPERATIONS:
+            return self._batch_result(False, f"At most {CART_BATCH_MAX_OPERATIONS} operations per batch")
+
+        snapshot = self.dumps()
+        holds = inventory.holds(self.hold_id) if self.hold_id is not None else None
+
+        for index, operation in enumerate(operations):
+            result = self._apply_operation(operation)
+            if result.get("success", True) is False:
+                # Roll back everything this batch changed
+                restored = Cart.loads(snapshot)
+                self.lines, self.accumulated_total = restored.lines, restored.accumulated_total
+                if holds is not None:
+                    inventory.restore(self.hold_id, holds)
+                return self._batch_result(False, result["message"], failed_operation=index)
+
+        return self._batch_result(True, "Cart updated", applied=len(operations))
+
+    def _apply_operation(self, operation):
+        if not isinstance(operation, dict):
+            return {"success": False, "message": "Invalid operation"}
+
+        product_id = operation.get("product_id")
+        kind = operation.get("op")
+
+        if kind == "add":
+            return self.add_to_cart(product_id)
+        if kind == "update":
+            quantity = operation.get("quantity")
+            if isinstance(quantity, bool) or not isinstance(quantity, (int, str)) or not str(quantity).strip().isdigit():
+                return {"success": False, "message": "Invalid quantity"}
+            return self.update_quantity(product_id, quantity)
+        if kind == "remove":
+            return self.remove_from_cart(product_id)
+        return {"success": False, "message": f"Unknown operation: {kind}"}
+
+    def _batch_result(self, success, message, **extra):
+        return {
+            "success": success,
+            "message": message,
+            **extra,
+            "quantities": {
+                product_id: item["quantity"] for product_id, item in self.lines.items()
+            },
+            **self._summary()
+        }
+
+
+class CartEdit:
+    """
+    A cart being edited in a store (see edit()): the payload it had, and
+    the one to store when the edit completes, if save() was called.
+    """
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.saved = None
+
+    def save(self, payload):
+        self.saved = payload
+
+
+class MemoryCartStore:
+    """
+    Carts keyed by session id, held in this process only.
+    Least recently used carts are evicted past `max_entries`,
+    and carts idle for longer than `ttl` seconds expire.
+    """
+
+    # Edits of one cart take turns; carts hashed to different locks do not wait
+    EDIT_LOCKS = 64
+
+    def __init__(self, max_entries=CART_MAX_ENTRIES, ttl=CART_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._carts = OrderedDict()
+        self._lock = threading.Lock()
+        self._edit_locks = [threading.Lock() for _ in range(self.EDIT_LOCKS)]
+
+    def load(self, cart_id):
+        with self._lock:
+            entry = self._carts.get(cart_id)
+            if entry is None:
+                return None
+
+            saved_at, payload = entry
+            if time.monotonic() - saved_at > self.ttl:
+                del self._carts[cart_id]
+                return None
+
+            self._carts.move_to_end(cart_id)
+            return payload
+
+    def save(self, cart_id, payload):
+        with self._lock:
+            self._carts[cart_id] = (time.monotonic(), payload)
+            self._carts.move_to_end(cart_id)
+            while len(self._carts) > self.max_entries:
+                self._carts.popitem(last=False)
+
+    def delete(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+    @contextmanager
+    def edit(self, cart_id):
+        """
+        A read-modify-write of one cart: yields a CartEdit with the stored
+        payload, and stores what was passed to its save() once the block
+        completes. Edits of a cart take turns, so none is lost to another's.
+        """
+        with self._edit_locks[hash(cart_id) % self.EDIT_LOCKS]:
+            edit = CartEdit(self.load(cart_id))
+            yield edit
+            if edit.saved is not None and edit.saved != edit.payload:
+                self.save(cart_id, edit.saved)
+
+
+class SQLiteCartStore:
+    """
+    Carts keyed by session id in a local SQLite file, so every
+    gunicorn worker on the host sees the same cart.
+    Carts idle for longer than `ttl` seconds expire.
+    """
+
+    PURGE_EVERY = 500
+    # Edits of one cart take turns across workers by locking one byte of
+    # `{path}.lock` (picked by cart id); carts on other bytes do not wait
+    EDIT_LOCKS = 64
+
+    def __init__(self, path=CART_DB_PATH, ttl=CART_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._saves = 0
+        self._edit_locks = [threading.Lock() for _ in range(self.EDIT_LOCKS)]
+        self._lock_file = None
+        self._lock_file_pid = None
+        self._lock = threading.Lock()
+
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS carts ("
+                "cart_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connection(self):
+        # One connection per thread (and per process: never reused after fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def load(self, cart_id):
+        return self._read(self._connection(), cart_id)
+
+    def save(self, cart_id, payload):
+        with self._connection() as conn:
+            self._write(conn, cart_id, payload)
+
+    def delete(self, cart_id):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM carts WHERE cart_id = ?", (cart_id,))
+
+    @contextmanager
+    def edit(self, cart_id):
+        """
+        MemoryCartStore.edit across workers: the cart's lock is held for
+        the whole edit, so an edit of it from another worker waits for
+        this one instead of overwriting it. The database itself is only
+        locked for the final write, so a slow edit (placing an order)
+        holds up no other cart.
+        """
+        # crc32, not hash(): every worker must pick the same byte
+        stripe = zlib.crc32(cart_id.encode("utf-8")) % self.EDIT_LOCKS
+
+        with self._edit_locks[stripe], self._host_lock(stripe):
+            edit = CartEdit(self.load(cart_id))
+            yield edit
+            if edit.saved is not None and edit.saved != edit.payload:
+                self.save(cart_id, edit.saved)
+
+    @contextmanager
+    def _host_lock(self, stripe):
+        if fcntl is None:
+            yield
+            return
+
+        lock_file = self._edit_lock_file()
+        fcntl.lockf(lock_file, fcntl.LOCK_EX, 1, stripe)
+        try:
+            yield
+        finally:
+            fcntl.lockf(lock_file, fcntl.LOCK_UN, 1, stripe)
+
+    def _edit_lock_file(self):
+        # One descriptor per process: closing any descriptor of the file
+        # would release every lock this process holds on it
+        with self._lock:
+            if self._lock_file_pid != os.getpid():
+                self._lock_file = open(f"{self.path}.lock", "a")
+                self._lock_file_pid = os.getpid()
+            return self._lock_file
+
+    def _read(self, conn, cart_id):
+        row = conn.execute(
+            "SELECT data FROM carts WHERE cart_id = ? AND updated_at > ?",
+            (cart_id, time.time() - self.ttl)
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def _write(self, conn, cart_id, payload):
+        conn.execute(
+            "INSERT INTO carts (cart_id, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(cart_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (cart_id, payload, time.time())
+        )
 
+        self._saves += 1
+        if self._saves % self.PURGE_EVERY == 0:
+            conn.execute(
+                "DELETE FROM carts WHERE updated_at <= ?",
+                (time.time() - self.ttl,)
+            )
 
 
+def create_cart_store(kind=CART_STORE):
+    if kind == "memory":
+        return MemoryCartStore()
+    if kind == "sqlite":
+        return SQLiteCartStore()
+    raise ValueError(f"Unknown cart store: {kind}")
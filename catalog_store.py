@@ -0,0 +1,481 @@
+"""
+A catalog snapshot shared by every worker process on the host.
+
+    python catalog_store.py              # show the snapshot this host serves
+    python catalog_store.py --refresh    # reload it from Supabase now
+
+The catalog is written once per host to a compact binary file (see
+write_snapshot) that each gunicorn worker maps read-only: the pages
+live once in the OS page cache however many workers there are, and a
+product is only decoded when it is read. A new version is written
+beside the old one and renamed over it, so a worker sees either the
+old file or the new one, and picks the new one up on its next request.
+
+With CATALOG_STORE=shared, products.catalog_cache is a
+SharedCatalogCache; CATALOG_STORE=memory keeps one CatalogCache per
+worker instead.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections.abc import Sequence
+from contextlib import contextmanager
+
+from metrics import count_error
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so every process refreshes on its own
+    fcntl = None
+
+MAGIC = b"CATL"
+FORMAT = 1
+
+# magic, format, reserved, version (16 hex chars), read_at, product count, hash slots
+HEADER = struct.Struct("<4sHH16sdII")
+# Per product, in id order: key offset, key length, record offset, record length
+ENTRY = struct.Struct("<IIII")
+# Hash table over the ids: entry number + 1, or 0 for an empty slot
+SLOT = struct.Struct("<I")
+
+
+def encode_catalog(products):
+    """
+    Products -> ([(id key, JSON record), ...] in id order, version).
+    The version is a hash of the records, so it only changes when the
+    catalog does.
+    """
+    records = sorted(
+        (
+            str(product["id"]).encode("utf-8"),
+            json.dumps(product, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+        )
+        for product in products
+    )
+
+    digest = hashlib.sha256()
+    for _, record in records:
+        digest.update(record)
+        digest.update(b"\n")
+    return records, digest.hexdigest()[:16]
+
+
+def write_snapshot(path, records, version, read_at=None):
+    """
+    Writes encoded records, read from Supabase at `read_at` (default
+    now), as:
+
+        header | one ENTRY per product | hash slots | id key, record, ...
+
+    The slots are an open-addressing table keyed by crc32 of the id and
+    at most half full, so a product is found in a probe or two without
+    reading anything else. The file is written beside `path` and
+    renamed over it.
+    """
+    slot_count = 1 << max(1, 2 * len(records) - 1).bit_length()
+    slots = [0] * slot_count
+    for number, (key, _) in enumerate(records):
+        slot = zlib.crc32(key) & (slot_count - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (slot_count - 1)
+        slots[slot] = number + 1
+
+    offset = HEADER.size + ENTRY.size * len(records) + SLOT.size * slot_count
+    entries = []
+    for key, record in records:
+        entries.append(ENTRY.pack(offset, len(key), offset + len(key), len(record)))
+        offset += len(key) + len(record)
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, FORMAT, 0, version.encode("ascii"), read_at or time.time(), len(records), slot_count))
+            f.writelines(entries)
+            f.write(struct.pack(f"<{slot_count}I", *slots))
+            for key, record in records:
+                f.write(key)
+                f.write(record)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class CatalogSnapshot(Sequence):
+    """
+    A snapshot file mapped read-only: a sequence of product dicts, each
+    decoded from the mapping when it is read.
+
+    Nothing else is copied out of the file, so a worker's memory does
+    not grow with the catalog. A snapshot stays readable after a newer
+    file replaces it; it is unmapped once nothing refers to it.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, file_format, _, version, read_at, count, slot_count = HEADER.unpack_from(self._map)
+        self._slots_offset = HEADER.size + ENTRY.size * count
+        if magic != MAGIC or file_format != FORMAT or len(self._map) < self._slots_offset + SLOT.size * slot_count:
+            raise ValueError(f"Not a catalog snapshot: {path}")
+
+        self.file_id = (stat.st_dev, stat.st_ino)
+        self.version = version.decode("ascii")
+        self.read_at = read_at
+        self.size = len(self._map)
+        self._count = count
+        self._slot_mask = slot_count - 1
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("catalog snapshot index out of range")
+
+        _, _, offset, length = ENTRY.unpack_from(self._map, HEADER.size + ENTRY.size * index)
+        return json.loads(self._map[offset:offset + length])
+
+    def index_after(self, product_id):
+        """
+        Position of the first product whose id sorts after `product_id`
+        (compared as a string). Products are stored in id order, so this
+        is a binary search over the mapped ids.
+        """
+        key = str(product_id).encode("utf-8")
+        low, high = 0, self._count
+
+        while low < high:
+            middle = (low + high) // 2
+            key_offset, key_length, _, _ = ENTRY.unpack_from(self._map, HEADER.size + ENTRY.size * middle)
+            if self._map[key_offset:key_offset + key_length] <= key:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def find(self, product_id):
+        """
+        The product with this id (compared as a string), or None.
+        """
+        key = str(product_id).encode("utf-8")
+        slot = zlib.crc32(key) & self._slot_mask
+
+        while True:
+            number, = SLOT.unpack_from(self._map, self._slots_offset + SLOT.size * slot)
+            if not number:
+                return None
+
+            key_offset, key_length, offset, length = ENTRY.unpack_from(self._map, HEADER.size + ENTRY.size * (number - 1))
+            if self._map[key_offset:key_offset + key_length] == key:
+                return json.loads(self._map[offset:offset + length])
+
+            slot = (slot + 1) & self._slot_mask
+
+
+@contextmanager
+def host_lock(path, blocking=True):
+    """
+    An exclusive flock on `path`, so only one process on the host holds
+    it at a time. Yields whether it was taken (always, when blocking).
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    with open(path, "a") as f:
+        if fcntl is None:
+            yield True
+            return
+
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SharedCatalogCache:
+    """
+    CatalogCache for several workers on one host: get() returns the
+    mapped snapshot at `path` (a CatalogSnapshot), remapped whenever a
+    newer file has been renamed into place.
+
+    The file's mtime is when the catalog was last loaded. Once that is
+    `ttl` seconds ago, the first worker to take the host lock reloads
+    it in the background while every worker keeps serving the old one;
+    a worker with nothing to serve waits on the same lock and then reads
+    the file. Either way Supabase sees one load per host.
+
+    A failed load keeps the current file (of any age) and holds further
+    attempts on every worker off for `retry_delay` seconds. A worker
+    starting up does not serve a file older than `max_age` without
+    trying to reload it first.
+    """
+
+    def __init__(self, loader, path, ttl, max_age, retry_delay):
+        self.loader = loader
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.failed_path = f"{path}.failed"
+        self.ttl = ttl
+        self.max_age = max_age
+        self.retry_delay = retry_delay
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.remaps = 0
+        self._snapshot = None
+        self._startup = True
+        self._forced = False
+        self._refreshing = False
+        self._warming = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def get(self):
+        snapshot = self._cached()
+        return snapshot if snapshot is not None else self._load()
+
+    def peek(self):
+        """
+        What get() returns when it need not wait on Supabase: the mapped
+        snapshot, or None if there is none to serve yet (or it was
+        invalidated). Loading then starts on a background thread, so
+        later calls find it.
+        """
+        snapshot = self._cached()
+        if snapshot is None:
+            with self._lock:
+                warming, self._warming = self._warming, True
+            if not warming:
+                threading.Thread(target=self._warm, daemon=True).start()
+        return snapshot
+
+    def _cached(self):
+        snapshot, loaded_at = self._current()
+        age = time.time() - loaded_at
+
+        with self._lock:
+            startup, self._startup = self._startup, False
+            if snapshot is not None and not self._forced and not (startup and age > self.max_age):
+                self.hits += 1
+                if age >= self.ttl and not self._refreshing and not self._failed_recently():
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh, daemon=True).start()
+                return snapshot
+
+            self.misses += 1
+            return None
+
+    def _warm(self):
+        try:
+            self._load()
+        finally:
+            with self._lock:
+                self._warming = False
+
+    def invalidate(self):
+        """
+        Marks the snapshot stale for every worker on the host; this one
+        reloads it on its next get().
+        """
+        with self._lock:
+            self._forced = True
+
+        try:
+            os.utime(self.path, (0, 0))
+        except FileNotFoundError:
+            pass
+
+    def version(self, products):
+        """
+        Version of a snapshot returned by get(), or None if it is no
+        longer the current one.
+        """
+        with self._lock:
+            return products.version if products is self._snapshot and products is not None else None
+
+    def current_version(self):
+        """
+        Version of the snapshot on disk, or None if there is none yet.
+        Never loads or refreshes it.
+        """
+        snapshot = self._current()[0]
+        return snapshot.version if snapshot is not None else None
+
+    def last_good(self):
+        """
+        The snapshot on disk, whatever its age, or None. Never calls
+        Supabase.
+        """
+        return self._current()[0]
+
+    def read_at(self, products):
+        """
+        When a snapshot returned by get() was read from Supabase
+        (time.time()), or None.
+        """
+        return getattr(products, "read_at", None)
+
+    def stats(self):
+        snapshot, loaded_at = self._current()
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "store": "shared",
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "refreshes": self.refreshes,
+                "remaps": self.remaps,
+                "ttl": self.ttl,
+                "cached_products": len(snapshot) if snapshot is not None else 0,
+                "version": snapshot.version if snapshot is not None else None,
+                "age": (time.time() - loaded_at) if snapshot is not None else None,
+                "mapped_bytes": snapshot.size if snapshot is not None else 0
+            }
+
+    def _reset_after_fork(self):
+        # The mapping is inherited and stays valid; locks and threads are not
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self._warming = False
+
+    def _current(self):
+        """
+        The snapshot to serve (remapped if the file was replaced) and
+        the file's mtime; 0 if the file is gone.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return self._snapshot, 0.0
+
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.file_id != (stat.st_dev, stat.st_ino):
+            try:
+                snapshot = CatalogSnapshot(self.path)
+            except Exception as e:
+                print(f"[SharedCatalogCache] Could not map {self.path}: {e}")
+                count_error("catalog_cache.snapshot")
+                return self._snapshot, 0.0
+
+            with self._lock:
+                self._snapshot = snapshot
+                self.remaps += 1
+
+        return snapshot, stat.st_mtime
+
+    def _failed_recently(self):
+        try:
+            return time.time() - os.stat(self.failed_path).st_mtime < self.retry_delay
+        except FileNotFoundError:
+            return False
+
+    def _load(self):
+        with self._load_lock, host_lock(self.lock_path):
+            snapshot, loaded_at = self._current()
+            with self._lock:
+                forced, self._forced = self._forced, False
+
+            # Another worker (or thread) loaded it, or just tried, while we waited
+            if snapshot is not None and not forced:
+                if time.time() - loaded_at < self.ttl or self._failed_recently():
+                    return snapshot
+
+            return self._reload(snapshot, "catalog_cache.load")
+
+    def _refresh(self):
+        try:
+            with host_lock(self.lock_path, blocking=False) as locked:
+                if not locked:
+                    # Another worker is refreshing; its file is picked up when renamed
+                    return
+
+                snapshot, loaded_at = self._current()
+                if time.time() - loaded_at < self.ttl:
+                    return
+
+                self._reload(snapshot, "catalog_cache.refresh")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _reload(self, snapshot, where):
+        """
+        Loads the catalog and replaces the file (callers hold the host
+        lock). On errors the current snapshot is kept, or [] if none.
+        """
+        try:
+            read_at = time.time()
+            records, version = encode_catalog(self.loader())
+
+            if snapshot is not None and snapshot.version == version:
+                # Unchanged: only fresh again, so nobody has to remap
+                os.utime(self.path)
+            else:
+                write_snapshot(self.path, records, version, read_at)
+
+        except Exception as e:
+            print(f"[SharedCatalogCache] Load failed: {e}")
+            count_error(where)
+            # Every worker waits retry_delay before trying again
+            with open(self.failed_path, "a"):
+                os.utime(self.failed_path)
+            return snapshot if snapshot is not None else []
+
+        with self._lock:
+            self.refreshes += 1
+        return self._current()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--refresh", action="store_true", help="reload the catalog from Supabase now")
+    args = parser.parse_args()
+
+    from products import shared_catalog_cache
+
+    cache = shared_catalog_cache()
+    if args.refresh:
+        cache.invalidate()
+    cache.get()
+
+    stats = cache.stats()
+    if not stats["version"]:
+        print(f"no snapshot at {stats['path']}")
+        return 1
+
+    print(
+        f"{stats['path']}: version {stats['version']}, {stats['cached_products']} products, "
+        f"{stats['mapped_bytes']} B, loaded {stats['age']:.0f} s ago"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,28 +1,50 @@
-from supabase import create_client, Client
-from dotenv import load_dotenv
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import mimetypes
 import os
-
-# Load environment variables
-load_dotenv()
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-BUSINESS_ID = os.getenv("BUSINESS_ID")
-USER_ID = os.getenv("USER_ID")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise Exception("Supabase environment variables not set")
-
-# Create Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
+import threading
+import time
+
+from inventory import inventory
+from metrics import count_error, timed
+from products import public_url
+from supabase_client import get_client, BUSINESS_ID
+
+IMAGES_BUCKET = "uploaded-files"
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+UPLOAD_RETRIES = int(os.getenv("UPLOAD_RETRIES", "3"))
+UPLOAD_BACKOFF = float(os.getenv("UPLOAD_BACKOFF", "0.5"))
+HASH_CHUNK_SIZE = 64 * 1024
+
+# Customer lookups by normalized phone
+CUSTOMER_COLUMNS = "id,name,email,phone"
+CUSTOMER_CACHE_TTL = int(os.getenv("CUSTOMER_CACHE_TTL", "600"))
+CUSTOMER_CACHE_SIZE = int(os.getenv("CUSTOMER_CACHE_SIZE", "5000"))
+CUSTOMER_MISS_TTL = int(os.getenv("CUSTOMER_MISS_TTL", "30"))
+
+# Content hashes this process has already stored (or found stored)
+stored_digests = set()
+stored_digests_lock = threading.Lock()
+
+
+def order_quantities(products_json):
+    """
+    {product_id: units} ordered, summing lines of the same product.
+    """
+    quantities = {}
+    for product in products_json or []:
+        product_id = product["product_id"]
+        quantities[product_id] = quantities.get(product_id, 0) + (product.get("quantity") or 0)
+    return quantities
 
 
 class Checkout:
     def __init__(self):
-        self.supabase = supabase
+        self.supabase = get_client()
         self.business_id = BUSINESS_ID
 
+    @timed("checkout.check_customer")
     def check_customer(self, phone):
         """
         Checks if a customer exists for this business using phone number.
@@ -36,17 +58,7 @@ class Checkout:
         phone = self.clean_phone(phone)
 
         try:
-            response = (
-                self.supabase
-                .table("customers")
-                .select("*")
-                .eq("business_id", self.business_id)
-                .eq("phone", phone)
-                .limit(1)
-                .execute()
-            )
-
-            customer = response.data[0] if response.data else None
+            customer = self._find_customer(phone)
 
             return {
                 "exists": customer is not None,
@@ -55,6 +67,7 @@ class Checkout:
 
         except Exception as e:
             print("Error checking customer:", e)
+            count_error("checkout.check_customer")
 
             return {
                 "exists": False,
@@ -62,6 +75,31 @@ class Checkout:
                 "error": "Failed to check customer"
             }
 
+    def _find_customer(self, phone):
+        """
+        Customer row for an already-normalized phone, served from
+        customer_cache when possible. Unknown numbers are cached briefly
+        too, so retries do not hit the database. Errors are raised.
+        """
+        found, customer = customer_cache.get(phone)
+        if found:
+            return customer
+
+        response = (
+            self.supabase
+            .table("customers")
+            .select(CUSTOMER_COLUMNS)
+            .eq("business_id", self.business_id)
+            .eq("phone", phone)
+            .limit(1)
+            .execute()
+        )
+
+        customer = response.data[0] if response.data else None
+        customer_cache.put(phone, customer)
+
+        return customer
+
     def clean_phone(self, phone: str) -> str:
         """
         Cleans and normalizes a Zambian phone number.
@@ -106,43 +144,63 @@ class Checkout:
             # Normalize phone number first
             phone = self.clean_phone(phone)
 
-            response = (
-                self.supabase
-                .table("customers")
-                .select("*")
-                .eq("business_id", self.business_id)
-                .eq("phone", phone)
-                .limit(1)
-                .execute()
-            )
-
-            return response.data[0] if response.data else None
+            return self._find_customer(phone)
 
         except ValueError as ve:
             # Phone number validation failed
             print(f"Invalid phone number: {ve}")
+            count_error("checkout.invalid_phone")
             return None
 
         except Exception as e:
             # Database or unexpected error
             print(f"Error fetching customer: {e}")
+            count_error("checkout.get_customer")
             return None
 
-    def create_order(self, customer_id, delivery_location, total_amount):
+    @timed("checkout.create_order")
+    def create_order(self, customer_id, delivery_location, total_amount, products_json=None, hold_id=None):
         """
-        Creates an order row WITHOUT products.
-        Products are attached later.
+        Creates a complete order row, products included, in one insert.
+        Build products_json first with prepare_products_json.
+
+        With a hold_id (the cart's), the stock held for that cart is
+        confirmed as sold first; if some of it is no longer available
+        no order is created.
+
+        Returns:
+            {"id", "total_amount", "products", "delivery_location",
+             "order_status", "order_payment_status", ...} | None
+        """
+        quantities = order_quantities(products_json)
+        if hold_id is not None and not inventory.confirm(hold_id, quantities):
+            print("Not enough stock for order")
+            count_error("checkout.out_of_stock")
+            return None
+
+        orders = self.create_orders([{
+            "customer_id": customer_id,
+            "delivery_location": delivery_location,
+            "total_amount": total_amount,
+            "products_json": products_json
+        }])
+
+        if not orders and hold_id is not None:
+            inventory.revert(hold_id, quantities)
+
+        return orders[0] if orders else None
+
+    def create_orders(self, orders):
+        """
+        Inserts several complete orders in a single request, for when
+        a batch of checkouts lands at once.
+
+        orders: [{"customer_id", "delivery_location", "total_amount",
+                  "products_json"}, ...]
+        Returns the inserted rows in the same order, or [] on failure.
         """
         try:
-            payload = {
-                "business_id": self.business_id,
-                "customer_id": customer_id,
-                "total_amount": str(total_amount),  # keep consistent with DB
-                "order_status": "pending",
-                "order_payment_status": "pending",
-                "delivery_location": delivery_location,
-                "products": []  # initialize as empty JSON array
-            }
+            payload = self._order_rows(orders)
 
             response = (
                 self.supabase
@@ -151,52 +209,185 @@ class Checkout:
                 .execute()
             )
 
-            if not response.data:
+            if not response.data or len(response.data) != len(payload):
                 raise Exception("Order insert failed")
 
-            return response.data[0]
+            return response.data
 
         except Exception as e:
             print("Error creating order:", e)
-            return None
+            count_error("checkout.create_order")
+            return []
 
-    def upload_order_images(self, order_id, cart_items):
+    def get_order(self, order_id):
         """
-        Upload product images and return products JSON
-        matching DB structure exactly.
+        Returns {"id", "total_amount", "products"} of one of this
+        business's orders, or None. Errors are left to the caller.
         """
+        response = (
+            self.supabase
+            .table("orders")
+            .select("id,total_amount,products")
+            .eq("business_id", self.business_id)
+            .eq("id", order_id)
+            .limit(1)
+            .execute()
+        )
+        return response.data[0] if response.data else None
+
+    def _order_rows(self, orders):
+        return [
+            {
+                "business_id": self.business_id,
+                "customer_id": order["customer_id"],
+                "total_amount": str(order["total_amount"]),  # keep consistent with DB
+                "order_status": "pending",
+                "order_payment_status": "pending",
+                "delivery_location": order["delivery_location"],
+                "products": order.get("products_json") or []
+            }
+            for order in orders
+        ]
+
+    @timed("checkout.prepare_products_json")
+    def prepare_products_json(self, cart_items):
+        """
+        Builds the order's products JSON before anything is uploaded.
+        Image paths are content hashes of the local files, so their
+        public URLs are known up front; upload_order_images later stores
+        the files at exactly those paths.
+        """
+        image_urls = {}
         products_json = []
 
         for item in cart_items:
-            image_url = None
             local_path = item.get("local_image_path")
+            if local_path and local_path not in image_urls:
+                image_urls[local_path] = public_url(self.image_storage_path(local_path), IMAGES_BUCKET)
 
-            if local_path:
-                filename = os.path.basename(local_path)
-                storage_path = f"orders/{order_id}/{filename}"
+            products_json.append({
+                "product_id": item["product_id"],
+                "quantity": item["quantity"],
+                "instruction": item.get("instruction"),
+                "image_url": image_urls.get(local_path) if local_path else None
+            })
 
-                with open(local_path, "rb") as f:
-                    self.supabase.storage \
-                        .from_("uploaded-files") \
-                        .upload(storage_path, f.read())
+        return products_json
+
+    @timed("checkout.upload_order_images")
+    def upload_order_images(self, order_id, cart_items):
+        """
+        Upload product images and return products JSON
+        matching DB structure exactly.
 
-                image_url = (
-                    f"{SUPABASE_URL}/storage/v1/object/public/"
-                    f"uploaded-files/{storage_path}"
-                )
+        Images are stored by content hash (orders/images/{sha256}{ext}), so
+        the same file is never uploaded twice. Files are hashed and sent
+        in chunks straight from disk, uploads run concurrently on up to
+        UPLOAD_WORKERS threads, and transient failures are retried with
+        exponential backoff.
+        """
+        local_paths = list(dict.fromkeys(
+            item["local_image_path"] for item in cart_items
+            if item.get("local_image_path")
+        ))
+        image_urls = {}
+
+        if local_paths:
+            workers = max(1, min(UPLOAD_WORKERS, len(local_paths)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="order-upload") as executor:
+                storage_paths = executor.map(self.upload_image, local_paths)
+                for local_path, storage_path in zip(local_paths, storage_paths):
+                    image_urls[local_path] = public_url(storage_path, IMAGES_BUCKET)
+
+        products_json = []
 
+        for item in cart_items:
             products_json.append({
                 "product_id": item["product_id"],
                 "quantity": item["quantity"],
                 "instruction": item.get("instruction"),
-                "image_url": image_url
+                "image_url": image_urls.get(item.get("local_image_path"))
             })
 
         return products_json
 
+    def image_storage_path(self, local_path):
+        """
+        Content-addressed storage path for a local file, hashed in chunks.
+        """
+        digest = hashlib.sha256()
+        with open(local_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+
+        extension = os.path.splitext(local_path)[1].lower()
+        return f"orders/images/{digest.hexdigest()}{extension}"
+
+    @timed("checkout.upload_image")
+    def upload_image(self, local_path):
+        """
+        Uploads one file unless its content is already stored.
+        Returns the storage path.
+        """
+        storage_path = self.image_storage_path(local_path)
+
+        with stored_digests_lock:
+            if storage_path in stored_digests:
+                return storage_path
+
+        content_type = mimetypes.guess_type(local_path)[0] or "application/octet-stream"
+
+        for attempt in range(UPLOAD_RETRIES + 1):
+            try:
+                # An open file is streamed by the HTTP client, not read into memory
+                with open(local_path, "rb") as f:
+                    self.supabase.storage \
+                        .from_(IMAGES_BUCKET) \
+                        .upload(storage_path, f, {"content-type": content_type})
+                break
+
+            except Exception as e:
+                outcome = self._upload_error_kind(e)
+
+                if outcome == "duplicate":
+                    # Same content uploaded before (by us or another worker)
+                    break
+
+                if outcome != "transient" or attempt == UPLOAD_RETRIES:
+                    raise
+
+                print(f"Upload retry {attempt + 1} for {storage_path}: {e}")
+                count_error("checkout.upload_retry")
+                time.sleep(UPLOAD_BACKOFF * (2 ** attempt))
+
+        with stored_digests_lock:
+            stored_digests.add(storage_path)
+
+        return storage_path
+
+    def _upload_error_kind(self, error):
+        """
+        "duplicate" (already stored), "transient" (worth retrying) or "fatal".
+        Without an HTTP status only network errors and timeouts are
+        retried; anything else (a local file error, a bug) fails at once.
+        """
+        import httpx  # already loaded by the supabase client
+
+        status = str(getattr(error, "status", None) or "")
+
+        if status == "409" or getattr(error, "code", None) == "Duplicate":
+            return "duplicate"
+        if not status:
+            return "transient" if isinstance(error, (httpx.TransportError, TimeoutError)) else "fatal"
+        if status in ("408", "429") or status.startswith("5"):
+            return "transient"
+        return "fatal"
+
+    @timed("checkout.attach_products_to_order")
     def attach_products_to_order(self, order_id, products_json):
         """
         Attaches finalized products JSON to an order.
+        Returns True on success.
         """
         try:
             (
@@ -206,9 +397,35 @@ class Checkout:
                 .eq("id", order_id)
                 .execute()
             )
+            return True
         except Exception as e:
             print("Error attaching products:", e)
+            count_error("checkout.attach_products")
+            return False
 
+    @timed("checkout.finalise_order")
+    def finalise_order(self, order_id, cart_items):
+        """
+        Background half of checkout (run by the job queue): uploads the
+        order's images and removes the temp files. The order row already
+        holds the final products JSON (see create_order). Raises on
+        failure so the job is retried.
+        """
+        self.upload_order_images(
+            order_id=order_id,
+            cart_items=cart_items
+        )
+
+        for item in cart_items:
+            local_path = item.get("local_image_path")
+            if local_path and os.path.exists(local_path):
+                try:
+                    os.remove(local_path)
+                except Exception as e:
+                    print("Temp file cleanup error:", e)
+                    count_error("checkout.temp_file_cleanup")
+
+    @timed("checkout.create_customer")
     def create_customer(self, name, email, phone, location, gender):
         """
         Creates a new customer for this business and returns the customer record.
@@ -217,14 +434,7 @@ class Checkout:
             # Normalize phone number
             phone = self.clean_phone(phone)
 
-            payload = {
-                "business_id": self.business_id,
-                "name": name,
-                "email": email,
-                "phone": phone,
-                "location": location,
-                "gender": gender
-            }
+            payload = self._customer_row(name, email, phone, location, gender)
 
             response = (
                 self.supabase
@@ -236,14 +446,94 @@ class Checkout:
             if not response.data:
                 raise Exception("Customer creation failed")
 
-            return response.data[0]
+            customer = response.data[0]
+            self._remember_customer(phone, customer)
+
+            return customer
 
         except ValueError as ve:
             print(f"Customer phone validation failed: {ve}")
+            count_error("checkout.invalid_phone")
             return None
 
         except Exception as e:
             print(f"Error creating customer: {e}")
+            count_error("checkout.create_customer")
             return None
 
+    def _customer_row(self, name, email, phone, location, gender):
+        return {
+            "business_id": self.business_id,
+            "name": name,
+            "email": email,
+            "phone": phone,
+            "location": location,
+            "gender": gender
+        }
+
+    def _remember_customer(self, phone, customer):
+        customer_cache.put(phone, {
+            column: customer.get(column)
+            for column in CUSTOMER_COLUMNS.split(",")
+        })
+
+
+class CustomerCache:
+    """
+    Customer rows keyed by normalized phone, bounded to `max_size`
+    entries (least recently used evicted first).
+
+    Known customers are kept for `ttl` seconds; numbers with no customer
+    are kept for the much shorter `miss_ttl`, so a customer created by
+    another worker is picked up quickly.
+    """
+
+    MISSING = object()
+
+    def __init__(self, max_size=CUSTOMER_CACHE_SIZE, ttl=CUSTOMER_CACHE_TTL, miss_ttl=CUSTOMER_MISS_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, phone):
+        """
+        Returns:
+            (found: bool, customer: dict | None)
+        """
+        with self._lock:
+            entry = self._entries.get(phone)
+            if entry is None:
+                return False, None
+
+            expires_at, customer = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[phone]
+                return False, None
+
+            self._entries.move_to_end(phone)
+            return True, (None if customer is self.MISSING else dict(customer))
+
+    def put(self, phone, customer):
+        ttl = self.ttl if customer else self.miss_ttl
+
+        with self._lock:
+            self._entries[phone] = (
+                time.monotonic() + ttl,
+                dict(customer) if customer else self.MISSING
+            )
+            self._entries.move_to_end(phone)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, phone):
+        with self._lock:
+            self._entries.pop(phone, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
 
+customer_cache = CustomerCache()
@@ -0,0 +1,82 @@
+"""
+Fills the products.image_files manifest: the file names stored under
+each product's products/{id}/ folder. Catalog loads use it instead of
+listing every folder, which is one storage call per product. Until it
+is set up they keep listing folders.
+
+1. Add the column once (Supabase SQL editor):
+
+    alter table products add column if not exists image_files text[];
+
+2. Backfill it:
+
+    python image_manifests.py            # products without a manifest
+    python image_manifests.py --all      # re-list every product
+
+3. Set IMAGE_MANIFESTS=1 for the app, so catalog pages select the column.
+
+After that, keep it current by calling POST /admin/products/<id>/images
+whenever a product's images change (e.g. from a storage webhook on
+products/).
+"""
+import argparse
+import sys
+import time
+
+from products import Products
+from supabase_client import get_client, BUSINESS_ID
+
+
+def products_to_refresh(client, refresh_all=False):
+    query = (
+        client
+        .table("products")
+        .select("id")
+        .eq("business_id", BUSINESS_ID)
+    )
+    if not refresh_all:
+        query = query.is_("image_files", "null")
+    return [row["id"] for row in query.execute().data or []]
+
+
+def backfill(client, refresh_all=False):
+    """
+    Returns:
+        {"products", "updated", "failed"}
+    """
+    products = Products(client=client)
+    product_ids = products_to_refresh(client, refresh_all)
+
+    failed = 0
+    for product_id in product_ids:
+        try:
+            products.refresh_image_manifest(product_id)
+        except Exception as e:
+            # Left without a manifest: loads keep listing its folder
+            print(f"Could not list images for product {product_id}: {e}")
+            failed += 1
+
+    return {
+        "products": len(product_ids),
+        "updated": len(product_ids) - failed,
+        "failed": failed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--all", action="store_true", help="re-list products that already have a manifest")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = backfill(get_client(), refresh_all=args.all)
+
+    print(
+        f"{result['products']} products, updated {result['updated']}, "
+        f"failed {result['failed']} in {time.perf_counter() - started:.2f}s"
+    )
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
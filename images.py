@@ -0,0 +1,287 @@
+"""
+Resized WebP/AVIF derivatives of product and hero images.
+
+    python images.py                 # warm every catalog and static image
+    python images.py --static-only
+
+Derivatives are made on first request (/img/<format>/<width>/<source>)
+or ahead of time with the warm command, and cached on local disk keyed
+by the hash of the source bytes:
+
+    IMAGE_CACHE_DIR/sources/<digest><ext>          original, fetched once
+    IMAGE_CACHE_DIR/index/<hash of source path>    source path -> digest
+    IMAGE_CACHE_DIR/derived/<dd>/<digest>-<width>.<format>
+
+Sources are storage objects under products/{id}/ or files under
+static/images/. Pillow is only imported when an image is actually
+resized; without it the /img routes redirect to the original.
+"""
+import argparse
+import hashlib
+import importlib.util
+import io
+import os
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+from metrics import count_error
+from supabase_client import get_client, SUPABASE_URL
+
+IMAGES_BUCKET = "uploaded-files"
+STATIC_ROOT = os.path.dirname(os.path.abspath(__file__))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+IMAGE_WIDTHS = tuple(int(w) for w in os.getenv("IMAGE_WIDTHS", "320,640,1280").split(","))
+IMAGE_FORMATS = tuple(os.getenv("IMAGE_FORMATS", "avif,webp").split(","))
+IMAGE_SOURCE_TTL = int(os.getenv("IMAGE_SOURCE_TTL", "86400"))
+IMAGE_MAX_AGE = int(os.getenv("IMAGE_MAX_AGE", "86400"))
+
+SOURCE_PREFIXES = ("products/", "static/images/")
+MIMETYPES = {"avif": "image/avif", "webp": "image/webp"}
+QUALITY = {"avif": 55, "webp": 80}
+
+
+class ImageDerivatives:
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, widths=IMAGE_WIDTHS, formats=IMAGE_FORMATS,
+                 source_ttl=IMAGE_SOURCE_TTL, client=None):
+        self.cache_dir = cache_dir
+        self.widths = widths
+        self.requested_formats = formats
+        self.source_ttl = source_ttl
+        self._client = client
+        self._formats = None
+        self._building = {}
+        self._lock = threading.Lock()
+
+    @property
+    def supabase(self):
+        if self._client is None:
+            self._client = get_client()
+        return self._client
+
+    @property
+    def formats(self):
+        """
+        The configured formats this Pillow build can encode
+        (empty without Pillow).
+        """
+        if self._formats is None:
+            if importlib.util.find_spec("PIL") is None:
+                self._formats = ()
+            else:
+                from PIL import features
+                self._formats = tuple(
+                    fmt for fmt in self.requested_formats
+                    if fmt in MIMETYPES and features.check(fmt)
+                )
+        return self._formats
+
+    # -------------------------------
+    # URLS
+    # -------------------------------
+
+    def url(self, source, width, fmt):
+        return f"/img/{fmt}/{width}/{quote(source)}"
+
+    def srcset(self, source, fmt):
+        return ", ".join(f"{self.url(source, width, fmt)} {width}w" for width in self.widths)
+
+    def picture(self, source):
+        """
+        Everything a template needs for a responsive image of `source`:
+
+            {"sources": [{"type", "srcset"}, ...],   best format first
+             "hero": [{"type", "url"}, ...]}         widest derivative
+
+        or None when no derivative format is available.
+        """
+        if not self.formats:
+            return None
+
+        return {
+            "sources": [
+                {"type": MIMETYPES[fmt], "srcset": self.srcset(source, fmt)}
+                for fmt in self.formats
+            ],
+            "hero": [
+                {"type": MIMETYPES[fmt], "url": self.url(source, self.widths[-1], fmt)}
+                for fmt in self.formats
+            ]
+        }
+
+    def original_url(self, source):
+        if source.startswith("static/"):
+            return f"/{quote(source)}"
+        return f"{SUPABASE_URL}/storage/v1/object/public/{IMAGES_BUCKET}/{quote(source)}"
+
+    def is_valid(self, source, width, fmt):
+        return (
+            source.startswith(SOURCE_PREFIXES)
+            and ".." not in source.split("/")
+            and width in self.widths
+            and fmt in self.formats
+        )
+
+    # -------------------------------
+    # DERIVATIVES
+    # -------------------------------
+
+    def derivative_path(self, source, width, fmt):
+        """
+        Local path of the derivative, generating it (and fetching the
+        source) first if needed. Concurrent requests for the same file
+        in this process wait for one build.
+        """
+        digest = self._source_digest(source)
+        path = self._derived_path(digest, width, fmt)
+        if os.path.exists(path):
+            return path
+
+        with self._lock:
+            building = self._building.get(path)
+            if building is None:
+                building = self._building[path] = threading.Lock()
+
+        with building:
+            try:
+                if not os.path.exists(path):
+                    data = self._read_file(self._source_path(digest, source))
+                    self._write_file(path, render(data, width, fmt))
+            finally:
+                with self._lock:
+                    self._building.pop(path, None)
+
+        return path
+
+    def warm(self, sources):
+        """
+        Builds every width/format of each source.
+        Returns {"sources", "built", "failed"}.
+        """
+        built = failed = 0
+        for source in sources:
+            for fmt in self.formats:
+                for width in self.widths:
+                    try:
+                        self.derivative_path(source, width, fmt)
+                        built += 1
+                    except Exception as e:
+                        print(f"[ImageDerivatives] {source} {width}w {fmt} failed: {e}")
+                        count_error("images.warm")
+                        failed += 1
+
+        return {"sources": len(sources), "built": built, "failed": failed}
+
+    def _source_digest(self, source):
+        index_path = os.path.join(
+            self.cache_dir, "index",
+            hashlib.sha256(source.encode("utf-8")).hexdigest()[:32]
+        )
+
+        if os.path.exists(index_path) and not self._index_is_stale(index_path, source):
+            with open(index_path) as f:
+                return f.read().strip()
+
+        data = self._fetch_source(source)
+        digest = hashlib.sha256(data).hexdigest()
+
+        source_path = self._source_path(digest, source)
+        if not os.path.exists(source_path):
+            self._write_file(source_path, data)
+        self._write_file(index_path, digest.encode("ascii"))
+
+        return digest
+
+    def _index_is_stale(self, index_path, source):
+        indexed_at = os.path.getmtime(index_path)
+        if source.startswith("static/"):
+            return os.path.getmtime(os.path.join(STATIC_ROOT, source)) > indexed_at
+        return time.time() - indexed_at > self.source_ttl
+
+    def _fetch_source(self, source):
+        if source.startswith("static/"):
+            return self._read_file(os.path.join(STATIC_ROOT, source))
+
+        return self.supabase.storage.from_(IMAGES_BUCKET).download(source)
+
+    def _source_path(self, digest, source):
+        ext = os.path.splitext(source)[1].lower()
+        return os.path.join(self.cache_dir, "sources", digest + ext)
+
+    def _derived_path(self, digest, width, fmt):
+        return os.path.join(self.cache_dir, "derived", digest[:2], f"{digest}-{width}.{fmt}")
+
+    def _read_file(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _write_file(self, path, data):
+        # Written beside the target and renamed: readers never see half a file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+def render(data, width, fmt):
+    """
+    Resizes image bytes to at most `width` pixels wide (never upscaling)
+    and encodes them as `fmt`.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), Image.LANCZOS)
+
+        out = io.BytesIO()
+        image.save(out, fmt.upper(), quality=QUALITY[fmt])
+        return out.getvalue()
+
+
+def static_sources():
+    folder = os.path.join(STATIC_ROOT, "static", "images")
+    return sorted(
+        f"static/images/{name}" for name in os.listdir(folder)
+        if os.path.splitext(name)[1].lower() in (".jpg", ".jpeg", ".png", ".webp")
+    )
+
+
+derivatives = ImageDerivatives()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--static-only", action="store_true", help="skip catalog images")
+    args = parser.parse_args()
+
+    if not derivatives.formats:
+        print("No image formats available: install Pillow (with AVIF/WebP support)")
+        return 1
+
+    sources = static_sources()
+    if not args.static_only:
+        from products import Products
+
+        for product in Products()._fetch_products():
+            sources.extend(product.get("image_paths") or [])
+
+    started = time.perf_counter()
+    result = derivatives.warm(sources)
+
+    print(
+        f"{result['sources']} sources, {result['built']} derivatives ready, "
+        f"{result['failed']} failed in {time.perf_counter() - started:.2f}s "
+        f"({', '.join(derivatives.formats)} at {', '.join(map(str, derivatives.widths))}w)"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Bulk-imports customers from a CSV file (WhatsApp exports, market-stall
+lists, ...) into the customers table.
+
+    python import_customers.py customers.csv --rejects rejects.csv
+
+Phones are normalized in bulk with phones.normalize_phones, duplicates
+within the file are dropped (first row wins), phones that already exist
+for this business are skipped, and the rest are inserted in batches.
+A batch that fails is reported (and written to --rejects) and the
+import carries on; running it again only inserts what is still missing.
+"""
+import argparse
+import csv
+import sys
+import time
+
+from metrics import count_error
+from phones import normalize_phones
+from supabase_client import get_client, BUSINESS_ID
+
+CUSTOMER_FIELDS = ("name", "email", "location", "gender")
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def existing_phones(client, phones):
+    response = (
+        client
+        .table("customers")
+        .select("phone")
+        .eq("business_id", BUSINESS_ID)
+        .in_("phone", phones)
+        .execute()
+    )
+    return {row["phone"] for row in response.data or []}
+
+
+def import_customers(client, rows, phone_column="phone", chunk_size=500, dry_run=False):
+    """
+    Returns:
+        {"read", "rejected", "duplicates", "existing", "inserted", "failed", "rejects"}
+
+    Rows of a batch that could not be checked or inserted count as
+    failed and are added to rejects.
+    """
+    phones, rejects = normalize_phones(row.get(phone_column) for row in rows)
+    rejected = len(rejects)
+
+    customers = {}
+    lines = {}
+    duplicates = 0
+    for index, (row, phone) in enumerate(zip(rows, phones)):
+        if phone is None:
+            continue
+        if phone in customers:
+            duplicates += 1
+            continue
+
+        customer = {"business_id": BUSINESS_ID, "phone": phone}
+        for field in CUSTOMER_FIELDS:
+            value = (row.get(field) or "").strip()
+            customer[field] = value or None
+        customers[phone] = customer
+        lines[phone] = index
+
+    existing = 0
+    inserted = 0
+    failed = 0
+    for batch in chunked(list(customers.values()), chunk_size):
+        try:
+            known = existing_phones(client, [customer["phone"] for customer in batch])
+            new = [customer for customer in batch if customer["phone"] not in known]
+
+            if new and not dry_run:
+                client.table("customers").insert(new).execute()
+        except Exception as e:
+            print(f"[import_customers] Batch of {len(batch)} failed: {e}")
+            count_error("import_customers.batch")
+            failed += len(batch)
+            rejects.extend(
+                {"row": lines[customer["phone"]], "value": customer["phone"], "reason": f"insert failed: {e}"}
+                for customer in batch
+            )
+            continue
+
+        existing += len(batch) - len(new)
+        inserted += len(new)
+
+    return {
+        "read": len(rows),
+        "rejected": rejected,
+        "duplicates": duplicates,
+        "existing": existing,
+        "inserted": inserted,
+        "failed": failed,
+        "rejects": rejects
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv_path")
+    parser.add_argument("--phone-column", default="phone")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--rejects", help="write rejected rows to this CSV file")
+    parser.add_argument("--dry-run", action="store_true", help="check and count, but insert nothing")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rows = read_rows(args.csv_path)
+    result = import_customers(
+        get_client(),
+        rows,
+        phone_column=args.phone_column,
+        chunk_size=args.chunk_size,
+        dry_run=args.dry_run
+    )
+
+    if args.rejects:
+        with open(args.rejects, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=["row", "value", "reason"])
+            writer.writeheader()
+            for reject in result["rejects"]:
+                # Report spreadsheet line numbers (header is line 1)
+                writer.writerow({**reject, "row": reject["row"] + 2})
+
+    print(
+        f"read {result['read']}, rejected {result['rejected']}, "
+        f"duplicates {result['duplicates']}, already existing {result['existing']}, "
+        f"{'would insert' if args.dry_run else 'inserted'} {result['inserted']}, "
+        f"failed {result['failed']} in {time.perf_counter() - started:.2f}s"
+    )
+
+    return 1 if result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,474 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from catalog_store import host_lock
+from jobs import DATA_DIR
+from metrics import count_error, timed
+from products import catalog_cache
+from supabase_client import get_client
+
+# Products without a value in this column are not stock-tracked
+INVENTORY_STOCK_COLUMN = os.getenv("INVENTORY_STOCK_COLUMN", "stock")
+# Stock counts and holds, shared by every worker on the host
+INVENTORY_DB_PATH = os.getenv("INVENTORY_DB_PATH", os.path.join(DATA_DIR, "inventory.sqlite3"))
+# How long units in a cart stay held for it after its last change
+INVENTORY_HOLD_SECONDS = int(os.getenv("INVENTORY_HOLD_SECONDS", "900"))
+INVENTORY_FLUSH_INTERVAL = float(os.getenv("INVENTORY_FLUSH_INTERVAL", "5"))
+INVENTORY_FLUSH_RETRIES = 3
+INVENTORY_FLUSH_BATCH = 100
+
+
+class Inventory:
+    """
+    Stock counts kept in a local SQLite file that every worker on the
+    host shares, so cart actions never wait on Supabase and no two
+    workers can hold or sell the same unit.
+
+    For every tracked product:
+
+        available = stock - sold - held
+
+    stock is the database value as last known (seeded from the cached
+    catalog, re-read by each flush), sold counts confirmed units not yet
+    written back, and held is what carts have reserved. Holds belong to
+    a holder (the cart id) and lapse `hold_seconds` after their last
+    change. Every change is checked and made in one transaction, so a
+    cart that asks for more than is available is refused whichever
+    worker it reaches.
+
+    Checkout.create_order confirms a cart's holds as sold. A background
+    thread (one per host at a time) writes sold units back every
+    `flush_interval` seconds: one read of the current stock per batch,
+    then a conditional update per product (only if stock is still what
+    was read). If an admin or another host changed it meanwhile, the row
+    is read again and retried; a sale that no longer fits is written
+    down to 0 and reported as oversold.
+    """
+
+    def __init__(self, cache, column=INVENTORY_STOCK_COLUMN, hold_seconds=INVENTORY_HOLD_SECONDS,
+                 flush_interval=INVENTORY_FLUSH_INTERVAL, path=INVENTORY_DB_PATH):
+        self.cache = cache
+        self.column = column
+        self.hold_seconds = hold_seconds
+        self.flush_interval = flush_interval
+        self.path = path
+        self.refused = 0
+        self.confirmed = 0
+        self.expired = 0
+        self.flushed = 0
+        self.conflicts = 0
+        self.oversold = deque(maxlen=100)
+        self._version = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+        atexit.register(self._flush_at_exit)
+
+    # -------------------------------
+    # HOLDS
+    # -------------------------------
+
+    def reserve(self, holder, product_id, units):
+        """
+        Sets `holder`'s hold on a product to `units` (0 releases it).
+        Returns False, leaving the hold as it was, if that is more than
+        is available. Untracked products always succeed.
+        """
+        product_id = str(product_id)
+        self._sync()
+
+        with self._transaction() as conn:
+            counts = self._counts(conn, product_id, holder)
+            if counts is None:
+                return True
+
+            free, held = counts
+            if units > held and free < units:
+                with self._lock:
+                    self.refused += 1
+                return False
+
+            self._set_hold(conn, holder, product_id, units)
+            return True
+
+    def available(self, product_id, holder=None):
+        """
+        Units that `holder` could hold in total (its own hold included),
+        or None for an untracked product.
+        """
+        product_id = str(product_id)
+        self._sync()
+
+        counts = self._counts(self._connection(), product_id, holder)
+        return max(0, counts[0]) if counts is not None else None
+
+    def holds(self, holder):
+        """
+        {product_id: units} held by `holder`, e.g. to restore() later.
+        """
+        rows = self._connection().execute(
+            "SELECT product_id, units FROM holds WHERE holder = ? AND expires_at > ?",
+            (holder, time.time())
+        )
+        return dict(rows)
+
+    def restore(self, holder, holds):
+        """
+        Puts back holds taken with holds(), whatever is available now
+        (they were already counted before).
+        """
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM holds WHERE holder = ?", (holder,))
+            for product_id, units in holds.items():
+                if self._is_tracked(conn, product_id):
+                    self._set_hold(conn, holder, product_id, units)
+
+    # -------------------------------
+    # ORDERS
+    # -------------------------------
+
+    def confirm(self, holder, quantities):
+        """
+        Turns `holder`'s holds into sold units for an order,
+        quantities = {product_id: units}. All or nothing: returns False
+        if any tracked product is short, and changes nothing.
+        The holder's other holds are released.
+        """
+        quantities = {str(product_id): units for product_id, units in quantities.items()}
+        self._sync()
+
+        with self._transaction() as conn:
+            tracked = {}
+            for product_id, units in quantities.items():
+                counts = self._counts(conn, product_id, holder)
+                if counts is None:
+                    continue
+                if counts[0] < units:
+                    with self._lock:
+                        self.refused += 1
+                    return False
+                tracked[product_id] = units
+
+            conn.execute("DELETE FROM holds WHERE holder = ?", (holder,))
+            conn.executemany(
+                "UPDATE stock SET sold = sold + ? WHERE product_id = ?",
+                [(units, product_id) for product_id, units in tracked.items()]
+            )
+
+        with self._lock:
+            self.confirmed += 1
+        return True
+
+    def revert(self, holder, quantities):
+        """
+        Undoes confirm() when the order could not be created: the units
+        are held for `holder` again (and written back as returned if a
+        flush already took them).
+        """
+        quantities = {str(product_id): units for product_id, units in quantities.items()}
+
+        with self._transaction() as conn:
+            for product_id, units in quantities.items():
+                counts = self._counts(conn, product_id, holder)
+                if counts is None:
+                    continue
+                conn.execute("UPDATE stock SET sold = sold - ? WHERE product_id = ?", (units, product_id))
+                self._set_hold(conn, holder, product_id, counts[1] + units)
+
+        with self._lock:
+            self.confirmed -= 1
+
+    # -------------------------------
+    # WRITE-BACK
+    # -------------------------------
+
+    @timed("inventory.flush")
+    def flush(self, client=None):
+        """
+        Writes sold units back to the products table.
+        Returns how many products were written (0 while another worker
+        on the host is flushing: it writes everyone's).
+        """
+        with self._flush_lock, host_lock(f"{self.path}.flush.lock", blocking=False) as locked:
+            if not locked:
+                return 0
+
+            pending = self._connection().execute(
+                "SELECT product_id, sold FROM stock WHERE sold != 0"
+            ).fetchall()
+            if not pending:
+                return 0
+
+            supabase = client or get_client()
+            written = 0
+
+            for start in range(0, len(pending), INVENTORY_FLUSH_BATCH):
+                batch = dict(pending[start:start + INVENTORY_FLUSH_BATCH])
+                rows = (
+                    supabase
+                    .table("products")
+                    .select(f"id,{self.column}")
+                    .in_("id", list(batch))
+                    .execute()
+                ).data or []
+                current = {str(row["id"]): row.get(self.column) for row in rows}
+
+                for product_id, units in batch.items():
+                    if self._write_back(supabase, product_id, units, current.get(product_id)):
+                        written += 1
+
+            return written
+
+    def _write_back(self, supabase, product_id, units, stock):
+        for _ in range(INVENTORY_FLUSH_RETRIES):
+            if stock is None:
+                # Deleted, or no longer tracked: nothing to write
+                self._written(product_id, units, None)
+                return False
+
+            new_stock = stock - units
+            if new_stock < 0:
+                print(f"[Inventory] Oversold {product_id}: {units} sold, {stock} left in the database")
+                count_error("inventory.oversold")
+                self.oversold.append({"product_id": product_id, "sold": units, "stock": stock, "at": time.time()})
+                new_stock = 0
+
+            response = (
+                supabase
+                .table("products")
+                .update({self.column: new_stock})
+                .eq("id", product_id)
+                .eq(self.column, stock)
+                .execute()
+            )
+            if response.data:
+                self._written(product_id, units, new_stock)
+                return True
+
+            # Changed since it was read (an admin, another host): read again
+            with self._lock:
+                self.conflicts += 1
+            stock = self._read_stock(supabase, product_id)
+
+        # Still contended: left for the next flush
+        return False
+
+    def _read_stock(self, supabase, product_id):
+        response = (
+            supabase
+            .table("products")
+            .select(f"id,{self.column}")
+            .eq("id", product_id)
+            .limit(1)
+            .execute()
+        )
+        return response.data[0].get(self.column) if response.data else None
+
+    def _written(self, product_id, units, stock):
+        with self._transaction() as conn:
+            if stock is None:
+                conn.execute("DELETE FROM stock WHERE product_id = ?", (product_id,))
+                return
+
+            # Known as of now: only a catalog read after this replaces it (see _sync)
+            conn.execute(
+                "UPDATE stock SET units = ?, sold = sold - ?, known_at = ? WHERE product_id = ?",
+                (stock, units, time.time(), product_id)
+            )
+
+        with self._lock:
+            self.flushed += units
+
+    def expire(self):
+        """
+        Drops holds that have lapsed (they no longer count either way).
+        """
+        with self._transaction() as conn:
+            expired = conn.execute("DELETE FROM holds WHERE expires_at <= ?", (time.time(),)).rowcount
+
+        with self._lock:
+            self.expired += expired
+
+    def ensure_running(self):
+        """
+        Starts the flush thread in this process if it is not running yet.
+        Safe to call on every request, and after a fork.
+        """
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="inventory-flush", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                self.expire()
+            except Exception as e:
+                # Sold units stay pending until a flush gets through
+                print(f"[Inventory] Flush failed: {e}")
+                count_error("inventory.flush")
+
+    def _flush_at_exit(self):
+        if self._pid is None:
+            # Never started here (no flusher, nothing sold through this process)
+            return
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"[Inventory] Flush at exit failed: {e}")
+            count_error("inventory.flush")
+
+    def stats(self):
+        conn = self._connection()
+        tracked, pending = conn.execute("SELECT COUNT(*), COALESCE(SUM(sold), 0) FROM stock").fetchone()
+        holders, held = conn.execute(
+            "SELECT COUNT(DISTINCT holder), COALESCE(SUM(units), 0) FROM holds WHERE expires_at > ?",
+            (time.time(),)
+        ).fetchone()
+
+        with self._lock:
+            return {
+                "path": self.path,
+                "tracked_products": tracked,
+                "holders": holders,
+                "held_units": held,
+                "pending_units": pending,
+                "refused": self.refused,
+                "confirmed": self.confirmed,
+                "expired": self.expired,
+                "flushed_units": self.flushed,
+                "conflicts": self.conflicts,
+                "oversold": list(self.oversold)
+            }
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    # -------------------------------
+    # INTERNALS
+    # -------------------------------
+
+    def _connection(self):
+        # One connection per thread (and per process: never reused after fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS stock ("
+                    "product_id TEXT PRIMARY KEY, units INTEGER NOT NULL, "
+                    "sold INTEGER NOT NULL DEFAULT 0, known_at REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS holds ("
+                    "holder TEXT NOT NULL, product_id TEXT NOT NULL, units INTEGER NOT NULL, "
+                    "expires_at REAL NOT NULL, PRIMARY KEY (holder, product_id))"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS holds_product ON holds (product_id, expires_at)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE: counts are read under the write lock they are changed under
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _sync(self):
+        """
+        Seeds stock from the catalog when its version changes (a cheap
+        check; the catalog itself is only fetched then). A product's stock is only replaced by a
+        catalog read after the value it has was learned: units a flush
+        took off stay off until a catalog shows the flushed value, and
+        sold units not yet written back always stay subtracted.
+        """
+        if self._version is not None and self.cache.current_version() == self._version:
+            return
+
+        products = self.cache.get()
+        version = self.cache.version(products)
+        read_at = self.cache.read_at(products)
+        if version == self._version:
+            return
+        if version is None or read_at is None:
+            # Replaced meanwhile (or a failed load): seed from the next one
+            return
+
+        rows = []
+        for product in products:
+            value = product.get(self.column)
+            if value is not None:
+                rows.append((str(product["id"]), int(value), read_at))
+
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO stock (product_id, units, known_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(product_id) DO UPDATE SET units = excluded.units, known_at = excluded.known_at "
+                "WHERE excluded.known_at > stock.known_at",
+                rows
+            )
+            # No longer in the catalog (or no longer tracked) as of this read
+            conn.execute("DELETE FROM stock WHERE known_at < ? AND sold = 0", (read_at,))
+
+        self._version = version
+
+    def _counts(self, conn, product_id, holder):
+        """
+        (what `holder` could hold: stock - sold - other holders' holds,
+        what it holds now), or None for an untracked product.
+        """
+        return conn.execute(
+            "SELECT units - sold - COALESCE((SELECT SUM(units) FROM holds "
+            "WHERE product_id = stock.product_id AND holder IS NOT ? AND expires_at > ?), 0), "
+            "COALESCE((SELECT units FROM holds "
+            "WHERE product_id = stock.product_id AND holder IS ? AND expires_at > ?), 0) "
+            "FROM stock WHERE product_id = ?",
+            (holder, time.time(), holder, time.time(), product_id)
+        ).fetchone()
+
+    def _is_tracked(self, conn, product_id):
+        return conn.execute("SELECT 1 FROM stock WHERE product_id = ?", (str(product_id),)).fetchone() is not None
+
+    def _set_hold(self, conn, holder, product_id, units):
+        if units > 0:
+            conn.execute(
+                "INSERT INTO holds (holder, product_id, units, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(holder, product_id) DO UPDATE SET units = excluded.units, expires_at = excluded.expires_at",
+                (holder, product_id, units, time.time() + self.hold_seconds)
+            )
+        else:
+            conn.execute("DELETE FROM holds WHERE holder = ? AND product_id = ?", (holder, product_id))
+
+
+inventory = Inventory(catalog_cache)
@@ -0,0 +1,228 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import count_error
+
+# Directory for the local SQLite files (job queue, carts, inventory)
+DATA_DIR = os.getenv("DATA_DIR", ".")
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(DATA_DIR, "jobs.sqlite3"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "300"))
+
+
+class JobQueue:
+    """
+    Durable job queue in a local SQLite file.
+
+    Jobs survive restarts and are shared by every worker process on the
+    host. Each job has a unique key, so enqueueing the same work twice
+    (e.g. a refreshed /payout) is a no-op.
+    """
+
+    def __init__(self, path=JOBS_DB_PATH, max_attempts=JOB_MAX_ATTEMPTS, retry_delay=JOB_RETRY_DELAY):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._local = threading.local()
+
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "key TEXT NOT NULL UNIQUE, "
+                "kind TEXT NOT NULL, "
+                "payload TEXT NOT NULL, "
+                "status TEXT NOT NULL DEFAULT 'queued', "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "last_error TEXT, "
+                "run_after REAL NOT NULL, "
+                "locked_at REAL, "
+                "created_at REAL NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_after)"
+            )
+
+    def _connection(self):
+        # One connection per thread (and per process: never reused after fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def enqueue(self, key, kind, payload):
+        """
+        Adds a job unless one with this key already exists.
+        Returns True if a new job was queued.
+        """
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT OR IGNORE INTO jobs (key, kind, payload, run_after, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, kind, json.dumps(payload), now, now, now)
+        )
+        return cursor.rowcount == 1
+
+    def status(self, key):
+        """
+        Returns:
+            {"key", "status", "attempts", "last_error"} | None
+        """
+        row = self._connection().execute(
+            "SELECT key, status, attempts, last_error FROM jobs WHERE key = ?",
+            (key,)
+        ).fetchone()
+
+        return dict(row) if row else None
+
+    def claim(self):
+        """
+        Atomically takes the oldest ready job and marks it running.
+        Jobs left running by a worker that died are picked up again
+        after JOB_STALE_AFTER seconds.
+        """
+        conn = self._connection()
+        now = time.time()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, key, kind, payload, attempts FROM jobs "
+                "WHERE (status = 'queued' AND run_after <= ?) "
+                "OR (status = 'running' AND locked_at <= ?) "
+                "ORDER BY id LIMIT 1",
+                (now, now - JOB_STALE_AFTER)
+            ).fetchone()
+
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                    "locked_at = ?, updated_at = ? WHERE id = ?",
+                    (now, now, row["id"])
+                )
+            conn.execute("COMMIT")
+
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if not row:
+            return None
+
+        return {
+            "id": row["id"],
+            "key": row["key"],
+            "kind": row["kind"],
+            "payload": json.loads(row["payload"]),
+            "attempts": row["attempts"] + 1
+        }
+
+    def complete(self, job):
+        self._connection().execute(
+            "UPDATE jobs SET status = 'done', last_error = NULL, locked_at = NULL, updated_at = ? "
+            "WHERE id = ?",
+            (time.time(), job["id"])
+        )
+
+    def fail(self, job, error):
+        """
+        Requeues the job with exponential backoff, or marks it failed
+        once it has used up max_attempts.
+        """
+        now = time.time()
+        if job["attempts"] >= self.max_attempts:
+            status, run_after = "failed", now
+        else:
+            status, run_after = "queued", now + self.retry_delay * (2 ** (job["attempts"] - 1))
+
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, last_error = ?, run_after = ?, locked_at = NULL, updated_at = ? "
+            "WHERE id = ?",
+            (status, str(error), run_after, now, job["id"])
+        )
+
+
+class JobWorker:
+    """
+    Background thread that runs queued jobs with the handler
+    registered for their kind: handlers = {kind: callable(payload)}.
+    """
+
+    def __init__(self, queue, handlers, poll_interval=JOB_POLL_INTERVAL):
+        self.queue = queue
+        self.handlers = handlers
+        self.poll_interval = poll_interval
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        """
+        Starts the thread in this process if it is not running yet.
+        Safe to call on every request, and after a fork.
+        """
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="job-worker", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_pending(self):
+        """
+        Runs ready jobs until none are left. Returns how many ran.
+        """
+        ran = 0
+        while not self._stop.is_set():
+            job = self.queue.claim()
+            if job is None:
+                return ran
+
+            self._execute(job)
+            ran += 1
+        return ran
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if not self.run_pending():
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                print(f"[JobWorker] Error: {e}")
+                count_error("job_worker")
+                self._stop.wait(self.poll_interval)
+
+    def _execute(self, job):
+        handler = self.handlers.get(job["kind"])
+
+        try:
+            if handler is None:
+                raise Exception(f"No handler for job kind {job['kind']}")
+
+            handler(job["payload"])
+            self.queue.complete(job)
+
+        except Exception as e:
+            print(f"[JobWorker] Job {job['key']} attempt {job['attempts']} failed: {e}")
+            count_error("job_worker.attempt")
+            self.queue.fail(job, e)
@@ -1,317 +1,208 @@
-from dotenv import load_dotenv
-load_dotenv()
-import os
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for, g, current_app, send_file
+from flask import before_render_template, template_rendered
 from flask_compress import Compress
 
-from cart import Cart
-from products import Products
-from checkout import Checkout
+from page_cache import PageCache
+from bundles import bundles
+from shop import Shop, Render, Redirect, Json, Body, default_config
+import supabase_client  # also loads .env
 
-cart = Cart()
+# Routes are collected here and registered on each app by create_app
+routes = []
+shop = Shop(current_app, request, session, g)
 
-app = Flask(__name__)
-app.secret_key = os.getenv("FLASK_SECRET_KEY")
-Compress(app)
-email_user = os.getenv('EMAIL_USER')
-email_password = os.getenv('EMAIL_KEY')
 
+def route(rule, **options):
+    def decorator(view):
+        routes.append((rule, view, options))
+        return view
+    return decorator
 
 
-@app.context_processor
-def inject_cart():
-    return {
-        "number_of_items": len(cart.items),
-        "accumulated_total": cart.accumulated_total
-    }
+def create_app(config=None):
+    """
+    Builds the Flask app. The request logic lives in shop.py; the views
+    here only read the request and turn its results into responses.
 
+    Nothing here talks to Supabase: the client, the cart store and the
+    catalog are all created on first use. That keeps imports cheap and
+    makes the app safe to build before gunicorn forks (--preload), since
+    every worker opens its own connections afterwards.
 
-@app.route('/')
+    Config keys: see shop.default_config.
+    """
+    app = Flask(__name__)
+    app.config.update(default_config())
+    app.config.update(config or {})
+
+    if app.config["SUPABASE_CLIENT"] is not None:
+        supabase_client.use_client(app.config["SUPABASE_CLIENT"])
+
+    Compress(app)
+    app.extensions["page_cache"] = PageCache()
+    app.jinja_env.globals["asset_url"] = bundles.url
+
+    for rule, view, options in routes:
+        app.add_url_rule(rule, view_func=view, **options)
+
+    app.before_request(shop.start_request)
+    app.before_request(shop.start_background_work)
+    app.after_request(shop.add_server_timing)
+    app.teardown_request(shop.record_request)
+    before_render_template.connect(shop.start_render, app)
+    template_rendered.connect(shop.end_render, app)
+    app.context_processor(shop.cart_badge)
+
+    if app.config["PRELOAD_TEMPLATES"]:
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+
+    return app
+
+
+def respond(handler, *args):
+    """Runs a Shop handler and turns its result into a Flask response."""
+    return make_response(handler(*args))
+
+
+def make_response(result):
+    if isinstance(result, Redirect):
+        return redirect(result.url or url_for(result.endpoint))
+
+    if isinstance(result, Render):
+        html = render_template(result.template, **result.context)
+        if result.then is not None:
+            return make_response(result.then(html))
+        response = current_app.make_response(html)
+    elif isinstance(result, Json):
+        response = jsonify(result.body)
+        response.status_code = result.status
+    elif isinstance(result, Body):
+        response = Response(result.content, status=result.status, mimetype=result.mimetype)
+    else:
+        response = send_file(result.path, mimetype=result.mimetype, max_age=result.max_age)
+        if result.immutable:
+            response.cache_control.immutable = True
+
+    response.headers.update(result.headers)
+    return response
+
+
+@route('/')
 def home():
-    products_service = Products()
-    products = products_service.get_products()
+    return respond(shop.home)
 
-    return render_template(
-        'index.html',
-        products=products
-    )
 
-@app.route("/add-to-cart", methods=["POST"])
-def add_to_cart():
-    data = request.json
+@route("/api/products")
+def api_products():
+    return respond(shop.api_products)
 
-    result = cart.add_to_cart(
-        product_id=data["id"],
-        name=data["name"],
-        price=data["price"],
-        image=data["image"]
-    )
 
-    return jsonify(result)
+@route("/search")
+def search():
+    return respond(shop.search)
 
 
-@app.route("/checkout")
-def checkout():
-    return render_template(
-        "checkout.html",
-        cart=cart.items,
-        cart_count=len(cart.items),
-        cart_total=cart.accumulated_total
-    )
+@route("/add-to-cart", methods=["POST"])
+def add_to_cart():
+    return respond(shop.add_to_cart, request.json)
 
 
-@app.route("/update-quantity", methods=["POST"])
-def update_quantity():
-    data = request.json
+@route("/checkout")
+def checkout():
+    return respond(shop.checkout_page)
 
-    result = cart.update_quantity(
-        product_id=data["product_id"],
-        quantity=data["quantity"]
-    )
 
-    return jsonify(result)
+@route("/update-quantity", methods=["POST"])
+def update_quantity():
+    return respond(shop.update_quantity, request.json)
 
 
-@app.route("/remove-from-cart", methods=["POST"])
+@route("/remove-from-cart", methods=["POST"])
 def remove_from_cart():
-    data = request.json or {}
-    product_id = data.get("product_id")
-
-    result = cart.remove_from_cart(product_id)
-    return jsonify(result)
+    return respond(shop.remove_from_cart, request.json)
 
 
+@route("/cart/batch", methods=["POST"])
+def cart_batch():
+    return respond(shop.cart_batch, request.get_json(silent=True))
 
 
-@app.route("/customer", methods=["GET", "POST"])
+@route("/customer", methods=["GET", "POST"])
 def customer():
-    checkout = Checkout()
-
-    # SHOW FORM
     if request.method == "GET":
-        # If no phone in session, user should not be here
-        if not session.get("checkout_phone"):
-            return redirect(url_for("checkout"))
+        return respond(shop.customer_form)
+    return respond(shop.create_customer, request.form)
 
-        return render_template("customer.html")
 
-    # HANDLE FORM SUBMISSION
-    if request.method == "POST":
-        try:
-            phone = session.get("checkout_phone")
-            if not phone:
-                return redirect(url_for("checkout"))
+@route("/pay-now", methods=["POST"])
+def pay_now():
+    return respond(shop.pay_now, request.form)
 
-            name = request.form.get("name")
-            email = request.form.get("email")
-            location = request.form.get("location")
-            gender = request.form.get("gender")
 
-            customer = checkout.create_customer(
-                name=name,
-                email=email,
-                phone=phone,
-                location=location,
-                gender=gender
-            )
+@route("/payout")
+def payout():
+    return respond(shop.payout)
 
-            if not customer:
-                # Later we can show an error message
-                return redirect(url_for("customer"))
 
-            # Store customer_id for order creation
-            session["customer_id"] = customer["id"]
+@route("/orders/<order_id>/status")
+def order_status(order_id):
+    return respond(shop.order_status, order_id)
 
-            return redirect(url_for("payout"))
 
-        except Exception as e:
-            print("Customer route error:", e)
-            return redirect(url_for("customer"))
+@route("/admin/catalog/invalidate", methods=["POST"])
+def invalidate_catalog():
+    return respond(shop.invalidate_catalog)
 
 
-@app.route("/pay-now", methods=["POST"])
-def pay_now():
-    checkout = Checkout()
+@route("/admin/products/<product_id>/images", methods=["POST"])
+def refresh_product_images(product_id):
+    return respond(shop.refresh_product_images, product_id)
 
-    try:
-        phone = request.form.get("phone")
 
-        if not phone:
-            return redirect(url_for("checkout"))
+@route("/admin/catalog/stats")
+def catalog_stats():
+    return respond(shop.catalog_stats)
 
-        # Check customer
-        result = checkout.check_customer(phone)
 
-        # Store normalized phone for later steps
-        session["checkout_phone"] = checkout.clean_phone(phone)
+@route("/admin/supabase/stats")
+def supabase_stats():
+    return respond(shop.supabase_stats)
 
-        if result["exists"]:
-            # Existing customer
-            session["customer_id"] = result["customer"]["id"]
-            return redirect(url_for("payout"))
 
-        # New customer
-        session.pop("customer_id", None)
-        return redirect(url_for("customer"))
+@route("/metrics")
+def prometheus_metrics():
+    return respond(shop.prometheus_metrics)
 
-    except Exception as e:
-        print("Pay now error:", e)
-        return redirect(url_for("checkout"))
 
+@route("/img/<fmt>/<int:width>/<path:source>")
+def image_derivative(fmt, width, source):
+    return respond(shop.image_derivative, fmt, width, source)
 
 
+@route("/assets/<path:file_name>")
+def asset(file_name):
+    return respond(shop.asset, file_name)
 
 
-@app.route("/payout")
-def payout():
-    # -------------------------------
-    # BASIC GUARDS
-    # -------------------------------
-    if not session.get("customer_id"):
-        return redirect(url_for("checkout"))
-
-    checkout = Checkout()
-
-    # -------------------------------
-    # ORDER CREATION GUARD (refresh-safe)
-    # -------------------------------
-    if session.get("order_id"):
-        order_id = session["order_id"]
-
-        try:
-            # pull order from DB so totals stay correct even if cart is cleared
-            resp = (
-                checkout.supabase
-                .table("orders")
-                .select("id,total_amount,products,delivery_location,order_status,order_payment_status")
-                .eq("id", order_id)
-                .limit(1)
-                .execute()
-            )
-
-            order = resp.data[0] if resp.data else None
-            if not order:
-                # if order missing, reset session and restart flow
-                session.pop("order_id", None)
-                return redirect(url_for("checkout"))
-
-            products = order.get("products") or []
-            number_of_items = sum((p.get("quantity") or 0) for p in products) if products else 0
-
-            return render_template(
-                "payout.html",
-                accumulated_total=order.get("total_amount", 0),
-                number_of_items=number_of_items
-            )
-
-        except Exception as e:
-            print("Payout guard fetch error:", e)
-            return redirect(url_for("checkout"))
-
-    # If we're here, no existing order yet — we must have cart items to create one
-    if not cart.items:
-        return redirect(url_for("checkout"))
-
-    try:
-        customer_id = session.get("customer_id")
-        delivery_location = session.get("delivery_location", "")
-        total_amount = cart.accumulated_total
-
-        # -------------------------------
-        # PREPARE CART ITEMS FOR ORDER
-        # -------------------------------
-        cart_items = []
-        for item in cart.items:
-            cart_items.append({
-                "product_id": item["product_id"],
-                "quantity": item["quantity"],
-                "instruction": item.get("instruction"),
-                "local_image_path": item.get("local_image_path")
-            })
-
-        # -------------------------------
-        # CREATE ORDER (DB ONLY)
-        # -------------------------------
-        order = checkout.create_order(
-            customer_id=customer_id,
-            delivery_location=delivery_location,
-            total_amount=total_amount
-        )
-
-        if not order:
-            return redirect(url_for("checkout"))
-
-        order_id = order["id"]
-
-        # -------------------------------
-        # UPLOAD IMAGES + BUILD PRODUCTS JSON
-        # -------------------------------
-        products_json = checkout.upload_order_images(
-            order_id=order_id,
-            cart_items=cart_items
-        )
-
-        # -------------------------------
-        # ATTACH PRODUCTS TO ORDER
-        # -------------------------------
-        checkout.attach_products_to_order(
-            order_id=order_id,
-            products_json=products_json
-        )
-
-        # -------------------------------
-        # CLEAN UP TEMP FILES
-        # -------------------------------
-        for item in cart_items:
-            local_path = item.get("local_image_path")
-            if local_path and os.path.exists(local_path):
-                try:
-                    os.remove(local_path)
-                except Exception as e:
-                    print("Temp file cleanup error:", e)
-
-        # -------------------------------
-        # SAVE ORDER ID (GUARD) BEFORE clearing cart
-        # -------------------------------
-        session["order_id"] = order_id
-
-        # -------------------------------
-        # CLEAR CART (IMPORTANT)
-        # -------------------------------
-        cart.items = []
-        cart.accumulated_total = 0
-
-        # calculate number of items (sum quantities)
-        number_of_items = sum((p.get("quantity") or 0) for p in products_json) if products_json else 0
-
-        return render_template(
-            "payout.html",
-            accumulated_total=total_amount,
-            number_of_items=number_of_items
-        )
-
-    except Exception as e:
-        print("Payout route error:", e)
-        return redirect(url_for("checkout"))
-
-
-
-
-
-@app.route('/paid')
+@route('/paid')
 def paid():
-    return render_template('paid.html')
+    return respond(shop.page, 'paid.html')
 
 
-@app.route('/reviews')
+@route('/reviews')
 def reviews():
-    return render_template('index.html')
+    return respond(shop.page, 'index.html')
 
-@app.route('/contact')
+
+@route('/contact')
 def contact():
-    return render_template('contact.html')
+    return respond(shop.page, 'contact.html')
+
+
 
+app = create_app()
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
@@ -0,0 +1,318 @@
+"""
+Request timing, named spans and error counts, exposed in the
+Prometheus text format at /metrics and per response as Server-Timing.
+
+    with span("checkout.create_order"):      # or @timed("...")
+        ...
+
+Supabase calls are timed without touching the call sites: get_client()
+hands out the client wrapped by instrument(), which names each call
+after what it did (supabase.orders.insert, storage.upload, ...).
+
+Metrics live in the process that recorded them: with several gunicorn
+workers each keeps its own numbers, and a scrape sees one worker.
+"""
+import functools
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Seconds; Prometheus' default buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "http_request_duration_seconds": ("histogram", "Time spent handling a request, by route."),
+    "app_span_duration_seconds": ("histogram", "Time spent in a named span (Supabase call, checkout step, template)."),
+    "app_span_errors_total": ("counter", "Spans that ended with an exception."),
+    "app_errors_total": ("counter", "Errors caught and logged by the app."),
+    "app_circuit_breaker_trips_total": ("counter", "Times a circuit breaker opened."),
+}
+
+QUERY_OPERATIONS = ("select", "insert", "update", "upsert", "delete", "rpc")
+STORAGE_OPERATIONS = ("list", "upload", "download", "update", "remove", "move", "copy", "create_signed_url")
+
+# Spans recorded during the current request, for Server-Timing
+_request_spans = ContextVar("request_spans", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        # Counts are per bucket here and made cumulative when rendered
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """
+    Histograms and counters keyed by (name, labels).
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self):
+        """
+        Everything recorded so far, in the Prometheus text format (0.0.4).
+        """
+        with self._lock:
+            histograms = sorted(
+                (key, list(h.counts), h.count, h.sum) for key, h in self._histograms.items()
+            )
+            counters = sorted(self._counters.items())
+
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described and name in HELP:
+                kind, text = HELP[name]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+            described.add(name)
+
+        for (name, labels), counts, count, total in histograms:
+            describe(name)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels, le=_number(bound))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+
+        for (name, labels), value in counters:
+            describe(name)
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics = Metrics()
+
+
+# -------------------------------
+# SPANS
+# -------------------------------
+
+def begin_request():
+    """
+    Starts collecting spans for Server-Timing. Returns a token for
+    end_request().
+    """
+    return _request_spans.set([])
+
+
+def end_request(token):
+    _request_spans.reset(token)
+
+
+def request_spans():
+    return _request_spans.get() or []
+
+
+def record_span(name, seconds, error=False):
+    metrics.observe("app_span_duration_seconds", seconds, span=name)
+    if error:
+        metrics.increment("app_span_errors_total", span=name)
+
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+@contextmanager
+def span(name):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        record_span(name, time.perf_counter() - started, error=True)
+        raise
+    record_span(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """
+    Decorator: runs the function inside span(name).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_error(where):
+    """
+    Counts an error the app caught and logged itself (next to the print).
+    """
+    metrics.increment("app_errors_total", where=where)
+
+
+def observe_request(endpoint, method, status, seconds):
+    metrics.observe(
+        "http_request_duration_seconds", seconds,
+        endpoint=endpoint, method=method, status=str(status)
+    )
+
+
+SERVER_TIMING_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def server_timing(total=None):
+    """
+    Server-Timing header value for the spans of the current request,
+    repeated spans summed: 'supabase.orders.insert;dur=41.2, ...'.
+    """
+    totals = {}
+    for name, seconds in request_spans():
+        count, elapsed = totals.get(name, (0, 0.0))
+        totals[name] = (count + 1, elapsed + seconds)
+
+    entries = []
+    for name, (count, elapsed) in totals.items():
+        entry = f"{SERVER_TIMING_NAME.sub('_', name)};dur={elapsed * 1000:.1f}"
+        if count > 1:
+            entry += f';desc="{count} calls"'
+        entries.append(entry)
+
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+# -------------------------------
+# SUPABASE
+# -------------------------------
+
+def instrument(client):
+    """
+    Wraps a Supabase client so every table and storage
+    call it makes is recorded as a span. Anything else passes through.
+    """
+    if client is None or isinstance(client, InstrumentedClient):
+        return client
+    return InstrumentedClient(client)
+
+
+class _Proxy:
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+class InstrumentedClient(_Proxy):
+    def table(self, name):
+        return InstrumentedQuery(self._target.table(name), name)
+
+    def from_(self, name):
+        return InstrumentedQuery(self._target.from_(name), name)
+
+    def rpc(self, fn, *args, **kwargs):
+        return InstrumentedQuery(self._target.rpc(fn, *args, **kwargs), fn, "rpc")
+
+    @property
+    def storage(self):
+        return InstrumentedStorage(self._target.storage)
+
+
+class InstrumentedQuery(_Proxy):
+    """
+    A PostgREST query builder: named supabase.<table>.<operation> once
+    the operation is chosen, timed when executed.
+    """
+
+    def __init__(self, target, table, operation="query"):
+        super().__init__(target)
+        self._table = table
+        self._operation = operation
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        operation = name if name in QUERY_OPERATIONS else self._operation
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if hasattr(result, "execute"):
+                return InstrumentedQuery(result, self._table, operation)
+            return result
+        return call
+
+    def execute(self, *args, **kwargs):
+        return _timed_call(f"supabase.{self._table}.{self._operation}", self._target.execute, args, kwargs)
+
+
+class InstrumentedStorage(_Proxy):
+    def from_(self, bucket):
+        return InstrumentedBucket(self._target.from_(bucket))
+
+
+class InstrumentedBucket(_Proxy):
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name not in STORAGE_OPERATIONS:
+            return attr
+        return lambda *args, **kwargs: _timed_call(f"storage.{name}", attr, args, kwargs)
+
+
+def _timed_call(name, fn, args, kwargs):
+    with span(name):
+        return fn(*args, **kwargs)
@@ -0,0 +1,123 @@
+from email.utils import formatdate
+import gzip
+import hashlib
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:  # Flask-Compress normally pulls it in
+    brotli = None
+
+PAGE_CACHE_SIZE = 8
+
+# Preferred first when the browser accepts several
+ENCODINGS = ("br", "gzip")
+
+
+class Page:
+    """
+    One rendered page, with its body already compressed for every
+    encoding we serve, and the validators browsers/CDNs revalidate with.
+    """
+
+    def __init__(self, html):
+        self.body = html.encode("utf-8")
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.last_modified = time.time()
+        self.bodies = {"identity": self.body, "gzip": gzip.compress(self.body, 6)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(self.body, quality=11)
+
+    def encoding_for(self, accept_encodings):
+        """
+        Picks br or gzip if the request accepts it (werkzeug's
+        request.accept_encodings), else "identity".
+        """
+        for encoding in ENCODINGS:
+            if encoding in self.bodies and accept_encodings.quality(encoding) > 0:
+                return encoding
+        return "identity"
+
+    def etag_for(self, encoding):
+        # Same convention as Flask-Compress: "<etag>:<encoding>"
+        return self.etag if encoding == "identity" else f"{self.etag}:{encoding}"
+
+    def is_fresh(self, if_none_match, if_modified_since):
+        """
+        Whether a conditional GET can be answered with 304.
+        `if_none_match` is the raw header, `if_modified_since` a datetime
+        (request.if_modified_since); as in RFC 9110 the date is only
+        checked when there is no If-None-Match.
+        """
+        if if_none_match:
+            for tag in if_none_match.split(","):
+                tag = tag.strip().removeprefix("W/").strip('"')
+                # Any encoding of this body counts as a match
+                if tag == "*" or tag.split(":", 1)[0] == self.etag:
+                    return True
+            return False
+
+        return if_modified_since is not None and int(self.last_modified) <= if_modified_since.timestamp()
+
+    def headers(self, encoding, cache_control):
+        return {
+            "ETag": f'"{self.etag_for(encoding)}"',
+            "Last-Modified": formatdate(self.last_modified, usegmt=True),
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding, Cookie"
+        }
+
+
+class PageCache:
+    """
+    Rendered pages keyed by whatever they depend on (for the home page:
+    the catalog version), so a hit costs no template rendering and no
+    compression. Only the `max_size` most recently used keys are kept.
+    """
+
+    def __init__(self, max_size=PAGE_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.pop(key, None)
+            if page is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._pages[key] = page
+            return page
+
+    def put(self, key, html):
+        """
+        Builds (and compresses) a Page from rendered HTML and caches it.
+        Two requests may race on a miss; that only costs a duplicate render.
+        """
+        page = Page(html)
+
+        with self._lock:
+            self._pages[key] = page
+            while len(self._pages) > self.max_size:
+                self._pages.pop(next(iter(self._pages)))
+
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "cached_pages": len(self._pages)
+            }
@@ -1,75 +1,767 @@
-from supabase import create_client, Client
-from dotenv import load_dotenv
+from urllib.parse import quote
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import contextvars
+import hashlib
+import json
+import math
 import os
+import threading
+import time
 
-# Load environment variables
-load_dotenv()
+from breaker import CircuitBreaker, CircuitOpenError
+from catalog_store import SharedCatalogCache
+from metrics import count_error, timed
+from supabase_client import get_client, SUPABASE_URL, BUSINESS_ID
+from images import derivatives
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-BUSINESS_ID = os.getenv("BUSINESS_ID")
-USER_ID = os.getenv("USER_ID")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise Exception("Supabase environment variables not set")
+IMAGES_BUCKET = "uploaded-files"
+CATALOG_TTL = int(os.getenv("CATALOG_TTL", "300"))
+IMAGE_LIST_WORKERS = int(os.getenv("IMAGE_LIST_WORKERS", "8"))
+IMAGE_LIST_TIMEOUT = float(os.getenv("IMAGE_LIST_TIMEOUT", "5"))
 
-# Create Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Set to 1 once products.image_files exists and is filled (see image_manifests.py)
+IMAGE_MANIFESTS = os.getenv("IMAGE_MANIFESTS") == "1"
 
+# Columns the product grid needs
+CATALOG_COLUMNS = os.getenv(
+    "CATALOG_COLUMNS",
+    "id,name,description,price" + (",image_files" if IMAGE_MANIFESTS else "")
+)
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "24"))
+CATALOG_MAX_PAGE_SIZE = 100
+
+# "shared": one mmap'd catalog per host (catalog_store.py); "memory": one per worker
+CATALOG_STORE = os.getenv("CATALOG_STORE", "shared")
+
+# Last-known-good catalog, served while Supabase is unreachable
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", "catalog_snapshots")
+# A worker may start from a snapshot this recent instead of waiting on Supabase
+CATALOG_SNAPSHOT_MAX_AGE = int(os.getenv("CATALOG_SNAPSHOT_MAX_AGE", "86400"))
+# Pause between refresh attempts while loads are failing
+CATALOG_RETRY_DELAY = float(os.getenv("CATALOG_RETRY_DELAY", "10"))
+
+# Catalog reads and image listings fail fast once Supabase keeps failing
+catalog_breaker = CircuitBreaker("catalog")
+storage_breaker = CircuitBreaker("storage")
+
+
+def public_url(file_path, bucket=IMAGES_BUCKET):
+    """
+    Public URL of a file in a storage bucket, its path URL-quoted.
+    """
+    return (
+        f"{SUPABASE_URL}/storage/v1/object/public/"
+        f"{bucket}/{quote(file_path)}"
+    )
 
 
 class Products:
-    def __init__(self):
-        self.supabase = supabase
+    def __init__(self, client=None):
+        self.supabase = client or get_client()
         self.business_id = BUSINESS_ID
 
-    def get_products(self):
+    def get_products(self, fan_out=True, max_workers=IMAGE_LIST_WORKERS, timeout=IMAGE_LIST_TIMEOUT):
+        try:
+            return self._fetch_products(fan_out, max_workers, timeout)
+
+        except Exception as e:
+            print(f"Error fetching products: {e}")
+            count_error("products.get_products")
+            return []
+
+    @timed("products.fetch_products")
+    def _fetch_products(self, fan_out=True, max_workers=IMAGE_LIST_WORKERS, timeout=IMAGE_LIST_TIMEOUT):
+        """
+        Loads the catalog with image URLs resolved.
+        Unlike get_products, errors are raised so callers that cache
+        the result can tell an empty catalog from a failed load.
+
+        With fan_out, folder listings for products without an image
+        manifest run concurrently on up to `max_workers` threads, and any
+        listing that fails or takes longer than `timeout` seconds leaves
+        the product on the placeholder image.
+        """
+        query = (
+            self.supabase
+            .table("products")
+            .select("*")
+            .eq("business_id", self.business_id)
+        )
+        response = catalog_breaker.call(query.execute)
+
+        products = response.data or []
+
+        self._resolve_images(products, fan_out, max_workers, timeout)
+
+        return products
+
+    def get_page(self, cursor=None, limit=CATALOG_PAGE_SIZE):
+        """
+        One page of the catalog, ordered by id, for the grid and
+        /api/products, cut from the cached catalog. Only while that is
+        cold is the page queried on its own; on errors it is cut from
+        the last known good catalog instead (an empty last page if
+        there is none).
+
+        Returns:
+            {"products": [...], "next_cursor": str | None}
+        """
+        catalog = catalog_cache.peek()
+        if catalog is not None:
+            return page_from_catalog(catalog, cursor, limit)
+
         try:
-            response = (
+            return self._fetch_page(cursor, limit)
+
+        except Exception as e:
+            print(f"Error fetching catalog page: {e}")
+            count_error("products.get_page")
+            return page_from_catalog(catalog_cache.last_good(), cursor, limit)
+
+    @timed("products.fetch_page")
+    def _fetch_page(self, cursor=None, limit=CATALOG_PAGE_SIZE):
+        """
+        Keyset pagination: the cursor is the last id of the previous
+        page, so every page is an indexed range scan however deep it is.
+        Only CATALOG_COLUMNS are selected, and only this page's images
+        are resolved. One extra row is read to tell whether there is a
+        next page.
+        """
+        limit = max(1, min(int(limit), CATALOG_MAX_PAGE_SIZE))
+
+        response = catalog_breaker.call(self._page_query(cursor, limit).execute)
+
+        products = response.data or []
+        next_cursor = self._next_cursor(products, limit)
+        del products[limit:]
+
+        self._resolve_images(products, fan_out=True)
+
+        return {"products": products, "next_cursor": next_cursor}
+
+    def _page_query(self, cursor, limit):
+        query = (
+            self.supabase
+            .table("products")
+            .select(CATALOG_COLUMNS)
+            .eq("business_id", self.business_id)
+        )
+        if cursor:
+            query = query.gt("id", cursor)
+
+        return query.order("id").limit(limit + 1)
+
+    def _next_cursor(self, rows, limit):
+        # rows holds up to limit + 1: the extra one only says "there is more"
+        return rows[limit - 1]["id"] if len(rows) > limit else None
+
+    @timed("products.get_product")
+    def get_product(self, product_id):
+        """
+        Fetch a single product (with image URLs) for this business.
+
+        Returns:
+            dict | None
+        """
+        try:
+            query = (
                 self.supabase
                 .table("products")
                 .select("*")
                 .eq("business_id", self.business_id)
-                .execute()
+                .eq("id", product_id)
+                .limit(1)
             )
+            response = catalog_breaker.call(query.execute)
 
             products = response.data or []
 
-            for product in products:
-                product_id = product["id"]
-                product["images"] = self._get_product_images(product_id)
+            self._resolve_images(products)
 
-            return products
+            return products[0] if products else None
 
         except Exception as e:
-            print(f"Error fetching products: {e}")
-            return []
+            print(f"Error fetching product {product_id}: {e}")
+            count_error("products.get_product")
+            return None
+
+    @timed("products.resolve_images")
+    def _resolve_images(self, products, fan_out=False, max_workers=IMAGE_LIST_WORKERS, timeout=IMAGE_LIST_TIMEOUT):
+        """
+        Fills product["images"] (and the fields _attach_images adds) for
+        every product in one pass.
+
+        Rows that carry an `image_files` manifest (the file names stored
+        under products/{id}/) need no storage call at all. Only rows
+        without a manifest fall back to listing their folder.
+        Public URLs are always built locally.
+        """
+        unlisted = [
+            product["id"] for product in products
+            if product.get("image_files") is None
+        ]
+
+        if fan_out and len(unlisted) > 1:
+            listed = self._list_files_concurrently(unlisted, max_workers, timeout)
+        else:
+            listed = {
+                product_id: self._list_product_files(product_id)
+                for product_id in unlisted
+            }
+
+        for product in products:
+            product_id = product["id"]
+
+            file_names = product.get("image_files")
+            if file_names is None:
+                file_names = listed.get(product_id, [])
+
+            self._attach_images(product, file_names)
+
+    def _list_files_concurrently(self, product_ids, max_workers, timeout):
+        """
+        Lists product folders on a bounded thread pool.
+
+        Returns {product_id: [file names]}. Listings that fail, or have
+        not finished by the time their wave of `max_workers` has had
+        `timeout` seconds, are left out and fall back to the placeholder
+        image. A listing that hangs is dropped by the shared HTTP client
+        after its read timeout (SUPABASE_READ_TIMEOUT), freeing its thread.
+        """
+        max_workers = max(1, min(max_workers, len(product_ids)))
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-list")
 
-    def _get_product_images(self, product_id):
         try:
-            files = (
-                self.supabase
-                .storage
-                .from_("uploaded-files")
-                .list(f"products/{product_id}")
-            )
+            # Each listing runs in a copy of this context, so its storage
+            # span still shows up in the request's Server-Timing
+            futures = {
+                executor.submit(contextvars.copy_context().run, self._list_product_files, product_id): product_id
+                for product_id in product_ids
+            }
 
-            image_urls = []
+            # Listings run in waves of max_workers, each allowed `timeout`
+            deadline = time.monotonic() + timeout * math.ceil(len(product_ids) / max_workers)
 
-            for file in files:
-                file_path = f"products/{product_id}/{file['name']}"
+            listed = {}
+            for future, product_id in futures.items():
+                try:
+                    listed[product_id] = future.result(timeout=max(0, deadline - time.monotonic()))
+                except CircuitOpenError:
+                    raise
+                except FutureTimeoutError:
+                    print(f"Timed out fetching images for product {product_id}")
+                    count_error("products.list_images_timeout")
+                except Exception as e:
+                    print(f"Error fetching images for product {product_id}: {e}")
+                    count_error("products.list_images")
 
-                public_url = (
-                    self.supabase
-                    .storage
-                    .from_("uploaded-files")
-                    .get_public_url(file_path)
-                )
+            return listed
+
+        finally:
+            # Never block the request on a hung listing
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def refresh_image_manifest(self, product_id):
+        """
+        Lists products/{id}/ once and stores the file names in the row's
+        image_files column, so catalog loads no longer list that folder.
+        Run whenever a product's images change (the
+        /admin/products/<id>/images webhook, image_manifests.py).
+        Raises if the folder cannot be listed, leaving the row as it was.
+        """
+        file_names = self._folder_files(product_id)
+
+        (
+            self.supabase
+            .table("products")
+            .update({"image_files": file_names})
+            .eq("business_id", self.business_id)
+            .eq("id", product_id)
+            .execute()
+        )
+
+        return file_names
 
-                image_urls.append(public_url)
+    def _folder_files(self, product_id):
+        bucket = self.supabase.storage.from_(IMAGES_BUCKET)
+        files = storage_breaker.call(bucket.list, f"products/{product_id}")
 
-            return image_urls
+        # Skip folder entries and Supabase's .emptyFolderPlaceholder
+        return [
+            file["name"] for file in files
+            if file.get("id") and not file["name"].startswith(".")
+        ]
 
+    def _list_product_files(self, product_id):
+        try:
+            return self._folder_files(product_id)
+
+        except CircuitOpenError:
+            # Storage is down: fail the whole load rather than cache a
+            # catalog without images over the last good one
+            raise
         except Exception as e:
             print(f"Error fetching images for product {product_id}: {e}")
+            count_error("products.list_images")
             return []
+
+    def _attach_images(self, product, file_names):
+        """
+        Sets, from the file names under products/{id}/:
+            image_paths: storage paths
+            images: public URLs of the originals
+            picture: derivative srcsets for the first image (see
+                images.ImageDerivatives.picture), or None
+        """
+        paths = [f"products/{product['id']}/{name}" for name in file_names]
+
+        product["image_paths"] = paths
+        product["images"] = [public_url(path) for path in paths]
+        product["picture"] = derivatives.picture(paths[0]) if paths else None
+
+
+class CatalogCache:
+    """
+    Keeps the resolved product list (image URLs included) in memory,
+    or whatever else `loader` returns (e.g. one catalog page).
+
+    Entries are fresh for `ttl` seconds. After that the stale list is
+    still served while one background thread reloads it, so only a cold
+    (or invalidated) cache makes a request wait on Supabase.
+
+    Each loaded list gets a version: a hash of its contents, so every
+    worker agrees on it and it only changes when the catalog does.
+
+    With a `snapshot_path`, every new version is also saved to disk as
+    the last known good catalog. A fresh worker starts from it (if it is
+    recent) and refreshes in the background, and a load that fails, e.g.
+    while the circuit breaker is open, falls back to it instead of
+    showing an empty store.
+    """
+
+    def __init__(self, loader, ttl=CATALOG_TTL, snapshot_path=None):
+        self.loader = loader
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.snapshot_loads = 0
+        self._products = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._read_at = None
+        self._retry_at = 0.0
+        self._from_snapshot = False
+        self._saved_version = None
+        self._startup = True
+        self._generation = 0
+        self._refreshing = False
+        self._warming = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def get(self):
+        products = self._cached()
+        return products if products is not None else self._load()
+
+    def peek(self):
+        """
+        What get() returns when it need not wait on Supabase: the cached
+        catalog, or None while the cache is cold. A cold cache starts
+        loading on a background thread, so later calls find it.
+        """
+        products = self._cached()
+        if products is None:
+            with self._lock:
+                warming, self._warming = self._warming, True
+            if not warming:
+                threading.Thread(target=self._warm, daemon=True).start()
+        return products
+
+    def _cached(self):
+        with self._lock:
+            if self._products is not None:
+                self.hits += 1
+                if self._is_stale() and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(
+                        target=self._refresh,
+                        args=(self._generation,),
+                        daemon=True
+                    ).start()
+                return self._products
+
+            self.misses += 1
+            return None
+
+    def _warm(self):
+        try:
+            self._load()
+        finally:
+            with self._lock:
+                self._warming = False
+
+    def _load(self):
+        # Cold cache: one thread loads, concurrent requests wait for it
+        with self._load_lock:
+            with self._lock:
+                if self._products is not None:
+                    return self._products
+                generation = self._generation
+                startup, self._startup = self._startup, False
+
+            # Serve the snapshot now; the hit path then refreshes it
+            if startup and self._load_snapshot(generation, CATALOG_SNAPSHOT_MAX_AGE) is not None:
+                return self.get()
+
+            try:
+                read_at = time.time()
+                products = self.loader()
+            except Exception as e:
+                print(f"[CatalogCache] Load failed: {e}")
+                count_error("catalog_cache.load")
+                return self._fallback(generation)
+
+            self._store(products, generation, read_at=read_at)
+            return products
+
+    def invalidate(self):
+        """
+        Drops the cached catalog so the next request reloads it.
+        A refresh already in flight will not write its (older) result back.
+        """
+        with self._lock:
+            self._products = None
+            self._version = None
+            self._loaded_at = 0.0
+            self._read_at = None
+            self._retry_at = 0.0
+            self._from_snapshot = False
+            # Reload from Supabase; the snapshot is only a fallback now
+            self._startup = False
+            self._generation += 1
+
+    def version(self, products):
+        """
+        Version of a list returned by get(), or None if it is no
+        longer the cached one (replaced or invalidated meanwhile).
+        """
+        with self._lock:
+            return self._version if products is self._products else None
+
+    def current_version(self):
+        """
+        Version of the cached catalog, or None while the cache is cold.
+        Never loads or refreshes it.
+        """
+        with self._lock:
+            return self._version
+
+    def read_at(self, products):
+        """
+        When the data in a list returned by get() was read from
+        Supabase (time.time()), or None if it is no longer the cached one.
+        """
+        with self._lock:
+            return self._read_at if products is self._products else None
+
+    def last_good(self):
+        """
+        The cached catalog, else the snapshot on disk (however old), else
+        None. Never calls Supabase.
+        """
+        with self._lock:
+            if self._products is not None:
+                return self._products
+
+        snapshot = self._read_snapshot()
+        return snapshot["products"] if snapshot else None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            products = self._products
+            if isinstance(products, dict):
+                # A single page from Products._fetch_page
+                products = products["products"]
+
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "refreshes": self.refreshes,
+                "ttl": self.ttl,
+                "cached_products": len(products) if products is not None else 0,
+                "version": self._version,
+                "age": (time.monotonic() - self._loaded_at) if self._products is not None else None,
+                "from_snapshot": self._from_snapshot,
+                "snapshot_loads": self.snapshot_loads
+            }
+
+    def _reset_after_fork(self):
+        # Locks or a refresh thread from the parent do not survive a fork
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self._warming = False
+
+    def _is_stale(self):
+        now = time.monotonic()
+        return now - self._loaded_at >= self.ttl and now >= self._retry_at
+
+    def _retry_later(self):
+        # Keep serving what we have; try Supabase again after a pause
+        with self._lock:
+            self._retry_at = time.monotonic() + CATALOG_RETRY_DELAY
+
+    def _refresh(self, generation):
+        try:
+            read_at = time.time()
+            products = self.loader()
+            self._store(products, generation, read_at=read_at)
+        except Exception as e:
+            # Keep serving the stale catalog until the next attempt
+            print(f"[CatalogCache] Background refresh failed: {e}")
+            count_error("catalog_cache.refresh")
+            self._retry_later()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _store(self, products, generation, from_snapshot=False, read_at=None):
+        version = catalog_version(products)
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._products = products
+            self._version = version
+            # Unknown for snapshots written before it was saved: as old as can be
+            self._read_at = read_at or 0.0
+            self._from_snapshot = from_snapshot
+            if from_snapshot:
+                # Stale from the start, so it is refreshed on next use
+                self._loaded_at = time.monotonic() - self.ttl
+                self._saved_version = version
+                self.snapshot_loads += 1
+            else:
+                self._loaded_at = time.monotonic()
+                self._retry_at = 0.0
+                self.refreshes += 1
+
+            save = self.snapshot_path and not from_snapshot and version != self._saved_version
+            if save:
+                self._saved_version = version
+
+        if save:
+            self._save_snapshot(products, version, read_at)
+
+    # -------------------------------
+    # SNAPSHOT
+    # -------------------------------
+
+    def _fallback(self, generation):
+        products = self._load_snapshot(generation)
+        if products is None:
+            return []
+
+        print(f"[CatalogCache] Serving the last good catalog from {self.snapshot_path}")
+        self._retry_later()
+        return products
+
+    def _load_snapshot(self, generation, max_age=None):
+        snapshot = self._read_snapshot(max_age)
+        if snapshot is None:
+            return None
+
+        self._store(snapshot["products"], generation, from_snapshot=True, read_at=snapshot.get("read_at"))
+        return snapshot["products"]
+
+    def _read_snapshot(self, max_age=None):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except Exception as e:
+            print(f"[CatalogCache] Unreadable snapshot {self.snapshot_path}: {e}")
+            count_error("catalog_cache.snapshot")
+            return None
+
+        if max_age is not None and time.time() - snapshot["saved_at"] > max_age:
+            return None
+        return snapshot
+
+    def _save_snapshot(self, products, version, read_at):
+        # Written beside the target and renamed: readers never see half a file
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"version": version, "saved_at": time.time(), "read_at": read_at, "products": products},
+                    f, separators=(",", ":"), default=str
+                )
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            print(f"[CatalogCache] Could not save snapshot {self.snapshot_path}: {e}")
+            count_error("catalog_cache.snapshot")
+
+
+def catalog_version(products):
+    encoded = json.dumps(products, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:16]
+
+
+class ProductIndex:
+    """
+    Server-side source of truth for cart prices: product_id -> name,
+    price and image, built from the cached catalog. A shared snapshot
+    (catalog_store.py) is searched in place instead of copied.
+
+    An id missing from the catalog (e.g. a piece added since the last
+    refresh) is fetched on its own and remembered; ids that turn out not
+    to exist are remembered for `miss_ttl` seconds so bogus ids cannot
+    hammer the database.
+    """
+
+    def __init__(self, cache, miss_ttl=60):
+        self.cache = cache
+        self.miss_ttl = miss_ttl
+        self._entries = {}
+        self._extra = {}
+        self._missing = {}
+        self._source = None
+        self._in_place = False
+        self._lock = threading.Lock()
+
+    def get(self, product_id):
+        """
+        Returns:
+            {"product_id", "name", "price", "image"} | None
+        """
+        products = self.cache.get()
+
+        with self._lock:
+            if products is not self._source:
+                self._rebuild(products)
+
+            entry = self._entries.get(product_id) or self._extra.get(product_id)
+            if entry:
+                return entry
+
+            product = products.find(product_id) if self._in_place else None
+            if product is not None:
+                return self._entry(product)
+
+            missed_at = self._missing.get(product_id)
+            if missed_at and time.monotonic() - missed_at < self.miss_ttl:
+                return None
+
+        product = Products().get_product(product_id)
+
+        with self._lock:
+            if product is None:
+                self._missing[product_id] = time.monotonic()
+                return None
+
+            entry = self._entry(product)
+            self._extra[product_id] = entry
+            return entry
+
+    def _rebuild(self, products):
+        self._in_place = hasattr(products, "find")
+        self._entries = {} if self._in_place else {product["id"]: self._entry(product) for product in products}
+        self._extra = {}
+        self._missing = {}
+        self._source = products
+
+    def _entry(self, product):
+        images = product.get("images") or []
+        return {
+            "product_id": product["id"],
+            "name": product.get("name"),
+            "price": product.get("price"),
+            "image": images[0] if images else ""
+        }
+
+
+def page_from_catalog(products, cursor=None, limit=CATALOG_PAGE_SIZE):
+    """
+    The page Products._fetch_page would return, cut from an already
+    loaded catalog (e.g. catalog_cache.peek()) instead of queried.
+    """
+    limit = max(1, min(int(limit), CATALOG_MAX_PAGE_SIZE))
+
+    if hasattr(products, "index_after"):
+        # A shared snapshot is stored in id order: only this page is decoded
+        start = products.index_after(cursor) if cursor else 0
+    else:
+        products, ids = _in_id_order(products or [])
+        start = bisect_right(ids, cursor) if cursor else 0
+
+    rows = products[start:start + limit + 1]
+    next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+    return {"products": rows[:limit], "next_cursor": next_cursor}
+
+
+# The last catalog list put in id order, and its ids: every page of the
+# same list reuses them
+_id_order = ([], [], [])
+
+
+def _in_id_order(products):
+    global _id_order
+
+    source, rows, ids = _id_order
+    if source is not products:
+        rows = sorted(products, key=lambda product: str(product["id"]))
+        ids = [str(product["id"]) for product in rows]
+        _id_order = (products, rows, ids)
+    return rows, ids
+
+
+def grid_item(product):
+    """
+    The fields the product grid shows, as sent by /api/products.
+    """
+    images = product.get("images") or []
+    return {
+        "id": product["id"],
+        "name": product.get("name"),
+        "price": product.get("price"),
+        "image": images[0] if images else None,
+        "picture": product.get("picture")
+    }
+
+
+def load_catalog():
+    return Products()._fetch_products()
+
+
+def shared_catalog_cache():
+    return SharedCatalogCache(
+        load_catalog,
+        os.path.join(CATALOG_SNAPSHOT_DIR, "catalog.bin"),
+        ttl=CATALOG_TTL,
+        max_age=CATALOG_SNAPSHOT_MAX_AGE,
+        retry_delay=CATALOG_RETRY_DELAY
+    )
+
+
+def create_catalog_cache(kind=CATALOG_STORE):
+    if kind == "memory":
+        return CatalogCache(load_catalog, snapshot_path=os.path.join(CATALOG_SNAPSHOT_DIR, "catalog.json"))
+    if kind == "shared":
+        return shared_catalog_cache()
+    raise ValueError(f"Unknown catalog store: {kind}")
+
+
+catalog_cache = create_catalog_cache()
+product_index = ProductIndex(catalog_cache)
@@ -0,0 +1,422 @@
+import math
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from operator import itemgetter
+
+from products import catalog_cache
+
+SEARCH_MAX_LIMIT = 100
+SEARCH_MAX_TERMS = 8
+SEARCH_CACHE_SIZE = 4096
+SORTS = ("relevance", "price_asc", "price_desc", "name")
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """
+    Lowercase alphanumeric words, with accents dropped ("Pendântif" -> "pendantif").
+    """
+    if not text:
+        return []
+    text = str(text)
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return TOKEN.findall(text.lower())
+
+
+def search_params(args):
+    """
+    /search query args -> SearchIndex.search keyword arguments.
+    Raises ValueError on a malformed number (nan and inf included).
+    """
+    def number(name):
+        value = args.get(name)
+        if value in (None, ""):
+            return None
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError(f"{name} must be a finite number")
+        return value
+
+    return {
+        "query": args.get("q", ""),
+        "min_price": number("min_price"),
+        "max_price": number("max_price"),
+        "sort": args.get("sort", "relevance"),
+        "limit": int(args.get("limit", 24)),
+        "offset": int(args.get("offset", 0))
+    }
+
+
+class TokenIndex:
+    """
+    token -> set of product ids, with the vocabulary kept sorted so a
+    prefix is a contiguous slice of it. Prefix unions are memoised
+    until the next change.
+    """
+
+    def __init__(self, max_cached_prefixes=2048):
+        self.postings = {}
+        self.vocabulary = []
+        self.max_cached_prefixes = max_cached_prefixes
+        self._prefixes = {}
+
+    def add(self, token, product_id, bulk=False):
+        postings = self.postings.get(token)
+        if postings is None:
+            postings = self.postings[token] = set()
+            if not bulk:
+                insort(self.vocabulary, token)
+        postings.add(product_id)
+
+    def remove(self, token, product_id, bulk=False):
+        postings = self.postings[token]
+        postings.discard(product_id)
+        if not postings:
+            del self.postings[token]
+            if not bulk:
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
+
+    def changed(self, bulk=False):
+        if bulk:
+            self.vocabulary = sorted(self.postings)
+        self._prefixes = {}
+
+    def matches(self, prefix):
+        """
+        Ids of every token starting with `prefix`. The returned set is
+        shared: never modify it.
+        """
+        found = self._prefixes.get(prefix)
+        if found is not None:
+            return found
+
+        start = bisect_left(self.vocabulary, prefix)
+        # Tokens are [a-z0-9], so "\x7f" sorts after every continuation
+        end = bisect_left(self.vocabulary, prefix + "\x7f", start)
+
+        if end - start == 1:
+            found = self.postings[self.vocabulary[start]]
+        else:
+            found = set().union(*(self.postings[token] for token in self.vocabulary[start:end]))
+
+        if len(self._prefixes) >= self.max_cached_prefixes:
+            self._prefixes = {}
+        self._prefixes[prefix] = found
+        return found
+
+
+class SearchIndex:
+    """
+    In-memory search over the cached catalog, so /search never touches
+    Supabase.
+
+    - inverted indexes over name + description words and over name
+      words alone, matched by prefix;
+    - every product kept in price order and in name order, so a page of
+      a large result set is read off the front of an ordered list
+      instead of sorting all matches.
+
+    Like ProductIndex, it follows whatever list the catalog cache holds:
+    when that list changes, only products that were added, removed or
+    edited are re-indexed. Products in a shared snapshot are not kept
+    here; results are read back from the snapshot.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.rebuilds = 0
+        self.reindexed = 0
+        self._source = None
+        self._docs = {}
+        self._words = TokenIndex()
+        self._names = TokenIndex()
+        self._prices = {}
+        self._by_price = []
+        self._by_name = []
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def search(self, query="", min_price=None, max_price=None, sort="relevance", limit=24, offset=0):
+        """
+        Returns:
+            {"total": int, "products": [product, ...]}
+        """
+        products = self.cache.get()
+
+        with self._lock:
+            if products is not self._source:
+                self.sync(products)
+
+            key = (
+                tuple(dict.fromkeys(tokenize(query)))[:SEARCH_MAX_TERMS],
+                min_price, max_price,
+                sort if sort in SORTS else "relevance",
+                max(1, min(limit, SEARCH_MAX_LIMIT)), max(0, offset)
+            )
+
+            # Popular searches repeat: answers hold until the catalog changes
+            result = self._cache.get(key)
+            if result is None:
+                result = self._search(*key)
+                if len(self._cache) >= SEARCH_CACHE_SIZE:
+                    self._cache = {}
+                self._cache[key] = result
+            return result
+
+    def sync(self, products):
+        """
+        Brings the index in line with `products` (callers hold the lock).
+        Returns how many products were (re)indexed or dropped.
+        """
+        seen = set()
+        changed = []
+        keep = not hasattr(products, "find")
+
+        for product in products:
+            product_id = product["id"]
+            seen.add(product_id)
+
+            fingerprint = (product.get("name"), product.get("description"), product.get("price"))
+            doc = self._docs.get(product_id)
+
+            if doc is not None and doc["fingerprint"] == fingerprint:
+                doc["product"] = product if keep else None
+            else:
+                changed.append((product, fingerprint))
+
+        removed = [product_id for product_id in self._docs if product_id not in seen]
+
+        # Many changes (e.g. the first build): skip the ordered inserts, sort once
+        bulk = len(changed) + len(removed) > len(self._docs) // 10 + 100
+
+        for product_id in removed:
+            self._remove(product_id, bulk)
+        for product, fingerprint in changed:
+            if product["id"] in self._docs:
+                self._remove(product["id"], bulk)
+            self._add(product, fingerprint, bulk, keep)
+
+        if bulk:
+            self._by_price = sorted(self._price_entry(product_id) for product_id in self._docs)
+            self._by_name = sorted(self._name_entry(product_id) for product_id in self._docs)
+
+        self._words.changed(bulk)
+        self._names.changed(bulk)
+        self._cache = {}
+
+        self._source = products
+        self.rebuilds += 1
+        self.reindexed += len(changed) + len(removed)
+        return len(changed) + len(removed)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "products": len(self._docs),
+                "tokens": len(self._words.vocabulary),
+                "rebuilds": self.rebuilds,
+                "reindexed": self.reindexed
+            }
+
+    # -------------------------------
+    # QUERIES
+    # -------------------------------
+
+    def _search(self, terms, min_price, max_price, sort, limit, offset):
+        count = offset + limit
+        ranged = min_price is not None or max_price is not None
+        low, high = self._price_bounds(min_price, max_price)
+
+        if terms:
+            terms = list(terms)
+            candidates = None
+            for term in sorted(terms, key=lambda term: len(self._words.matches(term))):
+                matches = self._words.matches(term)
+                candidates = matches if candidates is None else candidates & matches
+                if not candidates:
+                    return self._results(0, [])
+            if ranged:
+                candidates = self._within_prices(candidates, low, high)
+        elif ranged and sort not in ("price_asc", "price_desc"):
+            candidates = set(map(entry_id, self._by_price[low:high]))
+        else:
+            candidates = None  # everything in by_price[low:high]
+
+        if candidates is not None:
+            total = len(candidates)
+        else:
+            total = high - low if ranged else len(self._by_price)
+
+        if sort in ("price_asc", "price_desc"):
+            ranked = self._first(
+                self._by_price, candidates, count, self._price_entry, low, high, reverse=sort == "price_desc"
+            )
+            if not ranged and len(ranked) < count:
+                # Products without a price follow the priced ones, either way round
+                ranked += self._first(self._by_price, candidates, count - len(ranked), self._price_entry, high)
+        elif sort == "name" or not terms:
+            ranked = self._first(self._by_name, candidates, count, self._name_entry)
+        else:
+            ranked = self._by_relevance(terms, candidates, count)
+
+        return self._results(total, ranked[offset:])
+
+    def _by_relevance(self, terms, candidates, count):
+        """
+        Products whose name matches every term come first, then those
+        whose name matches some term, then the rest; each group in name
+        order.
+        """
+        if len(terms) == 1 and candidates is self._words.matches(terms[0]):
+            # Name words are indexed as words too: every name match is a candidate
+            in_name = [self._names.matches(terms[0])]
+        else:
+            in_name = [candidates & self._names.matches(term) for term in terms]
+
+        if len(in_name) > 1:
+            matches_all = in_name[0].intersection(*in_name[1:])
+            matches_any = in_name[0].union(*in_name[1:])
+        else:
+            matches_all = matches_any = in_name[0]
+
+        # Later groups are only worked out if the page reaches them
+        tiers = (
+            lambda: matches_all,
+            lambda: matches_any - matches_all,
+            lambda: candidates - matches_any
+        )
+
+        ranked = []
+        for tier in tiers:
+            if len(ranked) >= count:
+                break
+            tier = tier()
+            if tier:
+                ranked.extend(self._first(self._by_name, tier, count - len(ranked), self._name_entry))
+        return ranked
+
+    def _first(self, order, candidates, count, entry, low=0, high=None, reverse=False):
+        """
+        The first `count` candidates in `order` (a sorted list of
+        (key, id) entries, optionally only order[low:high]).
+
+        Large candidate sets are found by walking the ordered list, which
+        stops after about count * len(order) / len(candidates) entries;
+        small ones are cheaper to sort directly.
+        """
+        high = len(order) if high is None else high
+        if low >= high:
+            return []
+
+        if candidates is None:
+            if reverse:
+                start = len(order) - high
+                walk = islice(reversed(order), start, min(start + count, len(order) - low))
+                return [product_id for _, product_id in walk]
+            return [product_id for _, product_id in order[low:min(high, low + count)]]
+
+        scan = count * (high - low) / max(1, len(candidates))
+        if scan > len(candidates) * math.log2(len(candidates) + 2):
+            first, last = order[low], order[high - 1]
+            entries = sorted(
+                (item for item in map(entry, candidates) if first <= item <= last),
+                reverse=reverse
+            )
+            return [product_id for _, product_id in entries[:count]]
+
+        walk = islice(reversed(order), len(order) - high, len(order) - low) if reverse else islice(order, low, high)
+        return list(islice((product_id for _, product_id in walk if product_id in candidates), count))
+
+    def _price_bounds(self, min_price, max_price):
+        # Products without a price sort last (key inf): the bounds only
+        # ever cover priced ones
+        low = 0 if min_price is None else bisect_left(self._by_price, min_price, key=entry_key)
+        if max_price is not None:
+            high = bisect_right(self._by_price, max_price, key=entry_key)
+        else:
+            high = bisect_left(self._by_price, math.inf, key=entry_key)
+        return low, max(low, high)
+
+    def _within_prices(self, candidates, low, high):
+        if low == high:
+            return set()
+
+        # Walk whichever side is smaller
+        if len(candidates) < high - low:
+            min_price, max_price = self._by_price[low][0], self._by_price[high - 1][0]
+            prices = self._prices
+            return {
+                product_id for product_id in candidates
+                if min_price <= prices[product_id] <= max_price
+            }
+
+        return candidates.intersection(map(entry_id, self._by_price[low:high]))
+
+    def _price_entry(self, product_id):
+        return (self._prices[product_id], product_id)
+
+    def _name_entry(self, product_id):
+        return (self._docs[product_id]["sort_name"], product_id)
+
+    def _results(self, total, product_ids):
+        return {
+            "total": total,
+            "products": [self._product(product_id) for product_id in product_ids]
+        }
+
+    def _product(self, product_id):
+        product = self._docs[product_id]["product"]
+        return product if product is not None else self._source.find(product_id)
+
+    # -------------------------------
+    # INDEXING
+    # -------------------------------
+
+    def _add(self, product, fingerprint, bulk=False, keep=True):
+        product_id = product["id"]
+        name_tokens = set(tokenize(product.get("name")))
+        words = name_tokens.union(tokenize(product.get("description")))
+
+        price = product.get("price")
+        self._prices[product_id] = float(price) if price is not None else math.inf
+        self._docs[product_id] = {
+            "product": product if keep else None,
+            "fingerprint": fingerprint,
+            "words": words,
+            "name_tokens": name_tokens,
+            "sort_name": (product.get("name") or "").lower()
+        }
+
+        for token in words:
+            self._words.add(token, product_id, bulk)
+        for token in name_tokens:
+            self._names.add(token, product_id, bulk)
+
+        if not bulk:
+            insort(self._by_price, self._price_entry(product_id))
+            insort(self._by_name, self._name_entry(product_id))
+
+    def _remove(self, product_id, bulk=False):
+        if not bulk:
+            for order, entry in ((self._by_price, self._price_entry), (self._by_name, self._name_entry)):
+                del order[bisect_left(order, entry(product_id))]
+
+        doc = self._docs.pop(product_id)
+        del self._prices[product_id]
+
+        for token in doc["words"]:
+            self._words.remove(token, product_id, bulk)
+        for token in doc["name_tokens"]:
+            self._names.remove(token, product_id, bulk)
+
+
+entry_key = itemgetter(0)
+entry_id = itemgetter(1)
+
+
+search_index = SearchIndex(catalog_cache)
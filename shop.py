@@ -0,0 +1,756 @@
+"""
+The request logic behind every route, shared by the Flask app (main.py)
+and the Quart app (asgi.py).
+
+A Shop works through the framework's request, session, g and app
+proxies (the parts it uses behave the same in both) and returns plain
+results - Render, Redirect, Json, Body or File - that each app turns
+into its own response.
+
+Handlers are plain functions on the sync Supabase client: Flask calls
+them on its request thread, Quart on a worker thread (asyncio.to_thread)
+so the event loop is never blocked.
+"""
+import hmac
+import os
+import threading
+import time
+import uuid
+
+from cart import Cart, create_cart_store, CART_BATCH_MAX_OPERATIONS
+from checkout import Checkout
+from inventory import inventory
+from jobs import JobQueue, JobWorker, JOBS_DB_PATH
+from products import (
+    Products, catalog_cache, catalog_breaker, storage_breaker,
+    product_index, grid_item, page_from_catalog, CATALOG_PAGE_SIZE
+)
+from search import search_index, search_params
+from images import derivatives, IMAGE_MAX_AGE
+from bundles import bundles, ASSET_MAX_AGE
+from metrics import metrics, begin_request, end_request, record_span, observe_request, server_timing, count_error
+import supabase_client
+
+cart_store_lock = threading.Lock()
+jobs_lock = threading.Lock()
+
+
+def default_config():
+    """
+    Config keys both apps take (defaults come from the environment):
+        SECRET_KEY, ADMIN_TOKEN, CART_STORE,
+        JOBS_DB_PATH: job queue file (default DATA_DIR/jobs.sqlite3),
+        HOME_CACHE_CONTROL: Cache-Control sent with the cached home page,
+        JOB_WORKER: run queued jobs on a thread in each worker process,
+        INVENTORY_FLUSHER: write sold stock back on a thread in each worker,
+        PRELOAD_TEMPLATES: compile every template up front,
+        SUPABASE_CLIENT: use this client instead of creating one.
+    """
+    return {
+        "SECRET_KEY": os.getenv("FLASK_SECRET_KEY"),
+        "ADMIN_TOKEN": os.getenv("ADMIN_TOKEN"),
+        "EMAIL_USER": os.getenv("EMAIL_USER"),
+        "EMAIL_KEY": os.getenv("EMAIL_KEY"),
+        "CART_STORE": os.getenv("CART_STORE", "sqlite"),
+        "JOBS_DB_PATH": JOBS_DB_PATH,
+        "HOME_CACHE_CONTROL": os.getenv("HOME_CACHE_CONTROL", "public, max-age=0, must-revalidate"),
+        "JOB_WORKER": os.getenv("JOB_WORKER", "1") == "1",
+        "INVENTORY_FLUSHER": os.getenv("INVENTORY_FLUSHER", "1") == "1",
+        "PRELOAD_TEMPLATES": os.getenv("PRELOAD_TEMPLATES") == "1",
+        "SUPABASE_CLIENT": None
+    }
+
+
+# -------------------------------
+# RESULTS
+# -------------------------------
+
+class Render:
+    """
+    A template to render with `context`. With `then`, the rendered HTML
+    is passed to it and whatever it returns is sent instead.
+    """
+
+    def __init__(self, template, context=None, headers=None, then=None):
+        self.template = template
+        self.context = context or {}
+        self.headers = headers or {}
+        self.then = then
+
+
+class Redirect:
+    """To an endpoint of the app, or to `url`."""
+
+    def __init__(self, endpoint=None, url=None):
+        self.endpoint = endpoint
+        self.url = url
+
+
+class Json:
+    def __init__(self, body, status=200, headers=None):
+        self.body = body
+        self.status = status
+        self.headers = headers or {}
+
+
+class Body:
+    """A response body sent as is (e.g. a pre-compressed cached page)."""
+
+    def __init__(self, content, status=200, headers=None, mimetype=None):
+        self.content = content
+        self.status = status
+        self.headers = headers or {}
+        self.mimetype = mimetype
+
+
+class File:
+    """A file on disk, cached publicly for `max_age` seconds."""
+
+    def __init__(self, path, mimetype, max_age, headers=None, immutable=False):
+        self.path = path
+        self.mimetype = mimetype
+        self.max_age = max_age
+        self.headers = headers or {}
+        self.immutable = immutable
+
+
+def unauthorized():
+    return Json({"success": False, "message": "Unauthorized"}, 401)
+
+
+def finalise_job_key(order_id):
+    return f"finalise-order:{order_id}"
+
+
+class Shop:
+    """
+    Request logic for both apps. `app`, `request`, `session` and `g`
+    are the framework's proxies, so one Shop serves every request.
+    """
+
+    def __init__(self, app, request, session, g):
+        self.app = app
+        self.request = request
+        self.session = session
+        self.g = g
+
+    # -------------------------------
+    # APP SERVICES (created on first use, once per app)
+    # -------------------------------
+
+    def cart_store(self):
+        store = self.app.extensions.get("cart_store")
+        if store is None:
+            with cart_store_lock:
+                store = self.app.extensions.get("cart_store")
+                if store is None:
+                    store = create_cart_store(self.app.config["CART_STORE"])
+                    self.app.extensions["cart_store"] = store
+        return store
+
+    def job_queue(self):
+        queue = self.app.extensions.get("job_queue")
+        if queue is None:
+            with jobs_lock:
+                queue = self.app.extensions.get("job_queue")
+                if queue is None:
+                    queue = JobQueue(self.app.config["JOBS_DB_PATH"])
+                    self.app.extensions["job_queue"] = queue
+        return queue
+
+    def job_worker(self):
+        worker = self.app.extensions.get("job_worker")
+        if worker is None:
+            queue = self.job_queue()
+            with jobs_lock:
+                worker = self.app.extensions.get("job_worker")
+                if worker is None:
+                    worker = JobWorker(queue, {
+                        "finalise_order": lambda payload: Checkout().finalise_order(**payload)
+                    })
+                    self.app.extensions["job_worker"] = worker
+        return worker
+
+    # -------------------------------
+    # REQUEST HOOKS
+    # -------------------------------
+
+    def start_background_work(self):
+        # Started from the first request so the threads live in the forked worker
+        if self.app.config["JOB_WORKER"]:
+            self.job_worker().ensure_running()
+        if self.app.config["INVENTORY_FLUSHER"]:
+            inventory.ensure_running()
+
+    def start_request(self):
+        self.g.request_started = time.perf_counter()
+        self.g.spans_token = begin_request()
+
+    def add_server_timing(self, response):
+        self.g.response_status = response.status_code
+        response.headers["Server-Timing"] = server_timing(total=time.perf_counter() - self.g.request_started)
+        return response
+
+    def record_request(self, error=None):
+        started = self.g.pop("request_started", None)
+        if started is None:
+            return
+
+        request = self.request
+        observe_request(
+            request.url_rule.rule if request.url_rule else "unmatched",
+            request.method,
+            self.g.get("response_status", 500),
+            time.perf_counter() - started
+        )
+        end_request(self.g.pop("spans_token"))
+
+    def start_render(self, sender, template, context, **extra):
+        self.g.render_started = time.perf_counter()
+
+    def end_render(self, sender, template, context, **extra):
+        started = self.g.pop("render_started", None)
+        if started is not None:
+            record_span(f"render.{template.name}", time.perf_counter() - started)
+
+    # -------------------------------
+    # CART
+    # -------------------------------
+
+    def get_cart(self):
+        """
+        Returns this visitor's cart as stored, loaded once per request
+        using the cart id kept in their session. Change it with edit_cart.
+        """
+        g = self.g
+        if "cart" not in g:
+            cart_id = self.session.get("cart_id")
+            payload = self.cart_store().load(cart_id) if cart_id else None
+
+            g.cart = Cart.loads(payload) if payload else Cart()
+            g.cart.hold_id = cart_id
+
+        return g.cart
+
+    def edit_cart(self, change, look_up=()):
+        """
+        Runs change(cart) on this visitor's cart as one read-modify-write
+        in the cart store (see its edit()) and returns its result, so
+        concurrent requests for one cart (double clicks, several tabs,
+        other workers) take turns instead of overwriting each other.
+
+        A new visitor gets a cart id first, so what they add can be held
+        in the inventory under it. Products in `look_up` are fetched
+        beforehand if the catalog lacks them, not while the cart is locked.
+        """
+        session = self.session
+        if not session.get("cart_id"):
+            session["cart_id"] = uuid.uuid4().hex
+
+        cart_id = session["cart_id"]
+
+        for product_id in look_up:
+            product_index.get(product_id)
+
+        with self.cart_store().edit(cart_id) as edit:
+            cart = Cart.loads(edit.payload) if edit.payload else Cart()
+            cart.hold_id = cart_id
+            result = change(cart)
+            if edit.payload is not None or cart.lines:
+                edit.save(cart.dumps())
+
+        self.g.cart = cart
+        return result
+
+    def cart_badge(self):
+        cart = self.get_cart()
+        return {
+            "number_of_items": len(cart.lines),
+            "accumulated_total": cart.accumulated_total
+        }
+
+    # -------------------------------
+    # HELPERS
+    # -------------------------------
+
+    def is_admin(self):
+        admin_token = self.app.config["ADMIN_TOKEN"]
+        headers = self.request.headers
+        # Scrapers (Prometheus) can only send the token as a bearer token
+        token = headers.get("X-Admin-Token") or headers.get("Authorization", "").removeprefix("Bearer ")
+        return bool(admin_token) and hmac.compare_digest(token, admin_token)
+
+    def cached_page(self, page):
+        """
+        Serves a pre-rendered Page: 304 if the browser/CDN copy is current,
+        otherwise the pre-compressed body (Flask-Compress skips responses
+        that already have a Content-Encoding).
+        """
+        request = self.request
+        encoding = page.encoding_for(request.accept_encodings)
+        headers = page.headers(encoding, self.app.config["HOME_CACHE_CONTROL"])
+
+        if page.is_fresh(request.headers.get("If-None-Match"), request.if_modified_since):
+            return Body(b"", 304, headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Body(page.bodies[encoding], headers=headers, mimetype="text/html")
+
+    # -------------------------------
+    # CATALOG
+    # -------------------------------
+
+    def home(self):
+        # Only the first page is rendered here; the rest comes from
+        # /api/products as the visitor scrolls. It is cut from the
+        # catalog every worker shares, so invalidating or refreshing
+        # that reaches the home page of all of them
+        catalog = catalog_cache.get()
+        version = catalog_cache.version(catalog)
+
+        first_page = page_from_catalog(catalog)
+        context = {"products": first_page["products"], "next_cursor": first_page["next_cursor"]}
+
+        # The floating cart badge is part of the page, so only the
+        # empty-cart page is shared between visitors
+        if self.get_cart().lines or version is None:
+            return Render("index.html", context, headers={"Cache-Control": "private, no-cache"})
+
+        page_cache = self.app.extensions["page_cache"]
+        page = page_cache.get(version)
+        if page is None:
+            return Render("index.html", context, then=lambda html: self.cached_page(page_cache.put(version, html)))
+
+        return self.cached_page(page)
+
+    def api_products(self):
+        """
+        Next page of the product grid:
+            GET /api/products?cursor=<next_cursor>&limit=24
+            -> {"products": [...], "next_cursor": str | null}
+        """
+        args = self.request.args
+        try:
+            limit = int(args.get("limit", CATALOG_PAGE_SIZE))
+        except ValueError:
+            return Json({"success": False, "message": "Invalid limit"}, 400)
+
+        page = Products().get_page(args.get("cursor") or None, limit)
+
+        return Json({
+            "products": [grid_item(product) for product in page["products"]],
+            "next_cursor": page["next_cursor"]
+        }, headers={"Cache-Control": "public, max-age=60"})
+
+    def search(self):
+        """
+        Product search, answered from the in-memory index:
+            GET /search?q=gold ri&min_price=100&max_price=500&sort=price_asc&limit=24&offset=0
+            -> {"total": int, "products": [...], "next_offset": int | null}
+        Every word is matched as a prefix of a word in the name or
+        description; sort is relevance, price_asc, price_desc or name.
+        """
+        try:
+            params = search_params(self.request.args)
+        except ValueError:
+            return Json({"success": False, "message": "Invalid search parameters"}, 400)
+
+        result = search_index.search(**params)
+
+        end = params["offset"] + len(result["products"])
+        return Json({
+            "total": result["total"],
+            "products": [grid_item(product) for product in result["products"]],
+            "next_offset": end if end < result["total"] else None
+        }, headers={"Cache-Control": "public, max-age=60"})
+
+    # -------------------------------
+    # CART ROUTES
+    # -------------------------------
+
+    def add_to_cart(self, data):
+        product_id = data["id"]
+
+        # Only the id is trusted; price/name/image are resolved server-side
+        return Json(self.edit_cart(
+            lambda cart: cart.add_to_cart(product_id=product_id),
+            look_up=[product_id]
+        ))
+
+    def update_quantity(self, data):
+        product_id, quantity = data["product_id"], data["quantity"]
+
+        return Json(self.edit_cart(
+            lambda cart: cart.update_quantity(product_id=product_id, quantity=quantity)
+        ))
+
+    def remove_from_cart(self, data):
+        product_id = (data or {}).get("product_id")
+
+        return Json(self.edit_cart(lambda cart: cart.remove_from_cart(product_id)))
+
+    def cart_batch(self, data):
+        """
+        Several cart changes in one request, applied in order and all or
+        nothing (see Cart.apply_batch):
+            POST /cart/batch {"operations": [{"op": "update", "product_id": ..., "quantity": 3}, ...]}
+            -> {"success", "message", "quantities": {product_id: quantity},
+                "number_of_items", "accumulated_total"}
+        """
+        operations = (data or {}).get("operations")
+        if not isinstance(operations, list) or not operations:
+            return Json({"success": False, "message": "No operations"}, 400)
+
+        added = [
+            operation.get("product_id") for operation in operations
+            if isinstance(operation, dict) and operation.get("op") == "add"
+        ]
+        return Json(self.edit_cart(
+            lambda cart: cart.apply_batch(operations),
+            look_up=added[:CART_BATCH_MAX_OPERATIONS]
+        ))
+
+    def checkout_page(self):
+        # Holds lapse long before carts do: hold the stock again, and
+        # tell the shopper about anything that is no longer there
+        stock_changes = self.edit_cart(Cart.reserve_all) if self.session.get("cart_id") else []
+        cart = self.get_cart()
+
+        return Render("checkout.html", {
+            "cart": cart.items,
+            "cart_count": len(cart.items),
+            "cart_total": cart.accumulated_total,
+            "stock_changes": stock_changes
+        })
+
+    # -------------------------------
+    # CHECKOUT ROUTES
+    # -------------------------------
+
+    def customer_form(self):
+        # If no phone in session, user should not be here
+        if not self.session.get("checkout_phone"):
+            return Redirect("checkout")
+
+        return Render("customer.html")
+
+    def create_customer(self, form):
+        session = self.session
+        try:
+            phone = session.get("checkout_phone")
+            if not phone:
+                return Redirect("checkout")
+
+            checkout = Checkout()
+            customer = checkout.create_customer(
+                name=form.get("name"),
+                email=form.get("email"),
+                phone=phone,
+                location=form.get("location"),
+                gender=form.get("gender")
+            )
+
+            if not customer:
+                # Later we can show an error message
+                return Redirect("customer")
+
+            # Store customer_id for order creation
+            session["customer_id"] = customer["id"]
+
+            return Redirect("payout")
+
+        except Exception as e:
+            print("Customer route error:", e)
+            count_error("customer_route")
+            return Redirect("customer")
+
+    def pay_now(self, form):
+        session = self.session
+        try:
+            phone = form.get("phone")
+
+            if not phone:
+                return Redirect("checkout")
+
+            # Check customer
+            checkout = Checkout()
+            result = checkout.check_customer(phone)
+
+            # Store normalized phone for later steps
+            session["checkout_phone"] = checkout.clean_phone(phone)
+
+            if result["exists"]:
+                # Existing customer
+                session["customer_id"] = result["customer"]["id"]
+                return Redirect("payout")
+
+            # New customer
+            session.pop("customer_id", None)
+            return Redirect("customer")
+
+        except Exception as e:
+            print("Pay now error:", e)
+            count_error("pay_now")
+            return Redirect("checkout")
+
+    def payout(self):
+        session = self.session
+
+        # -------------------------------
+        # BASIC GUARDS
+        # -------------------------------
+        if not session.get("customer_id"):
+            return Redirect("checkout")
+
+        # -------------------------------
+        # ORDER CREATION GUARD (refresh-safe)
+        # -------------------------------
+        summary = session.get("order_summary")
+        if summary and summary.get("order_id") == session.get("order_id"):
+            # Totals were saved when the order was created: no DB read needed
+            return Render("payout.html", summary)
+
+        if session.get("order_id"):
+            order_id = session["order_id"]
+
+            try:
+                # Sessions from before order summaries were stored: pull order from DB
+                checkout = Checkout()
+                order = checkout.get_order(order_id)
+                if not order:
+                    # if order missing, reset session and restart flow
+                    session.pop("order_id", None)
+                    return Redirect("checkout")
+
+                products = order.get("products") or []
+                return Render("payout.html", {
+                    "order_id": order_id,
+                    "accumulated_total": order.get("total_amount", 0),
+                    "number_of_items": sum((p.get("quantity") or 0) for p in products)
+                })
+
+            except Exception as e:
+                print("Payout guard fetch error:", e)
+                count_error("payout_guard")
+                return Redirect("checkout")
+
+        # If we're here, no existing order yet — we must have cart items to create one
+        if not self.get_cart().items:
+            return Redirect("checkout")
+
+        try:
+            # The order is built from the cart as it stands under the
+            # cart's lock, and the cart emptied in the same edit: a
+            # concurrent change waits, then lands on the empty cart
+            placed = self.edit_cart(self._place_order)
+
+        except Exception as e:
+            print("Payout route error:", e)
+            count_error("payout_route")
+            return Redirect("checkout")
+
+        if placed is None:
+            return Redirect("checkout")
+
+        order_id, cart_items, summary = placed
+
+        # -------------------------------
+        # QUEUE UPLOADS + CLEANUP
+        # (runs on the background job worker)
+        # -------------------------------
+        try:
+            self.job_queue().enqueue(
+                key=finalise_job_key(order_id),
+                kind="finalise_order",
+                payload={"order_id": order_id, "cart_items": cart_items}
+            )
+        except Exception as e:
+            # The order is placed and paid for: show it; its images are
+            # left for an operator to upload
+            print(f"Could not queue finalising order {order_id}:", e)
+            count_error("payout.enqueue")
+
+        return Render("payout.html", summary)
+
+    def _place_order(self, cart):
+        """
+        payout's cart edit: creates the order for `cart` and empties it.
+        Returns (order_id, cart_items, summary), or None if no order was
+        created.
+        """
+        session = self.session
+        if not cart.items:
+            return None
+
+        checkout = Checkout()
+        total_amount = cart.accumulated_total
+
+        # -------------------------------
+        # BUILD PRODUCTS JSON (image URLs known before upload)
+        # -------------------------------
+        cart_items = [
+            {
+                "product_id": item["product_id"],
+                "quantity": item["quantity"],
+                "instruction": item.get("instruction"),
+                "local_image_path": item.get("local_image_path")
+            }
+            for item in cart.items
+        ]
+        products_json = checkout.prepare_products_json(cart_items)
+
+        # -------------------------------
+        # CREATE COMPLETE ORDER (ONE INSERT)
+        # -------------------------------
+        order = checkout.create_order(
+            customer_id=session.get("customer_id"),
+            delivery_location=session.get("delivery_location", ""),
+            total_amount=total_amount,
+            products_json=products_json,
+            hold_id=cart.hold_id
+        )
+
+        if not order:
+            return None
+
+        # Guard against placing it twice before anything else can fail
+        order_id = order["id"]
+        session["order_id"] = order_id
+        cart.clear()
+
+        summary = {
+            "order_id": order_id,
+            "accumulated_total": order.get("total_amount", str(total_amount)),
+            "number_of_items": sum((p.get("quantity") or 0) for p in products_json)
+        }
+        session["order_summary"] = summary
+
+        return order_id, cart_items, summary
+
+    def order_status(self, order_id):
+        """
+        Polled by the payout page while the order is being finalised.
+        Only the session that placed the order can see its status.
+        """
+        if str(self.session.get("order_id")) != order_id:
+            return Json({"success": False, "message": "Order not found"}, 404)
+
+        job = self.job_queue().status(finalise_job_key(order_id))
+        if not job:
+            return Json({"success": False, "message": "Order not found"}, 404)
+
+        return Json({
+            "success": True,
+            "order_id": order_id,
+            "status": job["status"],
+            "attempts": job["attempts"]
+        })
+
+    # -------------------------------
+    # ADMIN
+    # -------------------------------
+
+    def invalidate_catalog(self):
+        """
+        Webhook for stock/catalog changes: drops the cached catalog so the
+        next home page request reloads it from Supabase.
+        """
+        if not self.is_admin():
+            return unauthorized()
+
+        catalog_cache.invalidate()
+
+        return Json({"success": True, "message": "Catalog cache invalidated"})
+
+    def refresh_product_images(self, product_id):
+        """
+        Webhook for product image uploads and deletes (e.g. a storage
+        webhook on products/): stores the folder's file names on the row
+        (see image_manifests.py) and drops the cached catalog.
+        """
+        if not self.is_admin():
+            return unauthorized()
+
+        try:
+            file_names = Products().refresh_image_manifest(product_id)
+        except Exception as e:
+            print(f"Image manifest refresh failed for product {product_id}: {e}")
+            count_error("admin.refresh_images")
+            return Json({"success": False, "message": "Could not list images"}, 502)
+
+        catalog_cache.invalidate()
+
+        return Json({"success": True, "image_files": file_names})
+
+    def catalog_stats(self):
+        if not self.is_admin():
+            return unauthorized()
+
+        return Json({
+            **catalog_cache.stats(),
+            "search": search_index.stats(),
+            "home_pages": self.app.extensions["page_cache"].stats(),
+            "breakers": {"catalog": catalog_breaker.stats(), "storage": storage_breaker.stats()},
+            "inventory": inventory.stats()
+        })
+
+    def supabase_stats(self):
+        if not self.is_admin():
+            return unauthorized()
+
+        return Json(supabase_client.pool_stats())
+
+    def prometheus_metrics(self):
+        """
+        Route latencies, span latencies and error counts of this worker
+        process, in the Prometheus text format.
+        """
+        if not self.is_admin():
+            return unauthorized()
+
+        return Body(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    # -------------------------------
+    # STATIC
+    # -------------------------------
+
+    def image_derivative(self, fmt, width, source):
+        """
+        Resized WebP/AVIF copy of a product or static image, built on first
+        request and then served from the local derivative cache.
+        """
+        if not derivatives.is_valid(source, width, fmt):
+            if source.startswith(("products/", "static/images/")) and not derivatives.formats:
+                # No Pillow here: the original still works
+                return Redirect(url=derivatives.original_url(source))
+            return Json({"success": False, "message": "Image not found"}, 404)
+
+        try:
+            path = derivatives.derivative_path(source, width, fmt)
+        except Exception as e:
+            print(f"Image derivative error for {source}: {e}")
+            count_error("image_derivative")
+            return Redirect(url=derivatives.original_url(source))
+
+        return File(path, f"image/{fmt}", IMAGE_MAX_AGE)
+
+    def asset(self, file_name):
+        """
+        A built CSS/JS bundle (see bundles.py), pre-compressed. Its name
+        changes with its content, so browsers keep it for a year without
+        revalidating.
+        """
+        found = bundles.file_for(file_name, self.request.accept_encodings)
+        if found is None:
+            return Json({"success": False, "message": "Asset not found"}, 404)
+
+        path, mimetype, encoding = found
+        headers = {"Vary": "Accept-Encoding"}
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return File(path, mimetype, ASSET_MAX_AGE, headers, immutable=True)
+
+    def page(self, template):
+        return Render(template)
+
@@ -0,0 +1,163 @@
+from dotenv import load_dotenv
+import os
+import threading
+
+from metrics import instrument
+
+# Load environment variables (once per process, for every module)
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+BUSINESS_ID = os.getenv("BUSINESS_ID")
+USER_ID = os.getenv("USER_ID")
+
+# HTTP connection pool shared by the PostgREST and storage clients
+POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+KEEPALIVE_CONNECTIONS = int(os.getenv("SUPABASE_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "60"))
+CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "3"))
+# Every call's timeouts, storage listings included: storage3 takes none per call
+READ_TIMEOUT = float(os.getenv("SUPABASE_READ_TIMEOUT", "10"))
+WRITE_TIMEOUT = float(os.getenv("SUPABASE_WRITE_TIMEOUT", "30"))
+POOL_TIMEOUT = float(os.getenv("SUPABASE_POOL_TIMEOUT", "5"))
+
+_client = None
+_http = None
+_pid = None
+_injected = False
+_lock = threading.Lock()
+
+_requests = 0
+_connections_opened = 0
+_seen_connections = set()
+
+
+def get_client():
+    """
+    Returns this process's Supabase client, creating it on first use.
+
+    Products, Cart and Checkout all share it, and with it one pooled,
+    keep-alive HTTP client. A forked worker builds its own client
+    instead of reusing the parent's sockets. Every table and storage
+    call made through it is timed (see metrics.instrument).
+    """
+    global _client, _http, _pid
+
+    if _injected or (_client is not None and _pid == os.getpid()):
+        return _client
+
+    with _lock:
+        if _client is not None and _pid == os.getpid():
+            return _client
+
+        if not SUPABASE_URL or not SUPABASE_KEY:
+            raise Exception("Supabase environment variables not set")
+
+        # Imported here: the supabase package takes most of a second to import
+        from supabase import create_client, ClientOptions
+        import httpx
+
+        _http = httpx.Client(
+            **_http_settings(httpx),
+            event_hooks={"response": [_count_response]}
+        )
+
+        _client = instrument(create_client(
+            SUPABASE_URL,
+            SUPABASE_KEY,
+            options=ClientOptions(httpx_client=_http)
+        ))
+        _pid = os.getpid()
+
+        return _client
+
+
+def _http_settings(httpx):
+    return {
+        "limits": httpx.Limits(
+            max_connections=POOL_SIZE,
+            max_keepalive_connections=KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        ),
+        "timeout": httpx.Timeout(
+            connect=CONNECT_TIMEOUT,
+            read=READ_TIMEOUT,
+            write=WRITE_TIMEOUT,
+            pool=POOL_TIMEOUT
+        ),
+        "follow_redirects": True
+    }
+
+
+def use_client(client):
+    """
+    Makes `client` this process's Supabase client (e.g. a local stand-in
+    for tests and benchmarks).
+    """
+    global _client, _http, _pid, _injected
+
+    with _lock:
+        _client = instrument(client)
+        _http = None
+        _pid = os.getpid()
+        _injected = True
+
+
+def _reset_after_fork():
+    global _lock, _requests, _connections_opened, _seen_connections
+
+    # The parent's lock may have been held mid-fork; the client itself is
+    # rebuilt lazily because its pid no longer matches.
+    _lock = threading.Lock()
+    _requests = 0
+    _connections_opened = 0
+    _seen_connections = set()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _count_response(response):
+    global _requests, _connections_opened, _seen_connections
+
+    _requests += 1
+
+    # A connection we have not seen before means a new TCP/TLS handshake
+    current = {id(connection) for connection in _pool_connections()}
+    _connections_opened += len(current - _seen_connections)
+    _seen_connections = current
+
+
+def _pool_connections():
+    pool = getattr(getattr(_http, "_transport", None), "_pool", None)
+    return list(getattr(pool, "connections", None) or [])
+
+
+def pool_stats():
+    """
+    Connection pool utilisation for this process.
+
+    Returns:
+        {
+            "max_connections": int,
+            "max_keepalive": int,
+            "open": int,
+            "in_use": int,
+            "idle": int,
+            "requests": int,
+            "connections_opened": int
+        }
+    """
+    connections = _pool_connections() if _pid == os.getpid() else []
+    idle = sum(1 for connection in connections if connection.is_idle())
+
+    return {
+        "max_connections": POOL_SIZE,
+        "max_keepalive": KEEPALIVE_CONNECTIONS,
+        "open": len(connections),
+        "in_use": len(connections) - idle,
+        "idle": idle,
+        "requests": _requests,
+        "connections_opened": _connections_opened
+    }
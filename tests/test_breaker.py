@@ -0,0 +1,42 @@
+import time
+
+import pytest
+
+from breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+
+
+def fail():
+    raise RuntimeError("backend down")
+
+
+def test_open_half_open_closed():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "not called")
+
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+
+    assert breaker.call(lambda: "probe") == "probe"
+    assert breaker.state == CLOSED
+    assert breaker.stats()["trips"] == 1
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_failed_probe_opens_again():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+
+    with pytest.raises(RuntimeError):
+        breaker.call(fail)
+    time.sleep(0.06)
+
+    with pytest.raises(RuntimeError):
+        breaker.call(fail)
+    assert breaker.state == OPEN
+    assert breaker.stats()["trips"] == 2
@@ -0,0 +1,36 @@
+from inventory import inventory
+
+
+def test_second_cart_refused_at_stock_1(app, catalog):
+    product_id = catalog(3, stock=1)[0]["id"]
+    first, second = app.test_client(), app.test_client()
+
+    assert first.post("/add-to-cart", json={"id": product_id}).get_json()["message"] == "Item added to cart"
+
+    refused = second.post("/add-to-cart", json={"id": product_id}).get_json()
+    assert refused["success"] is False
+    assert refused["message"] == "Sold out"
+    assert refused["number_of_items"] == 0
+
+
+def test_failed_batch_restores_holds(app, catalog):
+    products = catalog(3, stock=2)
+    kept, sold_out = products[0]["id"], products[1]["id"]
+    shopper, other = app.test_client(), app.test_client()
+
+    shopper.post("/add-to-cart", json={"id": kept})
+    other.post("/add-to-cart", json={"id": sold_out})
+    other.post("/update-quantity", json={"product_id": sold_out, "quantity": 2})
+    assert inventory.available(sold_out) == 0
+    assert inventory.available(kept) == 1
+
+    result = shopper.post("/cart/batch", json={"operations": [
+        {"op": "update", "product_id": kept, "quantity": 2},
+        {"op": "add", "product_id": sold_out}
+    ]}).get_json()
+
+    assert result["success"] is False
+    assert result["failed_operation"] == 1
+    assert result["quantities"] == {kept: 1}
+    # The update's extra unit went back with the rest of the batch
+    assert inventory.available(kept) == 1
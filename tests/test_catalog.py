@@ -0,0 +1,47 @@
+from products import Products, catalog_cache
+
+
+def walk(fetch):
+    ids, cursor, pages = [], None, 0
+    while True:
+        page = fetch(cursor)
+        ids += [product["id"] for product in page["products"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids, pages
+
+
+def test_api_pages_cover_every_product_once(app, catalog):
+    products = catalog(50)
+    catalog_cache.get()
+    client = app.test_client()
+
+    ids, pages = walk(lambda cursor: client.get(
+        "/api/products", query_string={"limit": 7, **({"cursor": cursor} if cursor else {})}
+    ).get_json())
+
+    assert sorted(ids) == sorted(product["id"] for product in products)
+    assert len(ids) == len(set(ids))
+    assert pages == 8
+
+
+def test_keyset_pages_cover_every_product_once(stub, catalog):
+    products = catalog(50)
+
+    ids, _ = walk(lambda cursor: Products(client=stub)._fetch_page(cursor, 7))
+
+    assert ids == sorted(product["id"] for product in products)
+
+
+def test_home_page_conditional_get(app, catalog):
+    catalog(10)
+    client = app.test_client()
+
+    first = client.get("/")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    again = client.get("/", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.data == b""